@@ -0,0 +1,86 @@
+''' Verification gas of batched against individual groth16 checks
+
+Estimates gas of verifyBatch with one proven window repeated N times and of
+N verifyTx calls on contract deployed by `main.py deploy` on dev ethereum node
+(ganache) given by --eth. Proof comes from artifact store (`main.py proof`).
+Without node or proof the EIP-1108 priced model below is printed instead.
+Run from repository root, results are printed as json lines.
+
+usage: python3 ./Server/benchmarks/batch_verify_gas.py [--eth url] [--chain 0] [--start 1] [--max 64]
+'''
+
+import argparse
+import json
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+TRANSACTION_GAS = 21000
+PAIRING_BASE_GAS = 45000
+PAIRING_GAS = 34000
+SCALAR_MUL_GAS = 6000
+ADDITION_GAS = 150
+PUBLIC_INPUTS = 8
+
+
+def model_individual(count):
+    """ 4 pairings and one scalar mul with addition per public input for every proof """
+    verify = PAIRING_BASE_GAS + 4 * PAIRING_GAS + PUBLIC_INPUTS * (SCALAR_MUL_GAS + ADDITION_GAS)
+    return TRANSACTION_GAS + count * verify
+
+
+def model_batch(count):
+    """ One pairing per proof plus three, r*A and r*C per proof and folded vk_x, alpha """
+    scalarMuls = 2 * count + PUBLIC_INPUTS + 2
+    additions = count + PUBLIC_INPUTS
+    return (TRANSACTION_GAS + PAIRING_BASE_GAS + PAIRING_GAS * (count + 3) +
+            SCALAR_MUL_GAS * scalarMuls + ADDITION_GAS * additions)
+
+
+def get_contract(url):
+    from src.ethereum.client import get_web3
+    w3 = get_web3(url)
+    with open(os.getcwd() + '/Server/src/smartContracts/smartContractInfo', 'r') as file:
+        contract = json.load(file)
+    return w3.eth.contract(address=contract['contract_address'], abi=contract['abi']), contract.get('batch_size', 32)
+
+
+def load_proof(chainId, start, batchSize):
+    from src.smartContracts.artifact_store import get_artifact_store
+    return get_artifact_store().load_proofs(chainId, start, start + batchSize, batchSize)[0]
+
+
+def run(counts, eth=None, chainId=0, start=1):
+    measured = None
+    if eth:
+        instance, batchSize = get_contract(eth)
+        proof = load_proof(chainId, start, batchSize)
+        single = instance.functions.verifyTx(
+            [[proof['a'][0], proof['a'][1]], [proof['b'][0], proof['b'][1]], [proof['c'][0], proof['c'][1]]],
+            proof['inputs']).estimateGas()
+        measured = lambda count: instance.functions.verifyBatch([proof] * count).estimateGas()
+
+    results = []
+    for count in counts:
+        result = {'proofs': count, 'individual_gas': model_individual(count), 'batch_gas': model_batch(count)}
+        result['estimated'] = measured is None
+        if measured is not None:
+            # individual checks share one transaction like in submitBatches before batching
+            result['individual_gas'] = TRANSACTION_GAS + count * (single - TRANSACTION_GAS)
+            result['batch_gas'] = measured(count)
+        result['batch_gas_per_proof'] = round(result['batch_gas'] / count)
+        result['saving'] = round(1 - result['batch_gas'] / result['individual_gas'], 3)
+        results.append(result)
+        print(json.dumps(result))
+    return results
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Batched verification gas')
+    parser.add_argument('--eth', help='dev ethereum node url with deployed contract')
+    parser.add_argument('--chain', type=int, default=0, help='chain id of proven window')
+    parser.add_argument('--start', type=int, default=1, help='start height of proven window')
+    parser.add_argument('--max', type=int, default=64, help='largest number of proofs')
+    args = parser.parse_args()
+    run(range(1, args.max + 1), args.eth, args.chain, args.start)
@@ -0,0 +1,99 @@
+''' Cost per header of compiled circuit sizes
+
+Proves one window per compiled circuit and reports constraints, witness and
+proof time, peak prover memory and verification gas per header.
+Run from repository root after `main.py compile [batch size]`.
+
+usage: python3 ./Server/benchmarks/circuit_sizes.py [chainId] [start height] [batch sizes...]
+'''
+
+import json
+import os
+import resource
+import sys
+import time
+from multiprocessing import get_context
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.smartContracts.circuits import compiled_circuits, get_circuit_info
+from src.smartContracts.zokrates_handler import create_input, compute_witness, generate_proof, get_artifact_path
+from src.smartContracts.artifact_store import to_solidity_proof
+
+# groth16 verification with 8 public inputs priced by EIP-1108:
+# 4 pairings, 8 scalar multiplications and additions plus call overhead
+ESTIMATED_VERIFY_GAS = 45000 + 34000 * 4 + 8 * (6000 + 150) + 20000
+
+
+def prove_window(chainId, start, batchSize, queue):
+    """ Runs in child process so peak memory belongs to this size only """
+    end = start + batchSize
+    result = {'batch_size': batchSize}
+    if not create_input(chainId, start, end):
+        queue.put(dict(result, error='input'))
+        return
+    begin = time.perf_counter()
+    witnessOk = compute_witness(chainId, start, end)
+    result['witness_seconds'] = round(time.perf_counter() - begin, 3)
+    begin = time.perf_counter()
+    proofOk = witnessOk and generate_proof(chainId, start, end)
+    result['proof_seconds'] = round(time.perf_counter() - begin, 3)
+    # kilobytes on linux
+    result['peak_rss_mb'] = round(resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / 1024, 1)
+    if proofOk:
+        with open(get_artifact_path('proof', chainId, start, end), 'r') as file:
+            result['proof'] = to_solidity_proof(json.load(file))
+    else:
+        result['error'] = 'proof'
+    for kind in ['zokrates', 'witenss', 'proof']:
+        path = get_artifact_path(kind, chainId, start, end)
+        if os.path.exists(path):
+            os.remove(path)
+    queue.put(result)
+
+
+def measure_verify_gas(chainId, start, batchSize, proof):
+    """ Estimates submitBatches gas on deployed contract of same batch size, None if unavailable """
+    try:
+        from src.constants import PRIVATE_KEY, ETHPROVIDER
+        from src.ethereum.ethereum import init_eth_with_pk
+        with open(os.getcwd() + '/Server/src/smartContracts/smartContractInfo', 'r') as file:
+            contract = json.load(file)
+        if contract.get('batch_size', 32) != batchSize:
+            return None
+        web3 = init_eth_with_pk(PRIVATE_KEY, ETHPROVIDER)
+        instance = web3.eth.contract(address=contract['contract_address'], abi=contract['abi'])
+        return instance.functions.submitBatches(int(chainId), [proof], start, start + batchSize).estimateGas()
+    except Exception:
+        return None
+
+
+def run(chainId, start, sizes):
+    context = get_context('spawn')
+    results = []
+    for batchSize in sizes:
+        queue = context.Queue()
+        process = context.Process(target=prove_window, args=(chainId, start, batchSize, queue))
+        process.start()
+        result = queue.get()
+        process.join()
+
+        result['constraints'] = get_circuit_info(batchSize).get('constraints')
+        proof = result.pop('proof', None)
+        gas = measure_verify_gas(chainId, start, batchSize, proof) if proof else None
+        result['verify_gas_estimated'] = gas is None
+        gas = gas or ESTIMATED_VERIFY_GAS
+        result['verify_gas'] = gas
+        result['verify_gas_per_header'] = round(gas / batchSize)
+        if 'proof_seconds' in result:
+            result['prove_seconds_per_header'] = round((result['witness_seconds'] + result['proof_seconds']) / batchSize, 3)
+        results.append(result)
+        print(json.dumps(result))
+    return results
+
+
+if __name__ == '__main__':
+    chainId = sys.argv[1] if len(sys.argv) > 1 else '0'
+    start = int(sys.argv[2]) if len(sys.argv) > 2 else 1
+    sizes = [int(size) for size in sys.argv[3:]] or compiled_circuits()
+    run(chainId, start, sizes)
@@ -0,0 +1,76 @@
+''' Import time budget of command line interface
+
+Measures startup of `main.py --help` and import of backend of every command
+in fresh interpreters, and checks that commands not talking to ethereum do
+not import web3. Exits with status 1 when budget is exceeded, so it can run
+as check in CI. Run from repository root, results are printed as json lines.
+
+usage: python3 ./Server/benchmarks/cli_startup.py [--budget seconds] [--runs 5]
+'''
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+
+SERVER = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# wall time of `main.py --help` including interpreter startup
+BUDGET = 0.3
+# backend module imported by command -> modules it must not pull in
+BACKENDS = {
+    'proof': ('src.smartContracts.proof_pipeline', ['web3', 'flask']),
+    'coordinate': ('src.smartContracts.work_queue', ['web3', 'flask']),
+    'proofs': ('src.smartContracts.artifact_store', ['web3', 'flask', 'requests']),
+    'compile': ('src.smartContracts.zokrates_handler', ['web3', 'flask']),
+    'plan': ('src.smartContracts.submission', ['web3', 'flask', 'requests']),
+    'snapshot': ('src.smartContracts.snapshot', ['web3', 'flask', 'requests']),
+    'interact': ('src.smartContracts.contract_handler', ['flask']),
+}
+CHECK = '''
+import sys, time, json
+begin = time.perf_counter()
+import {module}
+print(json.dumps({{'seconds': time.perf_counter() - begin, 'modules': sorted(sys.modules)}}))
+'''
+
+
+def startup_seconds(runs):
+    """ Best wall time of `main.py --help` in fresh process """
+    times = []
+    for _ in range(runs):
+        begin = time.perf_counter()
+        subprocess.run([sys.executable, SERVER + '/main.py', '--help'], stdout=subprocess.DEVNULL, check=True)
+        times.append(time.perf_counter() - begin)
+    return min(times)
+
+
+def backend_import(module):
+    output = subprocess.run([sys.executable, '-c', CHECK.format(module=module)], cwd=SERVER,
+                            capture_output=True, text=True, check=True).stdout
+    return json.loads(output.splitlines()[-1])
+
+
+def run(budget, runs):
+    ok = True
+    seconds = startup_seconds(runs)
+    result = {'command': '--help', 'seconds': round(seconds, 3), 'budget': budget, 'ok': seconds <= budget}
+    ok = ok and result['ok']
+    print(json.dumps(result))
+    for command, (module, forbidden) in BACKENDS.items():
+        measured = backend_import(module)
+        imported = [name for name in forbidden if name in measured['modules']]
+        result = {'command': command, 'backend': module, 'seconds': round(measured['seconds'], 3),
+                  'forbidden_imports': imported, 'ok': imported == []}
+        ok = ok and result['ok']
+        print(json.dumps(result))
+    return ok
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Command line import time budget')
+    parser.add_argument('--budget', type=float, default=BUDGET, help='seconds allowed for main.py --help')
+    parser.add_argument('--runs', type=int, default=5, help='startup measurements, best one counts')
+    args = parser.parse_args()
+    sys.exit(0 if run(args.budget, args.runs) else 1)
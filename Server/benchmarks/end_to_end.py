@@ -0,0 +1,202 @@
+''' End to end relay timing against local stand-ins
+
+Serves headers from stub bitcoin provider and times every stage of relaying
+ranges of given sizes: header fetch, header parsing, input encoding, zokrates
+input generation, witness, proof and submitBatches gas and latency.
+
+Headers are synthetic regtest headers unless --fixture gives recorded ones
+(consecutive 80 byte headers from genesis, see --record). Witness and proof
+use circuits compiled in the repository and are skipped for batch sizes
+without one. Submission needs dev ethereum node (ganache) given by --eth with
+contract deployed by `main.py deploy`, the contract only accepts real headers.
+Run from repository root, results are printed as json lines.
+
+usage: python3 ./Server/benchmarks/end_to_end.py [--sizes 32,320] [--batch 32] [--fixture file]
+           [--eth url] [--profile directory] [--output file]
+       python3 ./Server/benchmarks/end_to_end.py --record file --count 2016
+'''
+
+import argparse
+import cProfile
+import json
+import os
+import re
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.stub_rpc import StubChain, StubRPCServer, synthetic_chain, REGTEST_BITS
+import src.bitcoin.jsonRPC as jsonRPC
+from src.bitcoin import header_store, header_validation
+from src.bitcoin.btc_header_manipulation import HEADER_SIZE, parseHeaders
+from src.bitcoin.batch_encoder import encode_zok_input
+from src.smartContracts.circuits import is_compiled
+from src.smartContracts.proof_pipeline import get_windows
+from src.smartContracts.zokrates_handler import create_input, compute_witness, generate_proof, export_proof
+from src.smartContracts.artifact_store import get_artifact_store
+
+REPOSITORY = os.getcwd()
+SIZES = [32, 320]
+# chain id used for the stub provider
+CHAIN_ID = 0
+
+
+def timed(result, stage, profileDirectory, function, *args):
+    """ Runs stage, records its wall time and optionally dumps its cProfile stats """
+    profiler = cProfile.Profile() if profileDirectory else None
+    begin = time.perf_counter()
+    if profiler:
+        profiler.enable()
+    try:
+        return function(*args)
+    finally:
+        if profiler:
+            profiler.disable()
+        result[stage + '_seconds'] = round(time.perf_counter() - begin, 4)
+        if profiler:
+            profiler.dump_stats(profileDirectory + '/' + stage + '-' + str(result['headers']) + '.prof')
+
+
+def prepare_workspace():
+    """ Temporary working directory with compiled circuits of repository linked in """
+    workspace = tempfile.mkdtemp(prefix='zk-relay-')
+    target = workspace + '/Server/src/smartContracts/zokrates'
+    os.makedirs(target)
+    source = REPOSITORY + '/Server/src/smartContracts/zokrates'
+    for name in os.listdir(source):
+        if re.fullmatch(r'circuit[0-9]+', name) or name.endswith('.zok'):
+            os.symlink(source + '/' + name, target + '/' + name)
+    return workspace
+
+
+def load_fixture(path):
+    with open(path, 'rb') as file:
+        data = file.read()
+    return [data[i:i + HEADER_SIZE] for i in range(0, len(data) - HEADER_SIZE + 1, HEADER_SIZE)]
+
+
+def record_fixture(path, count):
+    """ Stores first count headers of configured provider as fixture """
+    with open(path, 'wb') as file:
+        file.write(b''.join(jsonRPC.fetchBlockHeaders(CHAIN_ID, 0, count)))
+
+
+def get_submission_target(url):
+    """ Returns submitter and contract deployed on dev node """
+    from src.constants import PRIVATE_KEY
+    from src.ethereum.client import get_web3
+    from src.smartContracts.submission import Submitter
+    w3 = get_web3(url)
+    with open(REPOSITORY + '/Server/src/smartContracts/smartContractInfo', 'r') as file:
+        contract = json.load(file)
+    account = w3.eth.account.privateKeyToAccount(PRIVATE_KEY)
+    instance = w3.eth.contract(address=contract['contract_address'], abi=contract['abi'])
+    return Submitter(w3, account), instance, contract.get('batch_size')
+
+
+def submit(target, start, end, batchSize):
+    from src.smartContracts.submission import submit_proofs
+    submitter, contract, _ = target
+    proofs = get_artifact_store().load_calldata(CHAIN_ID, start, end, batchSize)
+    return submit_proofs(submitter, contract, CHAIN_ID, start, proofs, batchSize)
+
+
+def run_size(size, batchSize, server, target, profileDirectory):
+    result = {'headers': size, 'batch_size': batchSize}
+    start = 1
+    end = start + size
+    windows = get_windows(start, end, batchSize)
+
+    # every size starts with empty header store
+    header_store.reset_header_stores()
+    shutil.rmtree(header_store.get_store_directory(), ignore_errors=True)
+    requests = server.requests
+    timed(result, 'fetch', profileDirectory, jsonRPC.getRawHeaders, CHAIN_ID, start - 1, end)
+    result['http_requests'] = server.requests - requests
+
+    buffer = jsonRPC.getHeadersBuffer(CHAIN_ID, start - 1, end)
+    timed(result, 'parse', profileDirectory,
+          lambda: [(header.zokratesInput, header.hash) for header in parseHeaders(buffer, start - 1)])
+    timed(result, 'encode', profileDirectory, lambda: [
+        encode_zok_input(buffer[(windowStart - start) * HEADER_SIZE:(windowEnd - start + 1) * HEADER_SIZE])
+        for windowStart, windowEnd in windows])
+    result['input_ok'] = timed(result, 'input', profileDirectory,
+                               lambda: all([create_input(CHAIN_ID, *window) for window in windows]))
+
+    if not is_compiled(batchSize):
+        result['proof_skipped'] = 'no compiled circuit of batch size'
+        return result
+    result['witness_ok'] = timed(result, 'witness', profileDirectory,
+                                 lambda: all([compute_witness(CHAIN_ID, *window) for window in windows]))
+    result['proof_ok'] = timed(result, 'proof', profileDirectory,
+                               lambda: all([generate_proof(CHAIN_ID, *window) for window in windows]))
+    if not result['proof_ok']:
+        return result
+    for window in windows:
+        export_proof(CHAIN_ID, *window)
+
+    if target is None or target[2] != batchSize:
+        result['submit_skipped'] = 'no dev node with contract of batch size'
+        return result
+    submissions = timed(result, 'submit', profileDirectory, submit, target, start, end, batchSize)
+    result['submit_transactions'] = len(submissions)
+    result['submit_ok'] = all(submission['receipt']['status'] == 1 for submission in submissions)
+    result['submit_gas'] = sum(submission['receipt']['gasUsed'] for submission in submissions)
+    result['submit_gas_per_header'] = round(result['submit_gas'] / size)
+    return result
+
+
+def run(sizes, batchSize, fixture=None, eth=None, profileDirectory=None):
+    if fixture:
+        headers = load_fixture(fixture)
+    else:
+        headers = synthetic_chain(max(sizes) + 1)
+        # synthetic headers are mined at regtest difficulty
+        header_validation.set_pow_limit(CHAIN_ID, header_validation.bits_to_target(REGTEST_BITS))
+    if any(size % batchSize for size in sizes):
+        raise ValueError('Sizes have to be multiples of batch size ' + str(batchSize))
+    if len(headers) <= max(sizes):
+        raise ValueError('Fixture holds only ' + str(len(headers)) + ' headers')
+    if profileDirectory:
+        profileDirectory = os.path.abspath(profileDirectory)
+        os.makedirs(profileDirectory, exist_ok=True)
+
+    target = get_submission_target(eth) if eth else None
+    server = StubRPCServer(StubChain(headers)).start()
+    jsonRPC.BTCPROVIDER = server.url
+    workspace = prepare_workspace()
+    os.chdir(workspace)
+    results = []
+    try:
+        for size in sizes:
+            results.append(run_size(size, batchSize, server, target, profileDirectory))
+            print(json.dumps(results[-1]))
+    finally:
+        os.chdir(REPOSITORY)
+        server.stop()
+        shutil.rmtree(workspace, ignore_errors=True)
+    return results
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='End to end relay timing')
+    parser.add_argument('--sizes', default=','.join(str(size) for size in SIZES), help='comma separated range sizes')
+    parser.add_argument('--batch', type=int, default=32, help='headers in single proof')
+    parser.add_argument('--fixture', help='recorded headers instead of synthetic ones')
+    parser.add_argument('--eth', help='dev ethereum node url for submission stage')
+    parser.add_argument('--profile', help='directory for cProfile stats of every stage')
+    parser.add_argument('--output', help='file for json results')
+    parser.add_argument('--record', help='record fixture from configured provider into file')
+    parser.add_argument('--count', type=int, default=2016, help='headers recorded into fixture')
+    args = parser.parse_args()
+
+    if args.record:
+        record_fixture(args.record, args.count)
+        sys.exit(0)
+    results = run([int(size) for size in args.sizes.split(',')], args.batch, args.fixture, args.eth, args.profile)
+    if args.output:
+        with open(args.output, 'w') as file:
+            json.dump(results, file, indent=2)
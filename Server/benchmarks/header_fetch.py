@@ -0,0 +1,44 @@
+''' Header fetch throughput against local stub provider
+
+usage: python3 ./Server/benchmarks/header_fetch.py [range sizes...]
+'''
+
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.stub_rpc import StubChain, StubRPCServer, synthetic_chain
+import src.bitcoin.jsonRPC as jsonRPC
+
+SIZES = [1000, 10000, 100000]
+
+
+def run(sizes):
+    chain = StubChain(synthetic_chain(max(sizes)))
+    server = StubRPCServer(chain).start()
+    jsonRPC.BTCPROVIDER = server.url
+    results = []
+    try:
+        for size in sizes:
+            requests = server.requests
+            begin = time.perf_counter()
+            headers = jsonRPC.fetchBlockHeaders(0, 0, size)
+            elapsed = time.perf_counter() - begin
+            assert headers == chain.headers[:size]
+            results.append({
+                'headers': size,
+                'seconds': round(elapsed, 4),
+                'headers_per_sec': round(size / elapsed),
+                'http_requests': server.requests - requests,
+            })
+            print(json.dumps(results[-1]))
+    finally:
+        server.stop()
+    return results
+
+
+if __name__ == '__main__':
+    run([int(size) for size in sys.argv[1:]] or SIZES)
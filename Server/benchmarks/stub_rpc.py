@@ -0,0 +1,141 @@
+''' Local stand-in for bitcoin json rpc provider '''
+
+import json
+import random
+import struct
+import threading
+from hashlib import sha256
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# regtest difficulty, roughly every second nonce is valid
+REGTEST_BITS = 0x207fffff
+GENESIS_TIME = 1231006505
+
+
+def double_sha(raw):
+    return sha256(sha256(raw).digest()).digest()
+
+
+def bits_to_target(bits):
+    return (bits & 0xffffff) * 2**(8*((bits >> 24) - 3))
+
+
+def synthetic_chain(count, bits=REGTEST_BITS, prefix=None, branch=0):
+    """ Returns list of linked raw headers with valid proof of work
+
+    Headers of prefix are kept, remaining ones up to count are mined on top of
+    it, different branch numbers give competing branches.
+    """
+    target = bits_to_target(bits)
+    headers = list(prefix or [])
+    prevHash = double_sha(headers[-1]) if headers else bytes(32)
+    for height in range(len(headers), count):
+        merkleRoot = sha256(struct.pack('<II', height, branch)).digest()
+        prefix = struct.pack('<I32s32sII', 1, prevHash, merkleRoot, GENESIS_TIME + height * 600, bits)
+        nonce = 0
+        while True:
+            raw = prefix + struct.pack('<I', nonce)
+            hash = double_sha(raw)
+            if int.from_bytes(hash, 'little') <= target:
+                break
+            nonce += 1
+        headers.append(raw)
+        prevHash = hash
+    return headers
+
+
+class StubChain:
+    """ Synthetic chain served by stub provider """
+
+    def __init__(self, headers):
+        self.headers = headers
+        self.hashes = [double_sha(raw)[::-1].hex() for raw in headers]
+        self.heights = {hash: height for height, hash in enumerate(self.hashes)}
+        # cumulative expected hashes up to every header
+        self.chainwork = []
+        for raw in headers:
+            work = 2**256 // (bits_to_target(struct.unpack_from('<I', raw, 72)[0]) + 1)
+            self.chainwork.append((self.chainwork[-1] if self.chainwork else 0) + work)
+
+    def header_json(self, height):
+        version, prevHash, merkleRoot, time, bits, nonce = struct.unpack('<I32s32sIII', self.headers[height])
+        result = {
+            'hash': self.hashes[height],
+            'height': height,
+            'version': version,
+            'versionHex': format(version, '08x'),
+            'merkleroot': merkleRoot[::-1].hex(),
+            'time': time,
+            'bits': format(bits, '08x'),
+            'nonce': nonce,
+            'chainwork': format(self.chainwork[height], '064x'),
+        }
+        if height > 0:
+            result['previousblockhash'] = self.hashes[height - 1]
+        return result
+
+    def call(self, method, params):
+        if method == 'getblockcount':
+            return len(self.headers) - 1
+        if method == 'getbestblockhash':
+            return self.hashes[-1]
+        if method == 'getblockhash':
+            height = int(params[0])
+            if height < 0 or height >= len(self.headers):
+                raise KeyError('Block height out of range')
+            return self.hashes[height]
+        if method == 'getblockheader':
+            height = self.heights[params[0]]
+            verbose = params[1] if len(params) > 1 else True
+            if verbose:
+                return self.header_json(height)
+            return self.headers[height].hex()
+        raise KeyError('Method not found')
+
+
+class StubRPCServer:
+    """ Threaded http json rpc server answering from StubChain """
+
+    def __init__(self, chain, shuffle=True, port=0):
+        self.chain = chain
+        self.shuffle = shuffle
+        self.requests = 0
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def log_message(self, *args):
+                pass
+
+            def do_POST(self):
+                body = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+                server.requests += 1
+                batch = body if isinstance(body, list) else [body]
+                replies = [server.reply(item) for item in batch]
+                # real providers do not guarantee batch order
+                if server.shuffle:
+                    random.shuffle(replies)
+                data = json.dumps(replies if isinstance(body, list) else replies[0]).encode()
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+        self.httpd = ThreadingHTTPServer(('127.0.0.1', port), Handler)
+        self.url = 'http://127.0.0.1:' + str(self.httpd.server_address[1])
+
+    def reply(self, item):
+        try:
+            return {'id': item['id'], 'result': self.chain.call(item['method'], item.get('params', [])), 'error': None}
+        except (KeyError, ValueError, IndexError) as err:
+            return {'id': item['id'], 'result': None, 'error': {'code': -5, 'message': str(err)}}
+
+    def start(self):
+        threading.Thread(target=self.httpd.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
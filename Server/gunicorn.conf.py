@@ -0,0 +1,31 @@
+""" Gunicorn production settings """
+
+import multiprocessing, os, shutil, tempfile
+
+bind = '0.0.0.0:5000'
+workers = int(os.environ.get('GUNICORN_WORKERS', multiprocessing.cpu_count() * 2 + 1))
+# threads let slow rpc calls overlap inside worker
+worker_class = 'gthread'
+threads = int(os.environ.get('GUNICORN_THREADS', 4))
+timeout = 60
+keepalive = 5
+# reload only in development
+reload = os.environ.get('GUNICORN_RELOAD') == '1'
+
+
+def on_starting(server):
+    """ Directory shared by workers, holds block number published by block watcher and metric dumps """
+    os.environ['ZK_RUN_DIR'] = tempfile.mkdtemp(prefix='zk-wallet-')
+
+
+def post_fork(server, worker):
+    # every worker waits to become block watcher, only one polls the node
+    from src.app import start_block_watcher
+    from src.utils.metrics import start_metrics_dump
+    start_block_watcher()
+    # /metrics answered by any worker sums metrics of all of them
+    start_metrics_dump(os.environ['ZK_RUN_DIR'])
+
+
+def on_exit(server):
+    shutil.rmtree(os.environ['ZK_RUN_DIR'], ignore_errors=True)
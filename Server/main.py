@@ -1,77 +1,384 @@
-from src.smartContracts.contract_handler import build_and_deploy, send_batches_to_contract, get_closest_hash
-from src.smartContracts.zokrates_handler import create_proof_for_chain, compile_validator
-from src.smartContracts.contract_debugger import run_debugger
-from src.ethereum.ethereum import init_eth_with_pk
-from src.bitcoin.bitcoin import get_zk_input
-from src.constants import *
-from src.utils import *
+""" Command line interface, every command imports only backends it uses """
 
-import sys
-import os
-import logging
+import argparse
 import json
+import logging
+import os
+import sys
 
-logging.basicConfig(level=logging.INFO)
+from src.smartContracts.circuits import DEFAULT_BATCH_SIZE
+
+_contract = None
+# stands for skipped optional argument followed by others
+PLACEHOLDER = '-'
 
-if(sys.argv[1] == 'compile'):
-    if(compile_validator()):
-        logging.info('Compilation succes')
 
-if(sys.argv[1] == 'btcproof'):
-    create_proof_for_chain(0, 1, 33)
+def get_contract_info_path():
+    return os.getcwd() + '/Server/src/smartContracts/smartContractInfo'
 
-# generates proofs between start and end
-if(sys.argv[1] == 'proof'):
-    chainId = sys.argv[2]
-    start = sys.argv[3]
-    end = sys.argv[4]
 
-    i = int(start)
-    while i < int(end):
-        logging.info('Proofs for headers:' + 'from: ' + str(i) + ' to: ' +  str(i+32))
-        create_proof_for_chain(chainId, i, i+32)
-        i += 32
+def load_contract():
+    """ Returns deployed contract info, read once per process """
+    global _contract
+    if _contract is None:
+        with open(get_contract_info_path(), 'r') as file:
+            _contract = json.load(file)
+    return _contract
 
-if(sys.argv[1] == 'deploy'):
+
+def connect():
+    """ Returns shared web3 instance and account or None if node is unreachable """
+    from src.constants import PRIVATE_KEY, ETHPROVIDER
+    from src.ethereum.ethereum import init_eth_with_pk
     web3 = init_eth_with_pk(PRIVATE_KEY, ETHPROVIDER)
+    if isinstance(web3, dict) or not web3.isConnected():
+        logging.info('Could not connect to web3')
+        return None, None
+    return web3, web3.eth.account.privateKeyToAccount(PRIVATE_KEY)
+
+
+def get_contract_instance(web3):
+    contract = load_contract()
+    return web3.eth.contract(address=contract['contract_address'], abi=contract['abi'])
+
+
+def compile_command(args):
+    from src.smartContracts.zokrates_handler import compile_validator
+    if compile_validator(args.batchSize):
+        logging.info('Compilation succes')
+        return True
+    return False
+
+
+def btcproof_command(args):
+    from src.smartContracts.zokrates_handler import create_proof_for_chain
+    return create_proof_for_chain(0, 1, 33)
+
+
+def proof_command(args):
+    """ Generates proofs between start and end """
+    from src.smartContracts.proof_pipeline import run_proof_pipeline
+    # optional number of parallel provers
+    workers = int(args.workers) if args.workers not in (None, '-') else None
+    result = run_proof_pipeline(args.chainId, args.start, args.end, workers, args.batchSize)
+    logging.info('Proved: ' + str(len(result['proved'])) + ' skipped: ' + str(len(result['skipped'])) +
+                 ' failed: ' + str(len(result['failed'])))
+    return result['failed'] == []
+
+
+def coordinate_command(args):
+    """ Hands out windows between start and end to workers on other machines """
+    from src.smartContracts.work_queue import Coordinator, COORDINATOR_PORT
+    coordinator = Coordinator()
+    logging.info('Queued ' + str(coordinator.enqueue_range(args.chainId, args.start, args.end, args.batchSize)) +
+                 ' windows')
+    result = coordinator.run(args.port or COORDINATOR_PORT)
+    logging.info('Proved: ' + str(result['done']) + ' failed: ' + str(len(result['failed'])))
+    return result['failed'] == []
+
+
+def work_command(args):
+    """ Proves windows leased by coordinator at url """
+    from src.smartContracts.work_queue import ProofWorker
+    ProofWorker(args.url, args.workers).run()
+    return True
+
+
+def proofs_command(args):
+    """ Lists stored proofs """
+    from src.smartContracts.artifact_store import get_artifact_store
+    for entry in get_artifact_store().entries(args.chainId):
+        print(entry['chainId'], entry['start'], entry['end'], entry['circuit'][:12], entry['object'][:12])
+    return True
+
+
+def gc_command(args):
+    """ Removes proofs of old circuits and unreferenced files """
+    from src.smartContracts.artifact_store import get_artifact_store, circuit_hash
+    from src.smartContracts.circuits import get_circuit_directory, compiled_circuits
+    circuits = [circuit_hash(get_circuit_directory(size)) for size in compiled_circuits()]
+    get_artifact_store().gc(circuits or None)
+    return True
+
+
+def deploy_command(args):
+    from src.smartContracts.contract_handler import build_and_deploy
     logging.info('Deploying contract')
-    acc = web3.eth.account.privateKeyToAccount(PRIVATE_KEY)
-    if(web3.isConnected()):
-        logging.info('Connected')
-        result = build_and_deploy(acc, web3)
-        if(result):
-            with open(os.getcwd()+'/Server/src/smartContracts/smartContractInfo', 'w') as file:
-                file.write(json.dumps(result))
-                logging.info('Contract at:'+result['contract_address'])
-    else:
-        logging.info("Could not connect to web3")
+    web3, acc = connect()
+    if web3 is None:
+        return False
+    logging.info('Connected')
+    result = build_and_deploy(acc, web3, args.batchSize)
+    if not result:
+        return False
+    global _contract
+    _contract = result
+    with open(get_contract_info_path(), 'w') as file:
+        file.write(json.dumps(result))
+    logging.info('Contract at:' + result['contract_address'])
+    return True
 
-if(sys.argv[1] == 'interact'):
-    chainId = sys.argv[2]
-    start = sys.argv[3]
-    end = sys.argv[4]
-    web3 = init_eth_with_pk(PRIVATE_KEY, ETHPROVIDER)
-    acc = web3.eth.account.privateKeyToAccount(PRIVATE_KEY)
-    if(web3.isConnected()):
-        with open(os.getcwd()+'/Server/src/smartContracts/smartContractInfo', 'r') as file:
-            contract = json.load(file)
-            # sends batches to bitcoin blockchain in contract
-            result = send_batches_to_contract(
-                chainId, start, end, acc, web3, contract['contract_address'], contract['abi'])
+
+def interact_command(args):
+    """ Sends batches to bitcoin blockchain in contract """
+    from src.smartContracts.contract_handler import send_batches_to_contract
+    from src.smartContracts.submission import GAS_CAP
+    web3, acc = connect()
+    if web3 is None:
+        return False
+    contract = load_contract()
+    return bool(send_batches_to_contract(
+        args.chainId, args.start, args.end, acc, web3, contract['contract_address'], contract['abi'],
+        contract.get('batch_size', DEFAULT_BATCH_SIZE), args.gasCap or GAS_CAP))
+
+
+def calibrate_command(args):
+    """ Measures gas of submitBatches once, e.g. on dev chain running the same contract """
+    from src.smartContracts.contract_handler import calibrate_contract
+    web3, acc = connect()
+    if web3 is None:
+        return False
+    contract = load_contract()
+    result = calibrate_contract(acc, web3, contract['contract_address'], args.chainId, args.start,
+                                contract.get('batch_size', DEFAULT_BATCH_SIZE))
+    if not result:
+        return False
+    if contract.get('code_hash') != result['code_hash']:
+        contract['code_hash'] = result['code_hash']
+        with open(get_contract_info_path(), 'w') as file:
+            file.write(json.dumps(contract))
+    return True
+
+
+def plan_command(args):
+    """ Prices submission of stored proofs from gas model without node """
+    from src.smartContracts.artifact_store import get_artifact_store
+    from src.smartContracts.submission import load_gas_model, plan_submissions, GAS_CAP
+    contract = load_contract()
+    batchSize = contract.get('batch_size', DEFAULT_BATCH_SIZE)
+    model = load_gas_model(contract.get('code_hash', ''), batchSize)
+    if model is None:
+        logging.error('No gas model of deployed contract, run calibrate first')
+        return False
+    try:
+        proofs = get_artifact_store().load_calldata(args.chainId, args.start, args.end, batchSize)
+        chunks = plan_submissions(args.chainId, args.start, proofs, batchSize, model, args.gasCap or GAS_CAP)
+    except ValueError as err:
+        logging.error(err)
+        return False
+    for chunk in chunks:
+        cost = '' if args.gasPrice is None else ' ' + str(chunk['gas'] * args.gasPrice / 10 ** 9) + ' eth'
+        print(chunk['start'], chunk['end'], chunk['proofs'], chunk['gas'], str(len(chunk['data'])) + 'B' + cost)
+    gas = sum(chunk['gas'] for chunk in chunks)
+    logging.info('Transactions: ' + str(len(chunks)) + ' gas limit: ' + str(gas) +
+                 ('' if args.gasPrice is None else ' cost: ' + str(gas * args.gasPrice / 10 ** 9) + ' eth'))
+    return True
+
+
+def follow_command(args):
+    """ Proves and relays new blocks as they are mined, several chainId start pairs are followed at once """
+    from src.smartContracts.follower import ChainFollower, follow_chains
+    from src.smartContracts.submission import Submitter
+    if len(args.chains) % 2:
+        raise ValueError('Chains have to be given as chainId start pairs')
+    chains = [(args.chains[i], int(args.chains[i + 1])) for i in range(0, len(args.chains), 2)]
+    web3, acc = connect()
+    if web3 is None:
+        return False
+    instance = get_contract_instance(web3)
+    batchSize = load_contract().get('batch_size', DEFAULT_BATCH_SIZE)
+    if len(chains) == 1:
+        ChainFollower(chains[0][0], chains[0][1], Submitter(web3, acc), instance, batchSize).run()
     else:
-        logging.info("Could not connect to web3")
+        follow_chains(chains, Submitter(web3, acc), instance, batchSize)
+    return True
 
-if(sys.argv[1] == 'call'):
-    chainId = int(sys.argv[2])
-    web3 = init_eth_with_pk(PRIVATE_KEY, ETHPROVIDER)
-    acc = web3.eth.account.privateKeyToAccount(PRIVATE_KEY)
-    if(web3.isConnected()):
-        with open(os.getcwd()+'/Server/src/smartContracts/smartContractInfo', 'r') as file:
-            contract = json.load(file)
-            result = get_closest_hash(
-                acc, web3, contract['contract_address'], contract['abi'], 90, chainId)
+
+def call_command(args):
+    from src.smartContracts.contract_handler import get_closest_hash
+    web3, acc = connect()
+    if web3 is None:
+        return False
+    contract = load_contract()
+    get_closest_hash(acc, web3, contract['contract_address'], contract['abi'], args.height, args.chainId)
+    return True
+
+
+def debug_command(args):
+    from src.smartContracts.contract_debugger import run_debugger
+    run_debugger()
+    return True
+
+
+def events_command(args):
+    """ Relay history from indexed contract events """
+    from src.smartContracts.contract_debugger import get_event_indexer
+    indexer = get_event_indexer()
+    indexer.catch_up()
+    for row in indexer.submissions(args.chainId):
+        print(row['chain_id'], row['start_height'], row['end_height'], row['hash'], row['tx'], row['block'])
+    return True
+
+
+def checkpoint_command(args):
+    """ Starts chain at trusted checkpoint locally and optionally in contract """
+    from src.bitcoin.jsonRPC import bootstrapCheckpoint
+    checkpoint = bootstrapCheckpoint(int(args.chainId), args.height, args.hash, args.work)
+    if not args.contract:
+        return True
+    from src.smartContracts.contract_handler import setup_checkpoint
+    web3, acc = connect()
+    if web3 is None:
+        return False
+    contract = load_contract()
+    receipt = setup_checkpoint(acc, web3, contract['contract_address'], contract['abi'], args.chainId, checkpoint,
+                               contract.get('batch_size', DEFAULT_BATCH_SIZE))
+    return bool(receipt) and receipt['status'] == 1
+
+
+def snapshot_command(args):
+    """ Exports or imports relay state """
+    from src.smartContracts.snapshot import export_snapshot, import_snapshot
+    if args.action == 'export':
+        manifest = export_snapshot(args.path, [int(chainId) for chainId in args.chains] or None)
     else:
-        logging.info("could not connect to web3")
+        manifest = import_snapshot(args.path)
+    logging.info('Snapshot of ' + str(len(manifest['files'])) + ' files from ' + str(int(manifest['created'])))
+    return True
+
+
+def jobs_command(args):
+    """ Runs commands of job file in this process, connections and caches are shared between jobs """
+    with open(args.file, 'r') as file:
+        jobs = json.load(file)
+    failed = 0
+    for index, job in enumerate(jobs):
+        try:
+            argv = job_arguments(job)
+            logging.info('Job ' + str(index + 1) + '/' + str(len(jobs)) + ': ' + ' '.join(argv))
+            ok = run(argv)
+        except SystemExit:
+            # argparse exits after printing usage of invalid job
+            logging.error('Job ' + str(index + 1) + ' has invalid arguments')
+            ok = False
+        except Exception as err:
+            logging.error("Error '{0}' occurred.".format(err))
+            ok = False
+        if not ok:
+            failed += 1
+            if args.stop:
+                break
+    logging.info('Jobs done: ' + str(len(jobs)) + ' failed: ' + str(failed))
+    return failed == 0
+
+
+def optional(type):
+    """ Returns argparse type reading placeholder as missing value """
+    return lambda value: None if value == PLACEHOLDER else type(value)
+
+
+# command -> (handler, help, positional arguments as (name, argparse options))
+COMMANDS = {
+    'compile': (compile_command, 'compile circuit for batches of headers', [
+        ('batchSize', {'type': int, 'nargs': '?', 'default': DEFAULT_BATCH_SIZE})]),
+    'btcproof': (btcproof_command, 'prove first btc window', []),
+    'proof': (proof_command, 'prove windows of range in parallel', [
+        ('chainId', {}), ('start', {'type': int}), ('end', {'type': int}),
+        ('workers', {'nargs': '?', 'help': 'parallel provers, - for default'}),
+        ('batchSize', {'type': int, 'nargs': '?', 'default': DEFAULT_BATCH_SIZE})]),
+    'coordinate': (coordinate_command, 'lease windows of range to workers', [
+        ('chainId', {}), ('start', {'type': int}), ('end', {'type': int}),
+        ('port', {'type': optional(int), 'nargs': '?', 'help': '- for default'}),
+        ('batchSize', {'type': int, 'nargs': '?', 'default': DEFAULT_BATCH_SIZE})]),
+    'work': (work_command, 'prove windows leased by coordinator', [
+        ('url', {}), ('workers', {'type': int, 'nargs': '?'})]),
+    'proofs': (proofs_command, 'list stored proofs', [('chainId', {'nargs': '?'})]),
+    'gc': (gc_command, 'drop proofs of old circuits', []),
+    'deploy': (deploy_command, 'deploy contract', [
+        ('batchSize', {'type': int, 'nargs': '?', 'default': DEFAULT_BATCH_SIZE})]),
+    'interact': (interact_command, 'submit proofs of range to contract', [
+        ('chainId', {}), ('start', {}), ('end', {}),
+        ('gasCap', {'type': int, 'nargs': '?'})]),
+    'calibrate': (calibrate_command, 'measure gas model of contract code with stored proofs', [
+        ('chainId', {'type': int}), ('start', {'type': int})]),
+    'plan': (plan_command, 'plan and price submission of range offline', [
+        ('chainId', {'type': int}), ('start', {'type': int}), ('end', {'type': int}),
+        ('gasPrice', {'type': optional(float), 'nargs': '?', 'help': 'gwei, - for none'}),
+        ('gasCap', {'type': int, 'nargs': '?'})]),
+    'follow': (follow_command, 'prove and relay new blocks', [('chains', {'nargs': '+', 'metavar': 'chainId start'})]),
+    'call': (call_command, 'call contract getClosestHash', [
+        ('chainId', {'type': int}), ('height', {'type': int, 'nargs': '?', 'default': 90})]),
+    'debug': (debug_command, 'print contract events as they arrive', []),
+    'events': (events_command, 'list batch submissions of chain', [('chainId', {'nargs': '?', 'default': 0})]),
+    'checkpoint': (checkpoint_command, 'start chain at trusted header', [
+        ('chainId', {}), ('height', {'type': int}), ('hash', {}),
+        ('work', {'type': int, 'nargs': '?', 'help': 'cumulative work, taken from provider when missing'})]),
+    'snapshot': (snapshot_command, 'export or import headers, proofs and cursors', [
+        ('action', {'choices': ['export', 'import']}), ('path', {}),
+        ('chains', {'nargs': '*', 'metavar': 'chainId', 'help': 'exported chains, all stored by default'})]),
+    'jobs': (jobs_command, 'run commands of json job file in one process', [('file', {})]),
+}
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog='main.py', description='zk relay of bitcoin headers')
+    commands = parser.add_subparsers(dest='command', required=True)
+    for name, (handler, help, arguments) in COMMANDS.items():
+        command = commands.add_parser(name, help=help)
+        for argument, options in arguments:
+            command.add_argument(argument, **options)
+        if name == 'jobs':
+            command.add_argument('--stop', action='store_true', help='stop at first failed job')
+        if name == 'checkpoint':
+            command.add_argument('--contract', action='store_true', help='also start chain in deployed contract')
+        command.set_defaults(handler=handler)
+    return parser
+
+
+def job_arguments(job):
+    """ Returns command line of job given as argument list or {"command": ..., argument: value, flag: true} """
+    if isinstance(job, list):
+        return [str(value) for value in job]
+    if job.get('command') not in COMMANDS:
+        raise ValueError('Unknown command ' + str(job.get('command')))
+    arguments = COMMANDS[job['command']][2]
+    argv = [job['command']]
+    skipped = []
+    for argument, options in arguments:
+        if argument not in job:
+            if options.get('nargs') not in ('?', '*'):
+                raise ValueError('Job ' + job['command'] + ' misses ' + argument)
+            # filled only when later argument is given
+            if options.get('nargs') == '?':
+                skipped.append(str(options.get('default', PLACEHOLDER)))
+            continue
+        values = job[argument] if isinstance(job[argument], list) else [job[argument]]
+        argv.extend(skipped + [str(value) for value in values])
+        skipped = []
+    names = [argument for argument, _ in arguments]
+    for key, value in job.items():
+        if key == 'command' or key in names:
+            continue
+        if not isinstance(value, bool):
+            raise ValueError('Unknown argument ' + key + ' of job ' + job['command'])
+        if value:
+            argv.append('--' + key)
+    return argv
+
+
+def run(argv):
+    args = build_parser().parse_args(argv)
+    return args.handler(args)
+
+
+def main(argv):
+    logging.basicConfig(level=logging.INFO)
+    # long running commands expose prometheus metrics when port is set
+    if os.environ.get('METRICS_PORT'):
+        from src.utils.metrics import start_metrics_server
+        start_metrics_server(os.environ['METRICS_PORT'])
+    return 0 if run(argv) else 1
+
 
-if(sys.argv[1] == 'debug'):
-    run_debugger()
\ No newline at end of file
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
@@ -1,18 +1,117 @@
-from flask import Flask
+import os, threading, time, logging, mmap, fcntl
+from flask import Flask, request
 
-from src.ethereum import init_eth_with_pk, get_contract_info
+from src.ethereum import init_eth_with_pk, get_contract_info, get_client
+from src.utils import TTLCache, render_metrics
+from src.bitcoin.merkle import get_merkle_proofs
 from src.constants import *
 
+# web3 health is checked at most once per interval
+HEALTH_TTL = 10
+# contract reads are dropped on new block or after ttl
+READ_TTL = 60
+READ_CACHE_SIZE = 4096
+BLOCK_POLL_INTERVAL = 5
+# height above any relayed header, closest hash to it is chain tip
+TIP_HEIGHT = 2**32
+# heights accepted by single bulk lookup
+MAX_HEIGHTS = 1000
+MAX_TXIDS = 1000
+# directory shared by gunicorn workers, created by server hook in gunicorn.conf.py
+RUN_DIRECTORY_ENV = 'ZK_RUN_DIR'
+
 # Initialize flask app
 app = Flask(__name__)
-app.debug = True
+app.debug = os.environ.get('FLASK_DEBUG') == '1'
 
 web3 = init_eth_with_pk(PRIVATE_KEY, ETHPROVIDER)
+healthCache = TTLCache(maxsize=1, ttl=HEALTH_TTL)
+readCache = TTLCache(maxsize=READ_CACHE_SIZE, ttl=READ_TTL)
+_contract = {}
+
+def is_connected():
+    return healthCache.get_or_set('connected', web3.isConnected)
+
+def get_contract():
+    """ Contract instance, rebuilt only when contract info changes """
+    info = get_contract_info()
+    if _contract.get('address') != info['contract_address']:
+        _contract['instance'] = web3.eth.contract(address=info['contract_address'], abi=info['abi'])
+        _contract['address'] = info['contract_address']
+    return _contract['instance']
+
+class BlockState:
+    """ Latest ethereum block number, shared by workers through mapped file when directory is set """
+    def __init__(self, directory=None):
+        self.lockPath = None
+        if directory is None:
+            self._map = bytearray(8)
+            return
+        self.lockPath = directory + '/watcher.lock'
+        descriptor = os.open(directory + '/block', os.O_RDWR | os.O_CREAT)
+        try:
+            if os.fstat(descriptor).st_size < 8:
+                os.ftruncate(descriptor, 8)
+            self._map = mmap.mmap(descriptor, 8)
+        finally:
+            os.close(descriptor)
+
+    def get(self):
+        return int.from_bytes(self._map[:8], 'little')
+
+    def set(self, block):
+        self._map[:8] = int(block).to_bytes(8, 'little')
+
+blockState = BlockState(os.environ.get(RUN_DIRECTORY_ENV))
+# block whose reads are in this worker's cache
+_cachedBlock = [0]
+
+def watch_blocks():
+    """ Publishes new blocks, only one worker of server polls the node at a time """
+    if blockState.lockPath is not None:
+        lock = open(blockState.lockPath, 'w')
+        # held until worker exits, then next waiting worker takes over
+        fcntl.flock(lock, fcntl.LOCK_EX)
+    while True:
+        try:
+            block = web3.eth.blockNumber
+            if block != blockState.get():
+                blockState.set(block)
+        except Exception as err:
+            logging.error("Error '{0}' occurred.".format(err))
+        time.sleep(BLOCK_POLL_INTERVAL)
+
+def start_block_watcher():
+    """ Started once per process by gunicorn post_fork hook or dev server """
+    threading.Thread(target=watch_blocks, daemon=True).start()
+
+def refresh_reads():
+    """ Drops cached contract reads once new block is published """
+    block = blockState.get()
+    if block != _cachedBlock[0]:
+        readCache.clear()
+        _cachedBlock[0] = block
+
+def closest_hashes(chainId, heights):
+    """ Cached getClosestHash views, uncached ones are read in single batch """
+    refresh_reads()
+    results = {height: readCache.get(('closest', chainId, height)) for height in heights}
+    missing = [height for height, result in results.items() if result is None]
+    if missing:
+        functions = [get_contract().functions.getClosestHash(chainId, height) for height in missing]
+        for height, result in zip(missing, get_client(ETHPROVIDER).call_many(functions)):
+            results[height] = {'chainId': chainId, 'hash': '0x' + format(result[0], '064x'), 'height': result[1]}
+            readCache.set(('closest', chainId, height), results[height])
+    return [results[height] for height in heights]
+
+def closest_hash(chainId, height):
+    """ Cached getClosestHash view """
+    return closest_hashes(chainId, [height])[0]
 
 @app.route('/')
 @app.route('/api/')
 def home():
-    if(web3.isConnected()):
+    if(is_connected()):
         return 'Hello there!'
     return 'Connection error'        
 
@@ -21,6 +120,62 @@ def getContractInfo():
     """ Deployed contract information """
     return get_contract_info(), 200
 
+@app.route('/api/chain/<int:chainId>/hash/<int:height>')
+def getClosestHash(chainId, height):
+    """ Closest relayed hash at or below height """
+    try:
+        return closest_hash(chainId, height), 200
+    except Exception as err:
+        logging.error("Error '{0}' occurred.".format(err))
+        return {'error': 'Error while calling contract'}, 500
+
+@app.route('/api/chain/<int:chainId>/hashes')
+def getClosestHashes(chainId):
+    """ Closest relayed hashes of comma separated heights """
+    try:
+        heights = [int(height) for height in request.args.get('heights', '').split(',') if height != '']
+    except ValueError:
+        return {'error': 'Heights have to be numbers'}, 400
+    if len(heights) > MAX_HEIGHTS:
+        return {'error': 'At most ' + str(MAX_HEIGHTS) + ' heights'}, 400
+    try:
+        return {'hashes': closest_hashes(chainId, heights)}, 200
+    except Exception as err:
+        logging.error("Error '{0}' occurred.".format(err))
+        return {'error': 'Error while calling contract'}, 500
+
+@app.route('/api/chain/<int:chainId>/tip')
+def getChainTip(chainId):
+    """ Highest relayed hash of chain """
+    try:
+        return closest_hash(chainId, TIP_HEIGHT), 200
+    except Exception as err:
+        logging.error("Error '{0}' occurred.".format(err))
+        return {'error': 'Error while calling contract'}, 500
+
+@app.route('/metrics')
+def getMetrics():
+    """ Prometheus metrics of this process, or of all workers under gunicorn """
+    return render_metrics(), 200, {'Content-Type': 'text/plain; version=0.0.4'}
+
+def is_hash(value):
+    return len(value) == 64 and all(char in '0123456789abcdef' for char in value)
+
+@app.route('/api/chain/<int:chainId>/block/<blockHash>/proof')
+def getMerkleProofs(chainId, blockHash):
+    """ Merkle inclusion proofs of comma separated txids in block """
+    txids = [txid.lower() for txid in request.args.get('txids', '').split(',') if txid != '']
+    if not is_hash(blockHash.lower()) or not all(is_hash(txid) for txid in txids):
+        return {'error': 'Hashes have to be 64 hex characters'}, 400
+    if len(txids) > MAX_TXIDS:
+        return {'error': 'At most ' + str(MAX_TXIDS) + ' txids'}, 400
+    try:
+        return get_merkle_proofs(chainId, blockHash.lower(), txids), 200
+    except Exception as err:
+        logging.error("Error '{0}' occurred.".format(err))
+        return {'error': 'Error while fetching block'}, 500
+
 # Run the server
 if __name__ == '__main__':
-    app.run(host='0.0.0.0')
\ No newline at end of file
+    start_block_watcher()
+    app.run(host='0.0.0.0')
@@ -1 +1,9 @@
-from .bitcoin import get_zk_input
\ No newline at end of file
+""" Submodules are imported on first use of their names, header store does not need rpc and numpy """
+
+import importlib
+
+
+def __getattr__(name):
+    if name == 'get_zk_input':
+        return importlib.import_module(__name__ + '.bitcoin').get_zk_input
+    raise AttributeError('module ' + __name__ + ' has no attribute ' + name)
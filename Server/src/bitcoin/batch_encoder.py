@@ -0,0 +1,72 @@
+''' Batch encoding of raw headers for zokrates '''
+
+from hashlib import sha256
+import numpy as np
+
+from .btc_header_manipulation import HEADER_SIZE
+
+# 128 bit field values per header
+LIMBS = HEADER_SIZE // 16
+# 64 bit values per target
+TARGET_LIMBS = 4
+
+
+def as_header_array(buffer):
+    """ Returns (N, 80) uint8 view of buffer of consecutive headers """
+    array = np.frombuffer(buffer, dtype=np.uint8)
+    if array.size % HEADER_SIZE != 0:
+        raise ValueError('Buffer is not made of 80 byte headers')
+    return array.reshape(-1, HEADER_SIZE)
+
+
+def encode_limbs(buffer):
+    """ Returns (N, 5) array of 128 bit header fields as python ints """
+    words = np.frombuffer(buffer, dtype='>u8').reshape(-1, LIMBS, 2)
+    high = words[:, :, 0].astype(object)
+    low = words[:, :, 1].astype(object)
+    return (high << 64) | low
+
+
+def encode_hashes(buffer):
+    """ Returns list of header hashes as ints (rpc byte order) """
+    view = memoryview(buffer)
+    digests = b''.join(sha256(sha256(view[i:i+HEADER_SIZE]).digest()).digest()
+                       for i in range(0, len(view), HEADER_SIZE))
+    return [int.from_bytes(digests[i:i+32], 'little') for i in range(0, len(digests), 32)]
+
+
+def encode_targets(buffer):
+    """ Returns (N, 4) uint64 array of targets from bits, most significant first """
+    headers = as_header_array(buffer)
+    bits = headers[:, 72:76].copy().view('<u4').ravel().astype(np.int64)
+    mantissa = (bits & 0xffffff).astype(np.uint64)
+    shift = 8 * ((bits >> 24) - 3)
+
+    targets = np.zeros((headers.shape[0], TARGET_LIMBS), dtype=np.uint64)
+    for limb in range(TARGET_LIMBS):
+        # shift of mantissa relative to the lowest bit of limb
+        relative = shift - 64 * limb
+        left = np.clip(relative, 0, 63).astype(np.uint64)
+        right = np.clip(-relative, 0, 63).astype(np.uint64)
+        value = np.where(relative >= 0, mantissa << left, mantissa >> right)
+        # mantissa is 24 bits wide, it does not reach limbs outside of this window
+        value[(relative >= 64) | (relative <= -24)] = 0
+        targets[:, TARGET_LIMBS - 1 - limb] = value
+    return targets
+
+
+def encode_batch(buffer):
+    """ Returns limbs, hashes and targets of all headers in buffer """
+    return {
+        'limbs': encode_limbs(buffer),
+        'hashes': encode_hashes(buffer),
+        'targets': encode_targets(buffer),
+    }
+
+
+def encode_zok_input(buffer):
+    """ Returns zokrates witness argument for parent header followed by window headers """
+    window = memoryview(buffer)[HEADER_SIZE:]
+    hashes = encode_hashes(buffer)
+    values = encode_limbs(window).ravel().tolist() + hashes[1:] + hashes[:1]
+    return ' '.join(map(str, values))
@@ -10,6 +10,9 @@ def get_zk_input(chainId, start, end):
         start = str(start)
         end = str(end)
         zkInput = create_zok_input(chainId, start, end)
+        # pass errors through instead of serializing them as input
+        if isinstance(zkInput, dict):
+            return zkInput
         return json.dumps(zkInput)
     except Exception as err:
         logging.error("Error '{0}' occurred.".format(err))
@@ -14,6 +14,17 @@ def getTarget(bits):
     b = int(bits[2:], 16)
     return(b * 2**(8*(a - 3)))
 
+HEADER_SIZE = 80
+# version, previous hash, merkle root, time, bits, nonce
+HEADER_FORMAT = struct.Struct('<I32s32sIII')
+
+def parseHeaders(buffer, startHeight):
+    """ Returns RawBlockHeader list from buffer of consecutive 80 byte headers """
+    view = memoryview(buffer)
+    if len(view) % HEADER_SIZE != 0:
+        raise ValueError('Buffer is not made of 80 byte headers')
+    return [RawBlockHeader(view[i:i+HEADER_SIZE].tobytes(), startHeight + i // HEADER_SIZE)
+            for i in range(0, len(view), HEADER_SIZE)]
 
 class BlockHeader:
     def __init__(self, input):
@@ -94,3 +105,68 @@ class BlockHeader:
             self._hash = binascii.hexlify(
                 binascii.unhexlify(hash)[::-1]).decode('ascii')
         return self._hash
+
+
+class RawBlockHeader:
+    """ Header parsed directly from its 80 byte serialization """
+    __slots__ = ('height', 'header', '_hash')
+
+    def __init__(self, raw, height):
+        if len(raw) != HEADER_SIZE:
+            raise ValueError('Header at ' + str(height) + ' is not 80 bytes')
+        self.height = height
+        self.header = bytes(raw)
+        self._hash = None
+
+    def __str__(self) -> str:
+        return f'BlockHeader #{self.height} {self.hash}'
+
+    @property
+    def fields(self):
+        """ Returns (version, prev hash, merkle root, time, bits, nonce) """
+        return HEADER_FORMAT.unpack(self.header)
+
+    @property
+    def previous_block_hash(self):
+        """ Returns previous hash in serialized byte order hex """
+        return self.header[4:36].hex()
+
+    @property
+    def previousHash(self):
+        """ Returns previous hash in rpc (big endian) hex """
+        return self.header[35:3:-1].hex()
+
+    @property
+    def merkle_root(self):
+        """ Returns merkle root in rpc (big endian) hex """
+        return self.header[67:35:-1].hex()
+
+    @property
+    def unhexBits(self):
+        """ Returns bits as rpc hex string """
+        return format(int.from_bytes(self.header[72:76], 'little'), '08x')
+
+    def zokratesBlockTarget(self):
+        """ Returns expected target in zokratess expected form """
+        target = getTarget(self.unhexBits)
+        # split target to u64 values
+        return ' '.join(str((target >> shift) & 0xffffffffffffffff) for shift in range(192, -1, -64))
+
+    @property
+    def zokratesInput(self):
+        """ Returns header as 5 fields of 128 bits """
+        header = self.header
+        return ' '.join(str(int.from_bytes(header[i:i+16], 'big')) for i in range(0, HEADER_SIZE, 16))
+
+    @property
+    def zokratesTarget(self):
+        """ Returns prev header target in zokrates program format """
+        prevBlock = self.previous_block_hash
+        return ['0x' + prevBlock[i:i+8] for i in range(0, len(prevBlock), 8)]
+
+    @property
+    def hash(self):
+        """ Calculates hash for header object """
+        if self._hash is None:
+            self._hash = sha256(sha256(self.header).digest()).digest()[::-1].hex()
+        return self._hash
@@ -1,24 +1,31 @@
 ''' Zokrates data handling '''
 
 from .jsonRPC import *
-from .btc_header_manipulation import BlockHeader
+from .batch_encoder import encode_zok_input
+from .header_validation import validate_headers
+import json
 import logging
+from ..utils.metrics import Counter
+
+headersEncoded = Counter('zk_headers_encoded_total', 'Headers validated and encoded into zokrates input')
+
+def get_header_getter(chainId):
+    """ Returns function loading single raw header by height """
+    return lambda height: getRawHeaders(int(chainId), height, height+1)[0]
 
 def create_zok_input(chainId, start, end):
     """ Get zok input for blocks """
     try:
-        firstHeader = getBlockHeaders(int(chainId), int(start)-1,int(start))
-        headers = getBlockHeaders(int(chainId), int(start), int(end))
-        zkHeaders = ''
-        zkHashaes = ''
-        for header in headers:
-            headerObj = BlockHeader(header)
-            # headers formated for zk as set of fields
-            zkHeaders += (headerObj.zokratesInput) + ' '
-            # block hashes as fields
-            zkHashaes += str(int(headerObj.hash, 16)) + ' '
-        zkInput = zkHeaders + zkHashaes + str(int(BlockHeader(firstHeader[0]).hash, 16)) 
-        return zkInput
+        # parent of the first header is fetched with the rest of the window
+        buffer = getHeadersBuffer(int(chainId), int(start)-1, int(end))
+        report = validate_headers(chainId, buffer, int(start)-1, get_header_getter(chainId))
+        if not report['valid']:
+            logging.error('Invalid headers: ' + json.dumps(report))
+            return {'error':'Invalid headers', 'report': report}
+        # header fields, block hashes and parent hash as fields
+        zokInput = encode_zok_input(buffer)
+        headersEncoded.inc(int(end) - int(start), chain=chainId)
+        return zokInput
     except Exception as err:
         logging.error("Error '{0}' occurred.".format(err))
-        return {'error':'Error while fetching transaction'}
\ No newline at end of file
+        return {'error':'Error while fetching transaction'}
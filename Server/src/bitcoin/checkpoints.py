@@ -0,0 +1,41 @@
+''' Trusted checkpoints chains are relayed from '''
+
+import os, json, threading
+
+_checkpointsLock = threading.Lock()
+
+
+def get_checkpoints_path():
+    return os.getcwd() + '/Server/src/bitcoin/checkpoints.json'
+
+
+def load_checkpoints():
+    """ Returns chainId -> {'height', 'hash', 'work'} of all checkpoints """
+    try:
+        with open(get_checkpoints_path(), 'r') as file:
+            return json.load(file)
+    except (OSError, ValueError):
+        return {}
+
+
+def get_checkpoint(chainId):
+    """ Returns checkpoint of chain or None """
+    return load_checkpoints().get(str(int(chainId)))
+
+
+def save_checkpoint(chainId, checkpoint):
+    """ Atomically stores checkpoint of chain """
+    with _checkpointsLock:
+        checkpoints = load_checkpoints()
+        checkpoints[str(int(chainId))] = checkpoint
+        temporary = get_checkpoints_path() + '.tmp'
+        with open(temporary, 'w') as file:
+            file.write(json.dumps(checkpoints))
+        os.replace(temporary, get_checkpoints_path())
+
+
+def work_to_difficulty(work, batchSize=1):
+    """ Converts chainwork (expected hashes) to difficulty units used by contract """
+    # difficulty 1 target is 0xFFFF * 2**208, its work is 2**256 / target
+    # submitBatches adds difficulty of first header once per batch, not per header
+    return (int(work) * 0xFFFF >> 48) // int(batchSize)
@@ -0,0 +1,338 @@
+''' Local on-disk header storage '''
+
+import os
+import fcntl
+import struct
+import logging
+import threading
+from contextlib import contextmanager
+from hashlib import sha256
+from .header_validation import header_work
+from .checkpoints import get_checkpoint
+
+# serialized bitcoin header size
+HEADER_SIZE = 80
+# index record: height + little endian header hash
+INDEX_RECORD = struct.Struct('<I32s')
+
+_stores = {}
+_storesLock = threading.Lock()
+_listeners = []
+
+
+def get_store_directory():
+    """ Returns directory containing header files """
+    return os.getcwd() + '/Server/src/bitcoin/headers'
+
+
+def header_hash(raw):
+    """ Returns double sha256 of raw header in rpc (big endian) hex """
+    return sha256(sha256(raw).digest()).digest()[::-1].hex()
+
+
+class HeaderStore:
+    """ Append only store of raw headers forming header tree
+
+    Headers are kept as fixed 80 byte records in `<chainId>.headers`,
+    `<chainId>.index` holds height and hash of the record at the same position.
+    Competing branches are kept too, height lookups follow the branch with
+    most work and reorg listeners are notified whenever it switches.
+    Several processes may share files, appends hold `<chainId>.lock` and
+    first read in records appended by others.
+    """
+
+    def __init__(self, chainId, directory=None, checkpoint=None):
+        self.chainId = int(chainId)
+        # branches forking below trusted checkpoint never become best chain
+        self.checkpoint = checkpoint
+        self.directory = directory or get_store_directory()
+        os.makedirs(self.directory, exist_ok=True)
+        self.headersPath = self.directory + '/' + str(self.chainId) + '.headers'
+        self.indexPath = self.directory + '/' + str(self.chainId) + '.index'
+        self.lockPath = self.directory + '/' + str(self.chainId) + '.lock'
+        self._lock = threading.Lock()
+        # records read from files so far
+        self._count = 0
+        # hash -> record position
+        self._positions = {}
+        # hash -> (previous hash, work)
+        self._links = {}
+        # hash -> height of headers linked into tree
+        self._heights = {}
+        # height -> hash on best chain
+        self._best = {}
+        # previous hash -> [(hash, height)] of stored headers waiting for their parent
+        self._detached = {}
+        self._load()
+
+    @contextmanager
+    def _locked(self):
+        """ Holds store for this thread and files for this process """
+        with self._lock, open(self.lockPath, 'a') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            yield
+
+    def _load(self):
+        """ Replays records into tree and drops records that were not fully written """
+        open(self.headersPath, 'ab').close()
+        open(self.indexPath, 'ab').close()
+        with self._locked():
+            # reorgs replayed here were handled when they happened
+            self._read_appended()
+
+    def _read_appended(self):
+        """ Replays records appended since last read, returns reorg events, file lock must be held """
+        with open(self.headersPath, 'rb') as file:
+            file.seek(self._count * HEADER_SIZE)
+            headers = file.read()
+        with open(self.indexPath, 'rb') as file:
+            file.seek(self._count * INDEX_RECORD.size)
+            index = file.read()
+        count = min(len(headers) // HEADER_SIZE, len(index) // INDEX_RECORD.size)
+
+        events = []
+        for offset in range(count):
+            height, rawHash = INDEX_RECORD.unpack_from(index, offset * INDEX_RECORD.size)
+            hash = rawHash[::-1].hex()
+            self._positions[hash] = self._count + offset
+            events.extend(self._insert(hash, height, headers[offset * HEADER_SIZE:(offset + 1) * HEADER_SIZE]))
+        self._count += count
+
+        # truncate partial writes from interrupted runs, nobody else writes while lock is held
+        if len(headers) != count * HEADER_SIZE:
+            with open(self.headersPath, 'r+b') as file:
+                file.truncate(self._count * HEADER_SIZE)
+        if len(index) != count * INDEX_RECORD.size:
+            with open(self.indexPath, 'r+b') as file:
+                file.truncate(self._count * INDEX_RECORD.size)
+        return events
+
+    def _insert(self, hash, height, raw):
+        """ Links header and detached headers waiting for it into tree, returns reorg events """
+        self._links[hash] = (raw[4:36][::-1].hex(), header_work(struct.unpack_from('<I', raw, 72)[0]))
+        events = []
+        pending = [(hash, height)]
+        while pending:
+            hash, height = pending.pop()
+            event = self._link(hash, height)
+            if event is not None:
+                events.append(event)
+            if hash in self._heights:
+                pending.extend(child for child in self._detached.pop(hash, []) if child[0] not in self._heights)
+            else:
+                waiting = self._detached.setdefault(self._links[hash][0], [])
+                if (hash, height) not in waiting:
+                    waiting.append((hash, height))
+        return events
+
+    def _link(self, hash, height):
+        """ Links header with known parent into tree, returns reorg event or None """
+        previous = self._links[hash][0]
+        detachedParent = previous in self._links and previous not in self._heights
+        if previous in self._heights:
+            self._heights[hash] = height
+            if height not in self._best and self._best.get(height - 1) == previous:
+                return self._extend(hash, height)
+            return self._compare(hash, height)
+        if height not in self._best and height - 1 not in self._best and not detachedParent:
+            # first header of stored range
+            self._heights[hash] = height
+            return self._extend(hash, height)
+        # parent branch was not fetched, header stays detached until it is
+        return None
+
+    def _extend(self, hash, height):
+        """ Appends header to best chain """
+        self._best[height] = hash
+        end = self._drop_unlinked(height + 1)
+        if end is None:
+            return None
+        return {'chainId': self.chainId, 'height': height + 1, 'end': end}
+
+    def _drop_unlinked(self, height):
+        """ Detaches best chain segment at height that does not continue chain below, returns its end """
+        first = self._best.get(height)
+        if first is None or self._links[first][0] == self._best.get(height - 1):
+            return None
+        end = height + 1
+        while end in self._best and self._links[self._best[end]][0] == self._best[end - 1]:
+            end += 1
+        for segmentHeight in range(height, end):
+            del self._heights[self._best.pop(segmentHeight)]
+        return end
+
+    def _compare(self, hash, height):
+        """ Switches best chain to branch ending at hash if it has more work since fork """
+        if self._best.get(height) == hash:
+            return None
+        branch = []
+        branchWork = 0
+        cursor = hash
+        while self._best.get(self._heights[cursor]) != cursor:
+            branch.append(cursor)
+            branchWork += self._links[cursor][1]
+            cursor = self._links[cursor][0]
+            if cursor not in self._heights:
+                # branch does not reach best chain
+                return None
+        fork = self._heights[cursor]
+        if self.checkpoint is not None and fork < self.checkpoint['height']:
+            logging.warning('Ignoring branch of chain ' + str(self.chainId) + ' forking below checkpoint')
+            return None
+
+        bestWork = 0
+        end = fork + 1
+        while end in self._best and self._links[self._best[end]][0] == self._best[end - 1]:
+            bestWork += self._links[self._best[end]][1]
+            end += 1
+        if branchWork <= bestWork:
+            return None
+
+        for branchHeight in range(height + 1, end):
+            del self._best[branchHeight]
+        for branchHeight, branchHash in zip(range(height, fork, -1), branch):
+            self._best[branchHeight] = branchHash
+        end = max(end, self._drop_unlinked(height + 1) or 0)
+        return {'chainId': self.chainId, 'height': fork + 1, 'end': end}
+
+    def __len__(self):
+        return self._count
+
+    def __contains__(self, height):
+        return height in self._best
+
+    def get_height(self, hash):
+        """ Returns height of header with given hash or None """
+        return self._heights.get(hash)
+
+    def best_hash(self, height):
+        """ Returns hash of best chain header at height or None """
+        return self._best.get(height)
+
+    def tip(self):
+        """ Returns height and hash of highest best chain header or None """
+        with self._lock:
+            if not self._best:
+                return None
+            height = max(self._best)
+            return height, self._best[height]
+
+    def missing_ranges(self, begining, end):
+        """ Returns list of (start, end) ranges without best chain header """
+        ranges = []
+        rangeStart = None
+        for height in range(begining, end):
+            if height in self._best:
+                if rangeStart is not None:
+                    ranges.append((rangeStart, height))
+                    rangeStart = None
+            elif rangeStart is None:
+                rangeStart = height
+        if rangeStart is not None:
+            ranges.append((rangeStart, end))
+        return ranges
+
+    def get(self, begining, end):
+        """ Returns list of best chain raw headers between begining and end, None if any is missing """
+        with self._lock:
+            hashes = [self._best.get(height) for height in range(begining, end)]
+            if None in hashes:
+                return None
+            positions = [self._positions[hash] for hash in hashes]
+
+        headers = []
+        with open(self.headersPath, 'rb') as file:
+            for position in positions:
+                file.seek(position * HEADER_SIZE)
+                headers.append(file.read(HEADER_SIZE))
+        return headers
+
+    def get_header(self, hash):
+        """ Returns raw header with given hash from any stored branch or None """
+        with self._lock:
+            position = self._positions.get(hash)
+        if position is None:
+            return None
+        with open(self.headersPath, 'rb') as file:
+            file.seek(position * HEADER_SIZE)
+            return file.read(HEADER_SIZE)
+
+    def records(self):
+        """ Returns raw headers and index of all completely written records """
+        with self._lock:
+            with open(self.headersPath, 'rb') as file:
+                headers = file.read(self._count * HEADER_SIZE)
+            with open(self.indexPath, 'rb') as file:
+                index = file.read(self._count * INDEX_RECORD.size)
+        return headers, index
+
+    def put(self, headers):
+        """ Appends list of (height, raw header) pairs, headers stored before are only linked again """
+        with self._locked():
+            # other processes may have stored some of headers
+            events = self._read_appended()
+            records = []
+            seen = set()
+            for height, raw in headers:
+                if len(raw) != HEADER_SIZE:
+                    raise ValueError('Header at ' + str(height) + ' is not 80 bytes')
+                hash = header_hash(raw)
+                if hash in self._heights or hash in seen:
+                    continue
+                seen.add(hash)
+                if hash in self._positions:
+                    # stored but detached, e.g. segment dropped from best chain
+                    events.extend(self._insert(hash, height, raw))
+                    continue
+                records.append((height, raw, hash))
+            if records:
+                # headers are written before index so index never points past data
+                with open(self.headersPath, 'ab') as file:
+                    position = os.fstat(file.fileno()).st_size // HEADER_SIZE
+                    file.write(b''.join(raw for _, raw, _ in records))
+                with open(self.indexPath, 'ab') as file:
+                    file.write(b''.join(
+                        INDEX_RECORD.pack(height, bytes.fromhex(hash)[::-1])
+                        for height, _, hash in records))
+
+                for offset, (height, raw, hash) in enumerate(records):
+                    self._positions[hash] = position + offset
+                    events.extend(self._insert(hash, height, raw))
+                self._count = position + len(records)
+
+        for event in events:
+            logging.warning('Reorg of chain ' + str(self.chainId) + ' from ' + str(event['height']) +
+                            ' to ' + str(event['end']))
+            for listener in list(_listeners):
+                listener(event)
+        return len(records)
+
+
+def on_reorg(listener):
+    """ Registers listener(event) called when best chain of stored headers switches branch
+
+    Event holds chainId and range [height, end) of replaced best chain headers.
+    """
+    if listener not in _listeners:
+        _listeners.append(listener)
+
+
+def off_reorg(listener):
+    """ Unregisters reorg listener """
+    if listener in _listeners:
+        _listeners.remove(listener)
+
+
+def get_header_store(chainId):
+    """ Returns shared header store for chain """
+    chainId = int(chainId)
+    with _storesLock:
+        if chainId not in _stores:
+            _stores[chainId] = HeaderStore(chainId, checkpoint=get_checkpoint(chainId))
+        return _stores[chainId]
+
+
+def reset_header_stores():
+    """ Forgets shared header stores, next get_header_store reads files again """
+    with _storesLock:
+        _stores.clear()
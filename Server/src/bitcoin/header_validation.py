@@ -0,0 +1,125 @@
+''' Header chain validation before proving '''
+
+from .btc_header_manipulation import HEADER_SIZE, HEADER_FORMAT
+from .batch_encoder import encode_hashes
+
+# maximal target, same limit is required by the contract
+POW_LIMIT = 0x00000000FFFF0000000000000000000000000000000000000000000000000000
+# chainId -> maximal target of chains not using mainnet limit (e.g. regtest)
+POW_LIMITS = {}
+RETARGET_INTERVAL = 2016
+# two weeks
+TARGET_TIMESPAN = 14 * 24 * 60 * 60
+# last height using bitcoin difficulty rules on bch chains
+BCH_FORK_HEIGHT = 478558
+
+
+def bits_to_target(bits):
+    """ Returns target from compact bits """
+    return (bits & 0xffffff) * 2**(8*((bits >> 24) - 3))
+
+
+def header_work(bits):
+    """ Returns expected number of hashes needed to meet target of bits """
+    return 2**256 // (int(bits_to_target(bits)) + 1)
+
+
+def target_to_bits(target):
+    """ Returns compact bits of target """
+    size = (target.bit_length() + 7) // 8
+    if size <= 3:
+        mantissa = target << (8 * (3 - size))
+    else:
+        mantissa = target >> (8 * (size - 3))
+    # mantissa sign bit must stay clear
+    if mantissa & 0x00800000:
+        mantissa >>= 8
+        size += 1
+    return (size << 24) | mantissa
+
+
+def set_pow_limit(chainId, powLimit):
+    """ Sets maximal target of chain """
+    POW_LIMITS[int(chainId)] = int(powLimit)
+
+
+def get_pow_limit(chainId):
+    return POW_LIMITS.get(int(chainId), POW_LIMIT)
+
+
+def next_bits(bits, firstTime, lastTime, powLimit=POW_LIMIT):
+    """ Returns bits of the first block of new retarget period """
+    timespan = min(max(lastTime - firstTime, TARGET_TIMESPAN // 4), TARGET_TIMESPAN * 4)
+    target = min(bits_to_target(bits) * timespan // TARGET_TIMESPAN, powLimit)
+    return target_to_bits(target)
+
+
+def uses_bitcoin_retarget(chainId, height):
+    """ Returns true if height follows 2016 block retarget rules """
+    return int(chainId) in (0, 1) or height <= BCH_FORK_HEIGHT
+
+
+def validate_headers(chainId, buffer, startHeight, getHeader=None, powLimit=None):
+    """ Validates linkage, proof of work and retargets of consecutive raw headers
+
+    getHeader(height) returns raw header outside of buffer, it is used to
+    check retarget boundaries. powLimit defaults to limit of chain.
+    Returns machine readable report.
+    """
+    if powLimit is None:
+        powLimit = get_pow_limit(chainId)
+    count = len(buffer) // HEADER_SIZE
+    hashes = encode_hashes(buffer)
+    errors = []
+
+    def fail(index, check, message):
+        errors.append({
+            'height': startHeight + index,
+            'hash': format(hashes[index], '064x'),
+            'check': check,
+            'message': message,
+        })
+
+    prevFields = None
+    for index in range(count):
+        height = startHeight + index
+        fields = HEADER_FORMAT.unpack_from(buffer, index * HEADER_SIZE)
+        version, prevHash, merkleRoot, time, bits, nonce = fields
+        target = bits_to_target(bits)
+
+        if target > powLimit:
+            fail(index, 'pow', 'Target above proof of work limit')
+        elif hashes[index] > target:
+            fail(index, 'pow', 'Hash above target')
+
+        if prevFields is not None:
+            if int.from_bytes(prevHash, 'little') != hashes[index - 1]:
+                fail(index, 'link', 'Previous hash does not match previous header')
+
+        if uses_bitcoin_retarget(chainId, height) and height > 0:
+            prevBits = prevFields[4] if prevFields is not None else None
+            if height % RETARGET_INTERVAL != 0:
+                if prevBits is not None and bits != prevBits:
+                    fail(index, 'retarget', 'Difficulty changed outside of retarget boundary')
+            elif getHeader is not None:
+                lastFields = prevFields or HEADER_FORMAT.unpack(getHeader(height - 1))
+                firstFields = HEADER_FORMAT.unpack(getHeader(height - RETARGET_INTERVAL))
+                if bits != next_bits(lastFields[4], firstFields[3], lastFields[3], powLimit):
+                    fail(index, 'retarget', 'Unexpected difficulty at retarget boundary')
+        prevFields = fields
+
+    return {
+        'chainId': int(chainId),
+        'start': startHeight,
+        'end': startHeight + count,
+        'valid': errors == [],
+        'errors': errors,
+    }
+
+
+def invalid_windows(report, windows):
+    """ Returns windows containing any failing height from report """
+    failing = set(error['height'] for error in report['errors'])
+    # window input contains its parent header as well
+    return [window for window in windows
+            if any(height in failing for height in range(window[0] - 1, window[1]))]
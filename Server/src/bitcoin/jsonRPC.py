@@ -2,20 +2,59 @@
 
 import requests
 import json
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from requests.adapters import HTTPAdapter
 from ..constants import *
+from .btc_header_manipulation import BlockHeader, RawBlockHeader
+from .header_store import get_header_store, header_hash
+from .checkpoints import save_checkpoint
+from ..utils.metrics import Counter, Histogram, SIZE_BUCKETS
+from ..utils.rate_limit import RateLimiter
 import argparse
 import sys
 
+# maximal number of requests in single json rpc batch
+HEADER_BATCH_SIZE = 500
+# batches in flight at once
+MAX_IN_FLIGHT = 4
+# retries of failed batch with exponential backoff
+RETRIES = 3
+RETRY_BACKOFF = 0.5
+TIMEOUT = 30
+# request serialized headers (verbose=false), verbose json is used as fallback
+RAW_HEADERS = True
+# deepest reorg searched for when provider switches branch
+MAX_REORG_DEPTH = 1000
+# json rpc calls per second and burst allowed by each provider, shared by all chains using it
+PROVIDER_RATE = 25
+PROVIDER_BURST = 500
+
+rpcSeconds = Histogram('zk_rpc_request_seconds', 'Bitcoin json rpc batch latency')
+rpcBatchSize = Histogram('zk_rpc_batch_size', 'Requests in single json rpc batch', SIZE_BUCKETS)
+rpcErrors = Counter('zk_rpc_errors_total', 'Failed bitcoin json rpc attempts')
+
+_sessions = {}
+_sessionsLock = threading.Lock()
+_limiters = {}
+
+
+class RPCError(Exception):
+    """ Error returned by json rpc provider """
+
+
 def getPayload(id, params, function):
     return {
         "id": str(id),
         "jsonrpc": "2.0",
         "method": function,
-        "params": [params],
+        "params": params if isinstance(params, list) else [params],
     }
 
-def getBlockHeaders(chainId, begining, end):
-    """ create proof for block number """
+def getProvider(chainId):
+    """ Returns provider url and request headers for chain """
     if (chainId == 0 or chainId == 1):
         token = BTCTOKEN
         provider = BTCPROVIDER
@@ -28,11 +67,209 @@ def getBlockHeaders(chainId, begining, end):
         "x-api-key": token,
         "X-Auth-Token": token,
     }
+    return provider, headers
+
+def getSession(provider):
+    """ Returns keep-alive session shared by all requests to provider """
+    with _sessionsLock:
+        if provider not in _sessions:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=1, pool_maxsize=MAX_IN_FLIGHT)
+            session.mount('http://', adapter)
+            session.mount('https://', adapter)
+            _sessions[provider] = session
+        return _sessions[provider]
+
+def getLimiter(provider):
+    """ Returns rate limiter shared by all requests to provider """
+    with _sessionsLock:
+        if provider not in _limiters:
+            _limiters[provider] = RateLimiter(PROVIDER_RATE, PROVIDER_BURST, MAX_IN_FLIGHT)
+        return _limiters[provider]
+
+def postBatch(chainId, payloads):
+    """ Send json rpc batch and return results in payload order """
+    provider, headers = getProvider(chainId)
+    session = getSession(provider)
+    limiter = getLimiter(provider)
+    data = json.dumps(payloads)
+    method = payloads[0]['method']
+    rpcBatchSize.observe(len(payloads), method=method)
+
+    for attempt in range(RETRIES + 1):
+        try:
+            # providers bill every call of batch
+            with limiter.limit(len(payloads)), rpcSeconds.time(method=method):
+                response = session.post(provider, headers=headers, data=data, allow_redirects=False, timeout=TIMEOUT)
+                response.raise_for_status()
+                items = response.json()
+            if not isinstance(items, list):
+                raise RPCError('Unexpected response: ' + str(items)[:200])
+            break
+        except (requests.RequestException, ValueError) as err:
+            rpcErrors.inc(method=method)
+            if attempt == RETRIES:
+                raise
+            logging.warning("Error '{0}' occurred, retrying.".format(err))
+            time.sleep(RETRY_BACKOFF * 2**attempt)
+
+    # providers are free to reply out of order
+    results = {item.get('id'): item for item in items}
+    ordered = []
+    for payload in payloads:
+        item = results.get(payload['id'])
+        if item is None:
+            raise RPCError('Missing response for ' + payload['method'] + ' ' + payload['id'])
+        if item.get('error') is not None:
+            raise RPCError(payload['method'] + ' ' + payload['id'] + ' failed: ' + str(item['error']))
+        ordered.append(item)
+    return ordered
+
+def getBlockCount(chainId):
+    """ get height of chain tip """
+    return postBatch(chainId, [getPayload('tip', [], 'getblockcount')])[0]['result']
+
+def fetchBlockHashes(chainId, begining, end):
+    """ fetch hashes of provider best chain """
+    return [item['result'] for item in
+            postBatch(chainId, [getPayload(block, block, 'getblockhash') for block in range(begining, end)])]
+
+def fetchBlockTxids(chainId, blockHash):
+    """ fetch block height, merkle root and transaction ids """
+    block = postBatch(chainId, [getPayload(blockHash, [blockHash, 1], 'getblock')])[0]['result']
+    return {'hash': block['hash'], 'height': block['height'], 'merkleroot': block['merkleroot'], 'tx': block['tx']}
+
+def fetchRawHeaders(chainId, hashes):
+    """ fetch serialized headers (verbose=false) """
+    return [bytes.fromhex(item['result']) for item in
+            postBatch(chainId, [getPayload(block['id'], [block['result'], False], 'getblockheader') for block in hashes])]
+
+def fetchRawHeader(chainId, blockHash):
+    """ fetch serialized header of single block """
+    return fetchRawHeaders(chainId, [{'id': blockHash, 'result': blockHash}])[0]
 
+def fetchJsonHeaders(chainId, hashes):
+    """ fetch verbose headers and serialize them """
+    return [BlockHeader(item).header for item in
+            postBatch(chainId, [getPayload(block['id'], block['result'], 'getblockheader') for block in hashes])]
+
+def fetchHeaderBatch(chainId, begining, end):
+    """ fetch raw headers of single bounded batch """
     # get block hashes
-    payload = json.dumps([getPayload(block, block, 'getblockhash') for block in range(begining, end)])
-    response = requests.post(provider, headers=headers, data=payload, allow_redirects=False, timeout=30)
+    hashes = postBatch(chainId, [getPayload(block, block, 'getblockhash') for block in range(begining, end)])
     # get block headers
-    payload = json.dumps([getPayload(block['id'], block['result'], 'getblockheader') for block in response.json()])
-    response = requests.post(provider, headers=headers, data=payload, allow_redirects=False, timeout=30).json()
-    return response
\ No newline at end of file
+    headers = None
+    if RAW_HEADERS:
+        try:
+            headers = fetchRawHeaders(chainId, hashes)
+        except (RPCError, ValueError, TypeError) as err:
+            logging.warning("Error '{0}' occurred, falling back to verbose headers.".format(err))
+    if headers is None:
+        headers = fetchJsonHeaders(chainId, hashes)
+
+    for block, raw in zip(hashes, headers):
+        if header_hash(raw) != block['result']:
+            raise RPCError('Header ' + block['id'] + ' does not match its hash')
+    return headers
+
+def fetchBlockHeaders(chainId, begining, end):
+    """ fetch raw block headers from remote provider in concurrent batches """
+    batches = [(i, min(i + HEADER_BATCH_SIZE, end)) for i in range(begining, end, HEADER_BATCH_SIZE)]
+    if len(batches) == 1:
+        return fetchHeaderBatch(chainId, begining, end)
+
+    with ThreadPoolExecutor(MAX_IN_FLIGHT) as pool:
+        futures = [pool.submit(fetchHeaderBatch, chainId, batchStart, batchEnd) for batchStart, batchEnd in batches]
+        response = []
+        for future in futures:
+            response.extend(future.result())
+    return response
+
+def getRawHeaders(chainId, begining, end):
+    """ get raw block headers, only heights missing in local store are fetched """
+    store = get_header_store(chainId)
+    for attempt in range(2):
+        for rangeStart, rangeEnd in store.missing_ranges(begining, end):
+            logging.info('Fetching headers from: ' + str(rangeStart) + ' to: ' + str(rangeEnd))
+            response = fetchBlockHeaders(chainId, rangeStart, rangeEnd)
+            store.put(zip(range(rangeStart, rangeEnd), response))
+
+        rawHeaders = store.get(begining, end)
+        if rawHeaders is not None:
+            return rawHeaders
+        # fetched headers do not continue stored ones, provider switched branch
+        syncHeaders(chainId)
+    raise ValueError('Missing headers between ' + str(begining) + ' and ' + str(end))
+
+def syncHeaders(chainId):
+    """ Reconciles stored best chain with provider, returns provider tip height
+
+    When provider disagrees with stored tip its branch is fetched from the
+    fork point, header store switches to it by work and notifies listeners.
+    """
+    store = get_header_store(chainId)
+    tipHeight = getBlockCount(chainId)
+    top = store.tip()
+    if top is None:
+        return tipHeight
+    height = min(top[0], tipHeight)
+    if fetchBlockHashes(chainId, height, height + 1)[0] == store.best_hash(height):
+        return tipHeight
+
+    # step back until provider and store agree
+    fork = None
+    high = height + 1
+    while fork is None and high > max(height + 1 - MAX_REORG_DEPTH, 0):
+        low = max(high - HEADER_BATCH_SIZE, height + 1 - MAX_REORG_DEPTH, 0)
+        hashes = fetchBlockHashes(chainId, low, high)
+        for blockHeight in range(high - 1, low - 1, -1):
+            stored = store.best_hash(blockHeight)
+            if stored is None or stored == hashes[blockHeight - low]:
+                fork = blockHeight
+                break
+        high = low
+    if fork is None:
+        raise RPCError('Reorg of chain ' + str(chainId) + ' deeper than ' + str(MAX_REORG_DEPTH) + ' blocks')
+
+    end = min(tipHeight, top[0] + HEADER_BATCH_SIZE) + 1
+    logging.info('Provider switched branch at: ' + str(fork + 1) + ', fetching to: ' + str(end))
+    store.put(zip(range(fork + 1, end), fetchBlockHeaders(chainId, fork + 1, end)))
+    return tipHeight
+
+def getBestHash(chainId, height):
+    """ get best chain hash at height, from local store when known """
+    hash = get_header_store(chainId).best_hash(height)
+    if hash is None:
+        hash = fetchBlockHashes(chainId, height, height + 1)[0]
+    return hash
+
+def getHeadersBuffer(chainId, begining, end):
+    """ get block headers as single contiguous buffer """
+    return b''.join(getRawHeaders(chainId, begining, end))
+
+def getBlockHeaders(chainId, begining, end):
+    """ get block headers """
+    return [RawBlockHeader(raw, height) for height, raw in zip(range(begining, end), getRawHeaders(chainId, begining, end))]
+
+def bootstrapCheckpoint(chainId, height, hash, work=None):
+    """ Starts local chain at trusted header, provider has to serve the same header
+
+    Cumulative work of the checkpoint is taken from provider when not given.
+    Returns stored checkpoint.
+    """
+    raw = fetchHeaderBatch(chainId, int(height), int(height) + 1)[0]
+    if header_hash(raw) != hash:
+        raise RPCError('Provider best chain does not contain checkpoint ' + hash + ' at ' + str(height))
+    chainwork = int(postBatch(chainId, [getPayload(hash, hash, 'getblockheader')])[0]['result']['chainwork'], 16)
+    if work is None:
+        work = chainwork
+    elif chainwork != int(work):
+        logging.warning('Provider reports different work of checkpoint, keeping trusted one')
+
+    checkpoint = {'height': int(height), 'hash': hash, 'work': int(work)}
+    save_checkpoint(chainId, checkpoint)
+    store = get_header_store(chainId)
+    store.checkpoint = checkpoint
+    store.put([(int(height), raw)])
+    logging.info('Chain ' + str(chainId) + ' starts at checkpoint ' + str(height) + ' ' + hash)
+    return checkpoint
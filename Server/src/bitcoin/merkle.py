@@ -0,0 +1,103 @@
+''' Merkle inclusion proofs of block transactions '''
+
+from hashlib import sha256
+
+from .header_store import get_header_store, header_hash
+from .jsonRPC import fetchBlockTxids, fetchRawHeader
+from ..utils.cache import TTLCache
+
+# finished trees by block hash, blocks do not change so entries only age out
+MERKLE_CACHE_SIZE = 64
+MERKLE_TTL = 24 * 60 * 60
+
+treeCache = TTLCache(maxsize=MERKLE_CACHE_SIZE, ttl=MERKLE_TTL)
+
+
+def double_sha(data):
+    return sha256(sha256(data).digest()).digest()
+
+
+class MerkleTree:
+    """ Bitcoin merkle tree of transaction ids
+
+    Ids are hex in rpc (big endian) order, levels hold internal byte order.
+    """
+
+    def __init__(self, txids):
+        self.txids = list(txids)
+        self.positions = {txid: index for index, txid in enumerate(self.txids)}
+        level = [bytes.fromhex(txid)[::-1] for txid in self.txids]
+        self.levels = [level]
+        while len(level) > 1:
+            # odd level repeats its last node
+            if len(level) % 2:
+                level = level + [level[-1]]
+            level = [double_sha(level[i] + level[i + 1]) for i in range(0, len(level), 2)]
+            self.levels.append(level)
+
+    @property
+    def root(self):
+        return self.levels[-1][0][::-1].hex()
+
+    def branch(self, txid):
+        """ Returns sibling hashes from leaf to root, None if txid is not in block """
+        index = self.positions.get(txid)
+        if index is None:
+            return None
+        position = index
+        branch = []
+        for level in self.levels[:-1]:
+            sibling = position ^ 1
+            branch.append((level[sibling] if sibling < len(level) else level[position])[::-1].hex())
+            position //= 2
+        return {'txid': txid, 'index': index, 'branch': branch}
+
+
+def verify_merkle_proof(txid, index, branch, merkleRoot):
+    """ Returns true if branch leads from txid at index to merkle root """
+    node = bytes.fromhex(txid)[::-1]
+    for sibling in branch:
+        sibling = bytes.fromhex(sibling)[::-1]
+        node = double_sha(sibling + node) if index & 1 else double_sha(node + sibling)
+        index >>= 1
+    return node[::-1].hex() == merkleRoot
+
+
+def header_merkle_root(chainId, blockHash):
+    """ Returns merkle root from header of block, header store is only read """
+    raw = get_header_store(chainId).get_header(blockHash)
+    if raw is None:
+        # api stays read only, fetched header is checked by its hash and not stored
+        raw = fetchRawHeader(chainId, blockHash)
+        if header_hash(raw) != blockHash:
+            raise ValueError('Provider returned header of other block than ' + blockHash)
+    # merkle root is in internal byte order
+    return raw[36:68][::-1].hex()
+
+
+def build_block_tree(chainId, blockHash):
+    """ Fetches block transactions and builds tree checked against block header """
+    block = fetchBlockTxids(chainId, blockHash)
+    tree = MerkleTree(block['tx'])
+    # provider merkleroot is not trusted, block hash commits to root in header
+    if tree.root != header_merkle_root(chainId, blockHash):
+        raise ValueError('Merkle root of ' + blockHash + ' does not match its transactions')
+    return {'hash': block['hash'], 'height': block['height'], 'tree': tree}
+
+
+def get_block_tree(chainId, blockHash):
+    """ Returns cached tree of block """
+    return treeCache.get_or_set((int(chainId), blockHash), lambda: build_block_tree(chainId, blockHash))
+
+
+def get_merkle_proofs(chainId, blockHash, txids):
+    """ Returns inclusion proofs of txids in block, all answered from single tree """
+    block = get_block_tree(chainId, blockHash)
+    tree = block['tree']
+    return {
+        'chainId': int(chainId),
+        'block': block['hash'],
+        'height': block['height'],
+        'merkle_root': tree.root,
+        'proofs': [tree.branch(txid) or {'txid': txid, 'error': 'Transaction not in block'} for txid in txids],
+    }
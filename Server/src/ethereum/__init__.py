@@ -1,3 +1,4 @@
 from src.ethereum.ethereum import init_eth_with_pk
 from src.ethereum.ethereum import get_last_transaction
-from src.ethereum.utils import get_contract_info
\ No newline at end of file
+from src.ethereum.utils import get_contract_info
+from src.ethereum.client import get_client, get_web3
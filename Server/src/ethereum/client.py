@@ -0,0 +1,89 @@
+""" Shared ethereum connection with batched calls """
+import json, logging, threading, itertools
+from urllib.parse import urlsplit
+import requests
+from requests.adapters import HTTPAdapter
+from web3 import Web3
+from web3._utils.abi import get_abi_output_types
+from web3.gas_strategies.time_based import medium_gas_price_strategy
+from eth_abi import decode_abi
+
+from src.utils import TTLCache
+
+# gas price strategy scans recent blocks, its result is reused for interval
+GAS_PRICE_TTL = 60
+# maximal number of calls in single json rpc batch
+CALL_BATCH_SIZE = 100
+POOL_SIZE = 8
+TIMEOUT = 30
+
+_clients = {}
+_clientsLock = threading.Lock()
+_ids = itertools.count()
+
+
+class EthClient:
+    """ Web3 instance and raw json rpc batches over one pooled session """
+
+    def __init__(self, provider):
+        self.provider = provider
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=POOL_SIZE)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        self.web3 = Web3(Web3.HTTPProvider(provider, session=self.session, request_kwargs={'timeout': TIMEOUT}))
+        self.gasPrices = TTLCache(maxsize=1, ttl=GAS_PRICE_TTL)
+        self.web3.eth.set_gas_price_strategy(self.gas_price_strategy)
+
+    def gas_price_strategy(self, web3, transaction_params=None):
+        """ Medium gas price computed at most once per interval """
+        return self.gasPrices.get_or_set('medium', lambda: medium_gas_price_strategy(web3, transaction_params))
+
+    def batch(self, calls):
+        """ Sends (method, params) pairs in json rpc batches, returns results in order """
+        results = []
+        for i in range(0, len(calls), CALL_BATCH_SIZE):
+            payloads = [{'jsonrpc': '2.0', 'id': next(_ids), 'method': method, 'params': params}
+                        for method, params in calls[i:i + CALL_BATCH_SIZE]]
+            response = self.session.post(self.provider, data=json.dumps(payloads), timeout=TIMEOUT,
+                                         headers={'Content-Type': 'application/json'})
+            response.raise_for_status()
+            # replies may come out of order
+            replies = {reply['id']: reply for reply in response.json()}
+            for payload in payloads:
+                reply = replies.get(payload['id'])
+                if reply is None or reply.get('error') is not None:
+                    raise ValueError(payload['method'] + ' failed: ' + str(reply and reply['error']))
+                results.append(reply['result'])
+        return results
+
+    def call_many(self, functions, block='latest'):
+        """ Executes contract function calls as eth_call batch, results are decoded like call() """
+        calls = [('eth_call', [{'to': function.address, 'data': function._encode_transaction_data()}, block])
+                 for function in functions]
+        results = []
+        for function, data in zip(functions, self.batch(calls)):
+            types = get_abi_output_types(function.abi)
+            values = decode_abi(types, bytes.fromhex(data[2:]))
+            results.append(values[0] if len(values) == 1 else list(values))
+        return results
+
+
+def provider_host(provider):
+    """ Returns scheme and host of provider url, its path and query may hold api token """
+    url = urlsplit(provider)
+    return url.scheme + '://' + (url.hostname or '') + (':' + str(url.port) if url.port else '')
+
+
+def get_client(provider):
+    """ Returns shared client of provider """
+    with _clientsLock:
+        if provider not in _clients:
+            logging.info('Connecting to ' + provider_host(provider))
+            _clients[provider] = EthClient(provider)
+        return _clients[provider]
+
+
+def get_web3(provider):
+    """ Returns shared web3 instance of provider """
+    return get_client(provider).web3
@@ -3,21 +3,20 @@ import json, logging
 from web3 import Web3
 from web3.middleware import geth_poa_middleware
 
-from web3.gas_strategies.time_based import medium_gas_price_strategy
-
 from src.ethereum.utils import HexJsonEncoder
+from src.ethereum.client import get_web3
 
 def init_eth_with_pk(privatekey, provider):
     """ Initialize blockchain connection """
     try:
-        web3 = Web3(Web3.HTTPProvider(provider))
+        # shared instance keeps connections and cached gas price
+        web3 = get_web3(provider)
         # ONLY IN RINKEBY!!
         # web3.middleware_onion.inject(geth_poa_middleware, layer=0)
 
         acc = web3.eth.account.privateKeyToAccount(privatekey)
         web3.eth.default_account = acc.address
-        web3.eth.set_gas_price_strategy(medium_gas_price_strategy)
-        
+
         return web3
     except Exception as err:
         logging.error("Error '{0}' occurred.".format(err))
@@ -8,9 +8,18 @@ class HexJsonEncoder(json.JSONEncoder):
             return obj.hex()
         return super().default(obj)
 
+_contractInfo = {}
+
 def get_contract_info():
+    """ Deployed contract information, file is read again only after redeploy """
     # this leads to container (withnout Server)
-    with open(os.getcwd()+'/src/smartContracts/smartContractInfo', 'r') as file:
-        data = json.load(file)
-        logging.info('Contract is :'+ json.dumps(data))
-        return data
+    path = os.getcwd()+'/src/smartContracts/smartContractInfo'
+    stamp = os.path.getmtime(path)
+    if _contractInfo.get('stamp') != stamp:
+        with open(path, 'r') as file:
+            data = json.load(file)
+            logging.info('Contract is :'+ json.dumps(data))
+            _contractInfo['stamp'] = stamp
+            _contractInfo['data'] = data
+    return _contractInfo['data']
+
@@ -1,3 +1,17 @@
-from src.smartContracts.contract_handler import *
-from src.smartContracts.zokrates_handler import *
-from src.smartContracts.contract_debugger import *
\ No newline at end of file
+""" Submodules are imported on first use of their names, so light ones do not pull in web3 """
+
+import importlib
+
+_modules = ['circuits', 'artifact_store', 'submission', 'contract_handler', 'prover', 'zokrates_handler',
+            'contract_debugger', 'proof_pipeline', 'follower', 'event_indexer', 'work_queue', 'snapshot', 'calldata']
+
+
+def __getattr__(name):
+    # `from src.smartContracts import submodule` asks for submodule itself first
+    if name in _modules:
+        return importlib.import_module(__name__ + '.' + name)
+    for module in _modules:
+        module = importlib.import_module(__name__ + '.' + module)
+        if hasattr(module, name):
+            return getattr(module, name)
+    raise AttributeError('module ' + __name__ + ' has no attribute ' + name)
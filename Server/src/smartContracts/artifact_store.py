@@ -0,0 +1,244 @@
+''' Content addressed store of proof artifacts '''
+
+import os, json, gzip, shutil, logging, threading, time
+from hashlib import sha256
+
+from src.utils import *
+from src.bitcoin.header_store import on_reorg
+from src.smartContracts.calldata import encode_proof
+
+# what happens to witness once its proof is stored: delete or compress
+WITNESS_POLICY = 'delete'
+
+_store = None
+_storeLock = threading.Lock()
+_circuitCache = {}
+
+
+def get_zokrates_directory():
+    """ Returns zokrates working directory """
+    return os.getcwd() + '/Server/src/smartContracts/zokrates'
+
+
+def file_hash(path):
+    """ Returns sha256 of file content """
+    digest = sha256()
+    with open(path, 'rb') as file:
+        for chunk in iter(lambda: file.read(1024 * 1024), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def circuit_hash(directory):
+    """ Returns hash of compiled circuit and its verification key, None if not compiled """
+    paths = [directory + '/out', directory + '/verification.key']
+    try:
+        stamp = tuple((os.path.getmtime(path), os.path.getsize(path)) for path in paths)
+    except OSError:
+        return None
+    if _circuitCache.get(directory, (None,))[0] != stamp:
+        _circuitCache[directory] = (stamp, sha256(''.join(file_hash(path) for path in paths).encode()).hexdigest())
+    return _circuitCache[directory][1]
+
+
+def to_solidity_proof(data):
+    """ Returns zokrates proof in solidity acceptable format """
+    return {
+        'a': castStrListToHex(data["proof"]["a"]),
+        'b': castNestedStrListToHex(data["proof"]["b"]),
+        'c': castStrListToHex(data["proof"]["c"]),
+        'inputs': castStrListToHex(data["inputs"]),
+    }
+
+
+def window_key(chainId, start, end):
+    return str(chainId) + ':' + str(start) + ':' + str(end)
+
+
+class ArtifactStore:
+    """ Proofs stored once per (circuit, header set) and indexed by window
+
+    `objects/<key>.json` holds zokrates proof, `index.jsonl` is append only
+    log of window entries, later entries replace earlier ones.
+    """
+
+    def __init__(self, directory=None):
+        self.directory = directory or get_zokrates_directory() + '/proofs'
+        self.objectsDirectory = self.directory + '/objects'
+        self.indexPath = self.directory + '/index.jsonl'
+        os.makedirs(self.objectsDirectory, exist_ok=True)
+        self._lock = threading.Lock()
+        # window key -> entry
+        self._windows = {}
+        # (circuit, headers) -> object key
+        self._objects = {}
+        self._load()
+
+    def _load(self):
+        if not os.path.exists(self.indexPath):
+            return
+        with open(self.indexPath, 'r') as file:
+            for line in file:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    # torn last line of interrupted write
+                    continue
+                self._apply(record)
+
+    def _apply(self, record):
+        key = window_key(record['chainId'], record['start'], record['end'])
+        if record.get('removed'):
+            self._windows.pop(key, None)
+            return
+        self._windows[key] = record
+        self._objects[(record['circuit'], record['headers'])] = record['object']
+
+    def _append(self, records):
+        with open(self.indexPath, 'a') as file:
+            file.write(''.join(json.dumps(record) + '\n' for record in records))
+        for record in records:
+            self._apply(record)
+
+    def object_path(self, key):
+        return self.objectsDirectory + '/' + key + '.json'
+
+    def lookup(self, chainId, start, end, circuit=None):
+        """ Returns window entry, optionally only if proved by given circuit """
+        entry = self._windows.get(window_key(chainId, start, end))
+        if entry is None or (circuit is not None and entry['circuit'] != circuit):
+            return None
+        return entry
+
+    def reuse(self, chainId, start, end, circuit, headers):
+        """ Records window proved by identical input before, returns entry or None """
+        with self._lock:
+            objectKey = self._objects.get((circuit, headers))
+            if objectKey is None or not os.path.exists(self.object_path(objectKey)):
+                return None
+            source = next((entry for entry in self._windows.values() if entry['object'] == objectKey), None)
+            if source is None:
+                return None
+            record = dict(source, chainId=int(chainId), start=int(start), end=int(end), created=time.time())
+            self._append([record])
+            return record
+
+    def add(self, chainId, start, end, circuit, headers, proofPath, witnessPath=None):
+        """ Stores zokrates proof of window and disposes of its witness """
+        objectKey = sha256((circuit + headers).encode()).hexdigest()
+        with open(proofPath, 'r') as file:
+            data = json.load(file)
+        with self._lock:
+            shutil.move(proofPath, self.object_path(objectKey))
+            record = {
+                'chainId': int(chainId),
+                'start': int(start),
+                'end': int(end),
+                'circuit': circuit,
+                'headers': headers,
+                'object': objectKey,
+                'proof': to_solidity_proof(data),
+                'created': time.time(),
+            }
+            # submission only concatenates encoded proofs
+            record['calldata'] = encode_proof(record['proof'])
+            self._append([record])
+
+        if witnessPath is not None and os.path.exists(witnessPath):
+            if WITNESS_POLICY == 'compress':
+                with open(witnessPath, 'rb') as source, gzip.open(witnessPath + '.gz', 'wb') as target:
+                    shutil.copyfileobj(source, target)
+            os.remove(witnessPath)
+        return record
+
+    def remove(self, chainId, start, end):
+        """ Drops window entry, its proof is removed by next gc if unreferenced """
+        with self._lock:
+            if self.lookup(chainId, start, end) is not None:
+                self._append([{'chainId': int(chainId), 'start': int(start), 'end': int(end), 'removed': True}])
+
+    def invalidate(self, chainId, start, end):
+        """ Drops entries of windows built on headers between start and end, returns their count """
+        with self._lock:
+            # window input also holds header preceding it
+            stale = [entry for entry in self._windows.values() if entry['chainId'] == int(chainId) and
+                     entry['end'] > int(start) and entry['start'] - 1 < int(end)]
+            if stale:
+                self._append([{'chainId': entry['chainId'], 'start': entry['start'], 'end': entry['end'], 'removed': True}
+                              for entry in stale])
+        return len(stale)
+
+    def entries(self, chainId=None):
+        """ Returns window entries ordered by chain and start """
+        entries = [entry for entry in self._windows.values()
+                   if chainId is None or entry['chainId'] == int(chainId)]
+        return sorted(entries, key=lambda entry: (entry['chainId'], entry['start']))
+
+    def _consecutive(self, chainId, start, end, batchSize):
+        entries = []
+        i = int(start)
+        while i < int(end):
+            entry = self.lookup(chainId, i, i + batchSize)
+            if entry is None:
+                raise ValueError('Missing proof for: ' + str(i) + ' to: ' + str(i + batchSize))
+            entries.append(entry)
+            i += batchSize
+        return entries
+
+    def load_proofs(self, chainId, start, end, batchSize=32):
+        """ Returns solidity proofs of consecutive windows between start and end """
+        return [entry['proof'] for entry in self._consecutive(chainId, start, end, batchSize)]
+
+    def load_calldata(self, chainId, start, end, batchSize=32):
+        """ Returns ABI encoded proofs of consecutive windows between start and end """
+        # entries stored before calldata was cached are encoded now
+        return [entry.get('calldata') or encode_proof(entry['proof'])
+                for entry in self._consecutive(chainId, start, end, batchSize)]
+
+    def gc(self, circuits=None):
+        """ Drops entries of circuits not in circuits, unreferenced objects and compacts index """
+        with self._lock:
+            if circuits is not None:
+                self._windows = {key: entry for key, entry in self._windows.items() if entry['circuit'] in circuits}
+            referenced = set(entry['object'] for entry in self._windows.values())
+            self._objects = {pair: key for pair, key in self._objects.items() if key in referenced}
+
+            removed = 0
+            for name in os.listdir(self.objectsDirectory):
+                if name[:-len('.json')] not in referenced:
+                    os.remove(self.objectsDirectory + '/' + name)
+                    removed += 1
+
+            # rewrite index with live entries only
+            temporary = self.indexPath + '.tmp'
+            with open(temporary, 'w') as file:
+                file.write(''.join(json.dumps(entry) + '\n' for entry in self.entries()))
+            os.replace(temporary, self.indexPath)
+        logging.info('Removed ' + str(removed) + ' unreferenced proofs')
+        return removed
+
+
+def invalidate_reorg(event):
+    """ Drops proofs of windows whose headers left best chain """
+    removed = get_artifact_store().invalidate(event['chainId'], event['height'], event['end'])
+    if removed:
+        logging.info('Invalidated ' + str(removed) + ' proofs of chain ' + str(event['chainId']) + ' after reorg')
+
+
+on_reorg(invalidate_reorg)
+
+
+def get_artifact_store():
+    """ Returns shared artifact store """
+    global _store
+    with _storeLock:
+        if _store is None:
+            _store = ArtifactStore()
+        return _store
+
+
+def reset_artifact_store():
+    """ Forgets shared artifact store, next get_artifact_store reads index again """
+    global _store
+    with _storeLock:
+        _store = None
@@ -0,0 +1,54 @@
+''' ABI encoding of submitBatches calldata without web3
+
+Input struct of HeaderList is static (16 uint256 words), so encoded proofs
+are cached with artifacts and calldata of any chunk is their concatenation
+behind fixed head.
+'''
+
+SUBMIT_SIGNATURE = 'submitBatches(uint256,(uint256[2],uint256[2][2],uint256[2],uint256[8])[],uint256,uint256)'
+WORD = 32
+# a, b, c and public inputs of single proof
+PROOF_WORDS = 16
+# gas of calldata bytes (EIP-2028)
+ZERO_BYTE_GAS = 4
+NONZERO_BYTE_GAS = 16
+# upper bound of selector and head words
+HEAD_GAS = (4 + 5 * WORD) * NONZERO_BYTE_GAS
+
+_selector = None
+
+
+def get_selector():
+    """ Returns 4 byte selector of submitBatches """
+    global _selector
+    if _selector is None:
+        from eth_utils import function_signature_to_4byte_selector
+        _selector = function_signature_to_4byte_selector(SUBMIT_SIGNATURE)
+    return _selector
+
+
+def encode_word(value):
+    # proof fields are 0x prefixed hex strings
+    return (int(value, 16) if isinstance(value, str) else int(value)).to_bytes(WORD, 'big')
+
+
+def encode_proof(proof):
+    """ Returns hex of ABI encoded Input struct from solidity proof """
+    words = list(proof['a']) + [value for pair in proof['b'] for value in pair] + list(proof['c']) + list(proof['inputs'])
+    if len(words) != PROOF_WORDS:
+        raise ValueError('Proof has ' + str(len(words)) + ' words instead of ' + str(PROOF_WORDS))
+    return b''.join(encode_word(word) for word in words).hex()
+
+
+def submit_calldata(chainId, start, end, encodedProofs):
+    """ Returns calldata of submitBatches from encoded proofs """
+    # dynamic array follows four head words
+    head = [int(chainId), 4 * WORD, int(start), int(end), len(encodedProofs)]
+    return get_selector() + b''.join(encode_word(word) for word in head) + bytes.fromhex(''.join(encodedProofs))
+
+
+def calldata_gas(data):
+    """ Returns gas paid for calldata bytes """
+    zeros = data.count(0)
+    return zeros * ZERO_BYTE_GAS + (len(data) - zeros) * NONZERO_BYTE_GAS
+
@@ -0,0 +1,73 @@
+''' Registry of header validation circuits '''
+
+import os, re, json
+
+DEFAULT_BATCH_SIZE = 32
+# hand written circuit sources, other sizes are generated from the 32 header circuit
+CIRCUIT_SOURCES = {
+    16: 'btc16HeadersValidation.zok',
+    32: 'btcValidation.zok',
+}
+TEMPLATE_SIZE = 32
+
+
+def get_zokrates_directory():
+    """ Returns zokrates working directory """
+    return os.getcwd() + '/Server/src/smartContracts/zokrates'
+
+
+def get_circuit_directory(batchSize):
+    """ Returns directory with compiled circuit and keys for batch size """
+    return get_zokrates_directory() + '/circuit' + str(int(batchSize))
+
+
+def generate_circuit_source(batchSize):
+    """ Writes circuit validating batchSize headers, returns its path """
+    batchSize = int(batchSize)
+    with open(get_zokrates_directory() + '/' + CIRCUIT_SOURCES[TEMPLATE_SIZE], 'r') as file:
+        source = file.read()
+    # only main depends on the number of headers
+    head, main = source.split('def main(')
+    main = re.sub(r'\[' + str(TEMPLATE_SIZE - 1) + r'\]', '[' + str(batchSize - 1) + ']', main)
+    main = re.sub(r'\[' + str(TEMPLATE_SIZE) + r'\]', '[' + str(batchSize) + ']', main)
+    main = main.replace('0..' + str(TEMPLATE_SIZE), '0..' + str(batchSize))
+
+    directory = get_zokrates_directory() + '/generated'
+    os.makedirs(directory, exist_ok=True)
+    path = directory + '/btc' + str(batchSize) + 'HeadersValidation.zok'
+    with open(path, 'w') as file:
+        file.write(head + 'def main(' + main)
+    return path
+
+
+def get_circuit_source(batchSize):
+    """ Returns path of circuit source for batch size """
+    batchSize = int(batchSize)
+    if batchSize < 2:
+        raise ValueError('Batch needs at least 2 headers')
+    if batchSize in CIRCUIT_SOURCES:
+        return get_zokrates_directory() + '/' + CIRCUIT_SOURCES[batchSize]
+    return generate_circuit_source(batchSize)
+
+
+def is_compiled(batchSize):
+    """ Returns true if circuit for batch size has program and keys """
+    directory = get_circuit_directory(batchSize)
+    return all(os.path.exists(directory + '/' + name) for name in ['out', 'proving.key', 'verification.key'])
+
+
+def get_circuit_info(batchSize):
+    """ Returns stored compilation info of circuit (constraints) """
+    try:
+        with open(get_circuit_directory(batchSize) + '/info.json', 'r') as file:
+            return json.load(file)
+    except (OSError, ValueError):
+        return {}
+
+
+def compiled_circuits():
+    """ Returns sorted batch sizes of compiled circuits """
+    directory = get_zokrates_directory()
+    sizes = [int(name[len('circuit'):]) for name in os.listdir(directory)
+             if re.fullmatch(r'circuit[0-9]+', name)]
+    return sorted(size for size in sizes if is_compiled(size))
@@ -1,28 +1,25 @@
-import json, logging, os, time
+import json, logging, os
 from web3 import Web3
 from src.constants import *
+from src.ethereum.client import get_web3
+from src.smartContracts.event_indexer import EventIndexer
 
-def run_debugger():
-    w3 = Web3(Web3.HTTPProvider(ETHPROVIDER))
-    logging.info('Running debugger')
+def get_event_indexer():
+    """ Indexer of deployed contract """
+    w3 = get_web3(ETHPROVIDER)
     with open(os.getcwd()+'/Server/src/smartContracts/smartContractInfo', 'r') as file:
         contract = json.load(file)
+    contractAddress = Web3.toChecksumAddress(contract['contract_address'])
+    instance = w3.eth.contract(address=contractAddress, abi=contract['abi'])
+    return EventIndexer(w3, instance, contract.get('deploy_block', 0))
 
-        contractAddress = Web3.toChecksumAddress(contract['contract_address'])
-        contract = w3.eth.contract(address=contractAddress, abi=contract['abi'])
-        loggingEvent = contract.events.Logger()
-
-        def handle_event(event):
-            logging.info('Got event')
-            receipt = w3.eth.waitForTransactionReceipt(event['transactionHash'])
-            result = loggingEvent.processReceipt(receipt)
-            print(result[0]['args'])
+def run_debugger():
+    logging.info('Running debugger')
+    indexer = get_event_indexer()
+    logging.info('Indexed ' + str(indexer.catch_up()) + ' past events')
 
-        def log_loop(event_filter, poll_interval):
-            while True:
-                for event in event_filter.get_new_entries():
-                    handle_event(event)
-                    time.sleep(poll_interval)
+    def handle_event(row):
+        logging.info('Got event ' + row['event'])
+        print(json.loads(row['args']))
 
-        block_filter = w3.eth.filter({'fromBlock':'latest', 'address':contractAddress})
-        log_loop(block_filter, 2)
\ No newline at end of file
+    indexer.follow(handle_event)
@@ -3,6 +3,12 @@
 
 from src.constants import *
 from src.ethereum.ethereum import init_eth_with_pk
+from src.smartContracts.artifact_store import get_artifact_store
+from src.smartContracts.circuits import DEFAULT_BATCH_SIZE
+from src.smartContracts.zokrates_handler import update_verifier
+from src.smartContracts.submission import Submitter, submit_proofs, GAS_CAP, GAS_MARGIN, GAS_PRICE_MULTIPLIER, \
+    get_code_hash, calibrate_gas_model, save_gas_model
+from src.bitcoin.checkpoints import work_to_difficulty
 import json
 import subprocess
 import os
@@ -70,19 +76,28 @@ def deploy_contract(contractInterface, account, w3):
         return {'error': err}
 
 
-def build_and_deploy(account, w3):
-    """ build and deploy contract """
+def build_and_deploy(account, w3, batchSize=DEFAULT_BATCH_SIZE):
+    """ build and deploy contract verifying batches of batchSize headers """
     if w3.isConnected():
+        update_verifier(batchSize)
         contract = compile_contract()
+        # events of contract are indexed from here
+        deployBlock = w3.eth.blockNumber
+        address = deploy_contract(contract, account, w3)
         data = {
             'abi': contract['abi'],
-            'contract_address': deploy_contract(contract, account, w3)
+            'contract_address': address,
+            'batch_size': int(batchSize),
+            'deploy_block': deployBlock,
         }
+        # gas models are looked up offline by code hash
+        if isinstance(address, str):
+            data['code_hash'] = get_code_hash(w3, address)
         return data
     return False
 
 
-def send_batches_to_contract(blockchainId, start, end, account, w3, contract_address, abi):
+def send_batches_to_contract(blockchainId, start, end, account, w3, contract_address, abi, batchSize=DEFAULT_BATCH_SIZE, gasCap=GAS_CAP):
     """ Send inputs to contract method """
     if(w3.isConnected()):
         contract = w3.eth.contract(
@@ -93,38 +108,13 @@ def send_batches_to_contract(blockchainId, start, end, account, w3, contract_add
         end = str(end)
                 
         try:
-            proofs = []
-            i = int(start)
-            while i < int(end):
-                file = open(os.getcwd()+'/Server/src/smartContracts/zokrates/solidity'+ blockchainId + str(i) + str(i+32), "r")
-                input = json.load(file)
-                proofs.append(input["proof"])
-                i += 32
+            proofs = get_artifact_store().load_calldata(blockchainId, start, end, batchSize)
             if proofs == []:
                 raise ValueError('No proofs found')
-
             logging.info('Loaded input proofs')
-            gasMultiplier = 2
-            # get gas
-            gasPrice = w3.eth.generate_gas_price() * gasMultiplier
-            
-            logging.info('GasPrice: ' + str(gasPrice))
-
-            nonce = w3.eth.getTransactionCount(account.address)
-            logging.info('Building transaction...')
-            transaction = contract.functions.submitBatches(
-                int(blockchainId), proofs, int(start), int(end)).buildTransaction({'nonce': nonce, 'gasPrice': gasPrice})
-
-            # estimate gas
-            estgas = w3.eth.estimate_gas(transaction)
-            logging.info('Estimated gas: ' + str(estgas))                    
-
-            signed_transaction = w3.eth.account.sign_transaction(transaction, PRIVATE_KEY)
-            logging.info('Transaction created')
-            tx_hash = w3.eth.send_raw_transaction(signed_transaction.rawTransaction)
-            logging.info('Transaction sent')
-            tx_receipt = w3.eth.wait_for_transaction_receipt(tx_hash)
-            logging.info(tx_receipt)
+
+            # sends gas capped transactions with consecutive nonces and waits for all at once
+            return submit_proofs(Submitter(w3, account), contract, blockchainId, start, proofs, batchSize, gasCap)
         except Exception as err:
             logging.error(err)
             logging.error('Failed to submit batches')
@@ -132,6 +122,52 @@ def send_batches_to_contract(blockchainId, start, end, account, w3, contract_add
 
 
 
+def calibrate_contract(account, w3, contract_address, chainId, start, batchSize=DEFAULT_BATCH_SIZE):
+    """ Calibrates gas model of contract code with stored proofs at start, returns code hash and model """
+    if(w3.isConnected()):
+        try:
+            proofs = []
+            # up to three proofs are estimated
+            for i in range(3):
+                begin = int(start) + i * batchSize
+                if get_artifact_store().lookup(chainId, begin, begin + batchSize) is None:
+                    break
+                proofs += get_artifact_store().load_calldata(chainId, begin, begin + batchSize, batchSize)
+            if proofs == []:
+                raise ValueError('No proofs found')
+            codeHash = get_code_hash(w3, contract_address)
+            model = calibrate_gas_model(w3, contract_address, account, chainId, start, proofs, batchSize)
+            save_gas_model(codeHash, batchSize, model)
+            logging.info('Gas model: ' + json.dumps(model))
+            return {'code_hash': codeHash, 'model': model}
+        except Exception as err:
+            logging.error(err)
+            logging.error('Failed to calibrate gas model')
+    return False
+
+
+def setup_checkpoint(account, w3, contract_address, abi, chainId, checkpoint, batchSize=DEFAULT_BATCH_SIZE):
+    """ Starts chain in contract at checkpoint, returns receipt """
+    if(w3.isConnected()):
+        contract = w3.eth.contract(
+            address=contract_address,
+            abi=abi
+        )
+        try:
+            function = contract.functions.setupCheckpoint(
+                int(chainId), int(checkpoint['hash'], 16), checkpoint['height'], work_to_difficulty(checkpoint['work'], batchSize))
+            submitter = Submitter(w3, account)
+            txHash = submitter.send(function, int(function.estimateGas({'from': account.address}) * GAS_MARGIN),
+                                    w3.eth.generate_gas_price() * GAS_PRICE_MULTIPLIER)
+            receipt = submitter.wait_for_receipts([txHash])[0]
+            logging.info('Checkpoint of chain ' + str(chainId) + ' status: ' + str(receipt['status']))
+            return receipt
+        except Exception as err:
+            logging.error(err)
+            logging.error('Failed to set up checkpoint')
+    return False
+
+
 def get_closest_hash(account, w3, contract_address, abi, height, chainId):
     """ Calls contract method """
     if(w3.isConnected()):
@@ -0,0 +1,57 @@
+// SPDX-License-Identifier: MIT
+pragma solidity ^0.8.0;
+pragma experimental ABIEncoderV2;
+
+import "./verifier.sol" as verifier;
+import "./Structures.sol";
+
+/// @dev Groth16 verification of many proofs of exported verifier in one multi pairing.
+contract BatchVerifier is verifier.Verifier {
+    uint256 constant SNARK_SCALAR_FIELD = 21888242871839275222246405745257275088548364400416034343698204186575808495617;
+
+    /// @dev Folds proofs by random linear combination and checks
+    /// prod e(r_i*A_i, B_i) * e(-sum r_i*vk_x_i, gamma) * e(-sum r_i*C_i, delta) * e(-sum r_i*alpha, beta) == 1.
+    /// Randomness is hash of all proofs and inputs so it is fixed before they are.
+    /// @param inputs Array of inputs containing proof and zok argument.
+    /// @return bool True if all proofs are valid.
+    function verifyBatch(Input[] memory inputs) public view returns (bool) {
+        VerifyingKey memory vk = verifyingKey();
+        require(vk.gamma_abc.length == 9);
+        uint n = inputs.length;
+        verifier.Pairing.G1Point[] memory p1 = new verifier.Pairing.G1Point[](n + 3);
+        verifier.Pairing.G2Point[] memory p2 = new verifier.Pairing.G2Point[](n + 3);
+
+        bytes32 seed = keccak256(abi.encode(inputs));
+        uint256 rSum = 0;
+        // sum of r_i * input_i[j], so vk_x needs only one scalar mul per input position
+        uint256[8] memory inputSums;
+        verifier.Pairing.G1Point memory cSum = verifier.Pairing.G1Point(0, 0);
+
+        for (uint i = 0; i < n; i++) {
+            // 128 bit coefficients are enough for soundness and keep scalar muls cheap
+            uint256 r = uint256(keccak256(abi.encode(seed, i))) >> 128;
+            for (uint j = 0; j < 8; j++) {
+                require(inputs[i].inputs[j] < SNARK_SCALAR_FIELD);
+                inputSums[j] = addmod(inputSums[j], mulmod(r, inputs[i].inputs[j], SNARK_SCALAR_FIELD), SNARK_SCALAR_FIELD);
+            }
+            rSum = addmod(rSum, r, SNARK_SCALAR_FIELD);
+            p1[i] = verifier.Pairing.scalar_mul(verifier.Pairing.G1Point(inputs[i].a[0], inputs[i].a[1]), r);
+            p2[i] = verifier.Pairing.G2Point(inputs[i].b[0], inputs[i].b[1]);
+            cSum = verifier.Pairing.addition(
+                cSum, verifier.Pairing.scalar_mul(verifier.Pairing.G1Point(inputs[i].c[0], inputs[i].c[1]), r));
+        }
+
+        verifier.Pairing.G1Point memory vkX = verifier.Pairing.scalar_mul(vk.gamma_abc[0], rSum);
+        for (uint j = 0; j < 8; j++) {
+            vkX = verifier.Pairing.addition(vkX, verifier.Pairing.scalar_mul(vk.gamma_abc[j + 1], inputSums[j]));
+        }
+
+        p1[n] = verifier.Pairing.negate(vkX);
+        p2[n] = vk.gamma;
+        p1[n + 1] = verifier.Pairing.negate(cSum);
+        p2[n + 1] = vk.delta;
+        p1[n + 2] = verifier.Pairing.negate(verifier.Pairing.scalar_mul(vk.alpha, rSum));
+        p2[n + 2] = vk.beta;
+        return verifier.Pairing.pairing(p1, p2);
+    }
+}
@@ -5,36 +5,44 @@ pragma experimental ABIEncoderV2;
 import "./verifier.sol" as verifier;
 import "./Utils.sol" as utils;
 import "./Structures.sol";
+import "./BatchVerifier.sol";
 
-contract HeaderList {
+contract HeaderList is BatchVerifier {
     mapping(uint => Chain) chains;
+    address owner;
     event Logger(string message, uint256 someNum1, uint256 someNum2,uint256 someNum3);
+    event BatchesSubmitted(uint indexed chainId, uint256 startHeight, uint256 endHeight, uint256 lastHash, uint256 forkNumber);
 
     /// @dev Create new blockchain.
     constructor() {
+        owner = msg.sender;
         // init chain 0 with btc genesis
         setupChain(
             0,
             0x000000000019d6689c085ae165831e934ff763ae46a2a6c172b3f1b60a8ce26f,
+            1,
             1
         );
         // init chain 1 with btc block 729300 (for testing)
         setupChain(
             1,
             0x00000000000000000002a6a5843409a1e07c20f2ad1047d07491e5b86ae09f03,
-            729300
+            729300,
+            1
         );
         // init chain 2 with bch genesis
         setupChain(
             2,
             0x000000000019d6689c085ae165831e934ff763ae46a2a6c172b3f1b60a8ce26f,
+            1,
             1
         );
         // init chain 3 with bch block 735600 (for testing)
         setupChain(
             3,
             0x000000000000000002a31d4ad805018f78dc3c1b0e915f11a76fc38019562708,
-            735600
+            735600,
+            1
         );
     }
 
@@ -42,7 +50,8 @@ contract HeaderList {
     function setupChain(
         uint chainId,
         uint256 genesis,
-        uint256 initHeight
+        uint256 initHeight,
+        uint256 initDifficulty
     ) private {
         chains[chainId].genesisHash = genesis;
         chains[chainId].mainFork = 0;
@@ -51,11 +60,29 @@ contract HeaderList {
         chains[chainId].forks[0].previousFork = 0;
         chains[chainId].forks[0].previousHeight = 0;
         chains[chainId].forks[0].batches[0].height = initHeight;
-        chains[chainId].forks[0].batches[0].cumulativeDifficulty = 1;
+        chains[chainId].forks[0].batches[0].cumulativeDifficulty = initDifficulty;
         chains[chainId].forks[0].batches[0].lastHeaderHash = chains[chainId]
             .genesisHash;
     }
 
+    /// @dev Start new blockchain at trusted checkpoint.
+    /// @param chainId id of new blockchain, must not be set up yet.
+    /// @param checkpointHash Hash of checkpoint header.
+    /// @param height Height of checkpoint header.
+    /// @param cumulativeDifficulty Difficulty of chain up to checkpoint in units of
+    /// submitBatches, which adds difficulty of first header once per batch, i.e.
+    /// chain difficulty divided by batch size.
+    function setupCheckpoint(
+        uint chainId,
+        uint256 checkpointHash,
+        uint256 height,
+        uint256 cumulativeDifficulty
+    ) public {
+        require(msg.sender == owner);
+        require(chains[chainId].forkCount == 0);
+        setupChain(chainId, checkpointHash, height, cumulativeDifficulty);
+    }
+
     /// @dev Find fork contining hash at number or create a new one.
     /// @param chainId id of current blockchain  0,1 - btc 2,3 -bch
     /// @param prevHash Hash that we search for.
@@ -105,7 +132,6 @@ contract HeaderList {
         uint256 endHeight
     ) public {
         Chain storage headerChain = chains[chainId];
-        verifier.Verifier ver = new verifier.Verifier();
         Output memory firstInput = utils.parseInput(inputs[0].inputs);
         Output memory lastInput = utils.parseInput(inputs[inputs.length-1].inputs);
         Output memory result;
@@ -123,18 +149,19 @@ contract HeaderList {
 
         // check that all inputs are vailid and in a chain
         for (uint i=0; i<inputs.length; i++){
-            Input memory input = inputs[i];
-            verifier.Verifier.Proof memory proof = utils.createProof(input);
-
-            Output memory output = utils.parseInput(input.inputs);
+            Output memory output = utils.parseInput(inputs[i].inputs);
             // must have at least under maximum target refs https://en.bitcoin.it/wiki/Target
             require(output.lastHash < 0x00000000FFFF0000000000000000000000000000000000000000000000000000);
-            // verify batch correctness
-            require(ver.verifyTx(proof, input.inputs));
             // verify that batches form chain
             require(currentHash == output.prevHash);
             currentHash = output.lastHash;
         }
+        // verify batch correctness, folded check of several proofs costs one pairing per proof plus three
+        if (inputs.length == 1) {
+            require(verifyTx(utils.createProof(inputs[0]), inputs[0].inputs));
+        } else {
+            require(verifyBatch(inputs));
+        }
 
         // store all input batches as single cumulated batch
         fork.forkHeight = result.number;
@@ -163,6 +190,7 @@ contract HeaderList {
                 headerChain.mainFork = forkNumber;
             }
         }
+        emit BatchesSubmitted(chainId, startHeight, endHeight, result.lastHash, forkNumber);
     }
 
     event ClosestHash(uint256);
@@ -0,0 +1,136 @@
+''' Contract event indexer backed by sqlite '''
+
+import os, json, logging, sqlite3, threading, time
+from eth_utils import event_abi_to_log_topic
+
+# blocks requested by single get_logs, halved when provider refuses range
+LOG_CHUNK = 2000
+POLL_INTERVAL = 2
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS events (
+    block INTEGER NOT NULL,
+    log_index INTEGER NOT NULL,
+    tx TEXT NOT NULL,
+    event TEXT NOT NULL,
+    chain_id INTEGER,
+    start_height INTEGER,
+    end_height INTEGER,
+    hash TEXT,
+    args TEXT NOT NULL,
+    PRIMARY KEY (block, log_index)
+);
+CREATE INDEX IF NOT EXISTS events_chain ON events (chain_id, end_height);
+CREATE INDEX IF NOT EXISTS events_tx ON events (tx);
+CREATE TABLE IF NOT EXISTS cursor (
+    address TEXT PRIMARY KEY,
+    block INTEGER NOT NULL
+);
+'''
+
+
+def get_event_database_path():
+    return os.getcwd() + '/Server/src/smartContracts/events.db'
+
+
+def to_row(event):
+    """ Returns events table row of decoded log """
+    args = dict(event['args'])
+    row = {
+        'block': event['blockNumber'],
+        'log_index': event['logIndex'],
+        'tx': event['transactionHash'].hex(),
+        'event': event['event'],
+        'chain_id': None,
+        'start_height': None,
+        'end_height': None,
+        'hash': None,
+        'args': json.dumps(args),
+    }
+    if event['event'] == 'BatchesSubmitted':
+        row.update(chain_id=args['chainId'], start_height=args['startHeight'], end_height=args['endHeight'],
+                   hash='0x' + format(args['lastHash'], '064x'))
+    return row
+
+
+class EventIndexer:
+    """ Copies contract events into sqlite, backfilling in chunks then following new blocks """
+
+    def __init__(self, w3, contract, startBlock=0, path=None):
+        self.w3 = w3
+        self.contract = contract
+        self.startBlock = startBlock
+        self.database = sqlite3.connect(path or get_event_database_path(), check_same_thread=False)
+        self.database.row_factory = sqlite3.Row
+        self.database.executescript(SCHEMA)
+        self._lock = threading.Lock()
+        # log topic -> event decoder
+        self.decoders = {event_abi_to_log_topic(abi): getattr(contract.events, abi['name'])()
+                         for abi in contract.abi if abi['type'] == 'event'}
+
+    def last_block(self):
+        """ Returns last indexed block """
+        rows = self.query('SELECT block FROM cursor WHERE address = ?', (self.contract.address,))
+        return rows[0]['block'] if rows else self.startBlock - 1
+
+    def decode(self, log):
+        decoder = self.decoders.get(bytes(log['topics'][0])) if log['topics'] else None
+        return decoder.processLog(log) if decoder else None
+
+    def index_range(self, fromBlock, toBlock):
+        """ Indexes events between blocks inclusive, returns number of events """
+        logs = self.w3.eth.get_logs({'address': self.contract.address, 'fromBlock': fromBlock, 'toBlock': toBlock})
+        rows = [to_row(event) for event in map(self.decode, logs) if event is not None]
+        with self._lock, self.database:
+            self.database.executemany(
+                'INSERT OR REPLACE INTO events VALUES '
+                '(:block, :log_index, :tx, :event, :chain_id, :start_height, :end_height, :hash, :args)', rows)
+            self.database.execute('INSERT OR REPLACE INTO cursor VALUES (?, ?)', (self.contract.address, toBlock))
+        return len(rows)
+
+    def catch_up(self):
+        """ Indexes blocks from cursor to chain head, returns number of events """
+        head = self.w3.eth.blockNumber
+        block = self.last_block() + 1
+        chunk = LOG_CHUNK
+        count = 0
+        while block <= head:
+            end = min(block + chunk - 1, head)
+            try:
+                count += self.index_range(block, end)
+            except ValueError as err:
+                # provider limits range or number of results
+                if chunk == 1:
+                    raise
+                chunk = max(chunk // 2, 1)
+                logging.warning("Error '{0}' occurred, requesting {1} blocks.".format(err, chunk))
+                continue
+            block = end + 1
+            # dense ranges pass, so widen again up to limit
+            chunk = min(chunk * 2, LOG_CHUNK)
+        return count
+
+    def follow(self, callback=None):
+        """ Indexes new blocks forever, callback(row) is called for each new event """
+        while True:
+            try:
+                last = self.last_block()
+                if self.catch_up() and callback is not None:
+                    for row in self.query('SELECT * FROM events WHERE block > ? ORDER BY block, log_index', (last,)):
+                        callback(row)
+            except Exception as err:
+                logging.error("Error '{0}' occurred.".format(err))
+            time.sleep(POLL_INTERVAL)
+
+    def query(self, sql, parameters=()):
+        with self._lock:
+            return [dict(row) for row in self.database.execute(sql, parameters)]
+
+    def submissions(self, chainId, start=0, end=2**63 - 1):
+        """ Returns batch submissions of chain ending between start and end """
+        return self.query('SELECT * FROM events WHERE event = ? AND chain_id = ? AND end_height BETWEEN ? AND ? '
+                          'ORDER BY end_height', ('BatchesSubmitted', int(chainId), int(start), int(end)))
+
+    def transaction_events(self, txHash):
+        """ Returns events emitted by transaction """
+        return self.query('SELECT * FROM events WHERE tx = ? ORDER BY log_index', (txHash,))
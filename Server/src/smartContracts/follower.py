@@ -0,0 +1,166 @@
+''' Chain follower proving and relaying new windows '''
+
+import os, json, logging, threading, time
+
+from src.bitcoin.jsonRPC import syncHeaders, getBlockHeaders
+from src.bitcoin.header_store import on_reorg, off_reorg
+from src.smartContracts.circuits import DEFAULT_BATCH_SIZE
+from src.smartContracts.proof_pipeline import ProofPipeline, get_windows, get_worker_count
+from src.smartContracts.artifact_store import get_artifact_store
+from src.smartContracts.submission import submit_proofs, GAS_CAP
+from src.utils.rate_limit import FairScheduler
+
+# blocks on top of window before it is proved, shallow reorgs never reach the contract
+CONFIRMATIONS = 6
+# tip polling backs off while no block arrives
+MIN_POLL_INTERVAL = 15
+MAX_POLL_INTERVAL = 240
+
+
+def get_cursor_path(chainId):
+    return os.getcwd() + '/Server/src/smartContracts/followerCursor' + str(chainId)
+
+
+def load_cursor(chainId, start):
+    """ Returns persisted cursor or new one starting at start """
+    try:
+        with open(get_cursor_path(chainId), 'r') as file:
+            return json.load(file)
+    except (OSError, ValueError):
+        return {'start': int(start), 'proved': int(start), 'submitted': int(start)}
+
+
+def save_cursor(chainId, cursor):
+    """ Atomically persists cursor """
+    temporary = get_cursor_path(chainId) + '.tmp'
+    with open(temporary, 'w') as file:
+        file.write(json.dumps(cursor))
+    os.replace(temporary, get_cursor_path(chainId))
+
+
+class ChainFollower:
+    """ Proves windows as soon as they are confirmed and submits them
+
+    `proved` is start of first unproved window, `submitted` start of first
+    window not yet accepted by the contract, both survive restarts.
+    """
+
+    def __init__(self, chainId, start, submitter=None, contract=None, batchSize=DEFAULT_BATCH_SIZE,
+                 workers=None, gasCap=GAS_CAP, scheduler=None):
+        self.chainId = str(chainId)
+        self.submitter = submitter
+        self.contract = contract
+        self.batchSize = int(batchSize)
+        self.workers = workers
+        self.gasCap = gasCap
+        self.scheduler = scheduler
+        self.cursor = load_cursor(chainId, start)
+        on_reorg(self.rewind)
+
+    def rewind(self, event):
+        """ Moves cursor back to first window built on replaced headers """
+        if str(event['chainId']) != self.chainId:
+            return
+        for name in ['proved', 'submitted']:
+            # window input also holds header preceding it
+            while self.cursor[name] > max(event['height'], self.cursor.get('start', 0)):
+                self.cursor[name] -= self.batchSize
+        save_cursor(self.chainId, self.cursor)
+        logging.info('Rewound to ' + str(self.cursor['submitted']) + ' after reorg at ' + str(event['height']))
+
+    def _complete_windows(self, tip):
+        """ Returns windows from cursor that are complete and confirmed """
+        last = tip - CONFIRMATIONS + 1
+        windows = get_windows(self.cursor['proved'], last, self.batchSize)
+        return [window for window in windows if window[1] <= last]
+
+    def prove(self, tip):
+        """ Proves all confirmed windows, advances cursor over proved prefix """
+        windows = self._complete_windows(tip)
+        if windows == []:
+            return 0
+        result = ProofPipeline(self.chainId, self.workers, self.batchSize, self.scheduler).run(windows[0][0], windows[-1][1])
+        if self.cursor['proved'] != windows[0][0]:
+            # rewound by reorg while proving
+            return 0
+        done = set(result['proved']) | set(result['skipped'])
+        proved = 0
+        for window in windows:
+            if window not in done:
+                break
+            self.cursor['proved'] = window[1]
+            proved += 1
+        save_cursor(self.chainId, self.cursor)
+        return proved
+
+    def submit(self):
+        """ Submits proved windows not yet in contract """
+        if self.submitter is None or self.cursor['submitted'] >= self.cursor['proved']:
+            return 0
+        start = self.cursor['submitted']
+        proofs = get_artifact_store().load_calldata(self.chainId, start, self.cursor['proved'], self.batchSize)
+        results = submit_proofs(self.submitter, self.contract, self.chainId, start, proofs, self.batchSize, self.gasCap)
+        submitted = 0
+        for result in results:
+            if result['receipt']['status'] != 1 or self.cursor['submitted'] != result['start']:
+                break
+            self.cursor['submitted'] = result['end']
+            submitted += (result['end'] - result['start']) // self.batchSize
+            self.log_latency(result['end'])
+        save_cursor(self.chainId, self.cursor)
+        return submitted
+
+    def log_latency(self, end):
+        """ Logs time between last relayed block and its submission """
+        header = getBlockHeaders(int(self.chainId), end - 1, end)[0]
+        latency = time.time() - header.fields[3]
+        logging.info('Relayed up to ' + str(end) + ' in ' + str(int(latency)) + 's after block')
+
+    def step(self):
+        """ Single follow iteration, returns current tip """
+        # reorgs found on the way rewind cursor
+        tip = syncHeaders(int(self.chainId))
+        if self.prove(tip):
+            logging.info('Proved up to ' + str(self.cursor['proved']))
+        if self.submit():
+            logging.info('Submitted up to ' + str(self.cursor['submitted']))
+        return tip
+
+    def close(self):
+        """ Stops listening for reorgs """
+        off_reorg(self.rewind)
+
+    def run(self):
+        """ Follows chain until interrupted """
+        interval = MIN_POLL_INTERVAL
+        lastTip = None
+        try:
+            while True:
+                try:
+                    tip = self.step()
+                    # back off while chain does not move
+                    interval = MIN_POLL_INTERVAL if tip != lastTip else min(interval * 2, MAX_POLL_INTERVAL)
+                    lastTip = tip
+                except Exception as err:
+                    logging.error("Error '{0}' occurred.".format(err))
+                    interval = min(interval * 2, MAX_POLL_INTERVAL)
+                time.sleep(interval)
+        finally:
+            self.close()
+
+
+def follow_chains(chains, submitter=None, contract=None, batchSize=DEFAULT_BATCH_SIZE, workers=None, gasCap=GAS_CAP):
+    """ Follows (chainId, start) chains at once
+
+    Provers are shared round robin between chains and all transactions go
+    through one submitter so nonces do not collide.
+    """
+    scheduler = FairScheduler(workers or get_worker_count())
+    followers = [ChainFollower(chainId, start, submitter, contract, batchSize, scheduler.free, gasCap, scheduler)
+                 for chainId, start in chains]
+    threads = [threading.Thread(target=follower.run, name='follow-' + follower.chainId, daemon=True)
+               for follower in followers]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
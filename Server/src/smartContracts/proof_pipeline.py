@@ -0,0 +1,167 @@
+''' Parallel multi-window proof generation '''
+
+import os, logging, threading, json
+from concurrent.futures import ThreadPoolExecutor
+
+from src.bitcoin.jsonRPC import getHeadersBuffer
+from src.bitcoin.btc_zok_utils import get_header_getter
+from src.bitcoin.header_validation import validate_headers, invalid_windows
+from src.smartContracts.circuits import DEFAULT_BATCH_SIZE, is_compiled
+from src.smartContracts.zokrates_handler import create_input, reuse_proof, compute_witness, generate_proof, export_proof, get_artifact_path, is_proved
+
+# estimated peak memory of single zokrates witness/proof process
+PROOF_MEMORY = 4 * 1024**3
+# concurrent header fetches, these only wait on the provider
+FETCH_WORKERS = 4
+STAGES = ['fetch', 'witness', 'proof']
+
+
+def get_available_memory():
+    """ Returns available memory in bytes or None if unknown """
+    try:
+        with open('/proc/meminfo', 'r') as file:
+            for line in file:
+                if line.startswith('MemAvailable:'):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return None
+
+
+def get_worker_count():
+    """ Returns number of concurrent provers fitting into cores and memory """
+    workers = os.cpu_count() or 1
+    memory = get_available_memory()
+    if memory is not None:
+        workers = min(workers, memory // PROOF_MEMORY)
+    return max(1, workers)
+
+
+def get_windows(start, end, batchSize=DEFAULT_BATCH_SIZE):
+    """ Returns list of (start, end) windows covering range """
+    windows = []
+    i = int(start)
+    while i < int(end):
+        windows.append((i, i + batchSize))
+        i += batchSize
+    return windows
+
+
+class ProofPipeline:
+    """ Overlaps header fetching, witness computation and proof generation of windows """
+
+    def __init__(self, chainId, workers=None, batchSize=DEFAULT_BATCH_SIZE, scheduler=None):
+        self.chainId = str(chainId)
+        self.batchSize = int(batchSize)
+        self.workers = workers or get_worker_count()
+        # provers shared with pipelines of other chains
+        self.scheduler = scheduler
+        self._lock = threading.Lock()
+        self._proveFutures = []
+        self.total = 0
+        self.progress = {stage: 0 for stage in STAGES}
+        self.proved = []
+        self.skipped = []
+        self.failed = []
+
+    def _report(self, stage, window):
+        with self._lock:
+            self.progress[stage] += 1
+            status = ' '.join(stage + ': ' + str(self.progress[stage]) + '/' + str(self.total) for stage in STAGES)
+        logging.info('Window ' + str(window[0]) + ' to ' + str(window[1]) + ' ' + stage + ' done | ' + status)
+
+    def _fail(self, stage, window):
+        logging.error('Window ' + str(window[0]) + ' to ' + str(window[1]) + ' failed in ' + stage)
+        with self._lock:
+            self.failed.append({'start': window[0], 'end': window[1], 'stage': stage})
+
+    def _fetch(self, window, provePool):
+        if not create_input(self.chainId, *window):
+            return self._fail('fetch', window)
+        self._report('fetch', window)
+        # identical input was proved before
+        if reuse_proof(self.chainId, *window):
+            self._report('witness', window)
+            self._report('proof', window)
+            with self._lock:
+                self.proved.append(window)
+            return
+        with self._lock:
+            self._proveFutures.append(provePool.submit(self._prove, window))
+
+    def _prove(self, window):
+        if self.scheduler is None:
+            return self._prove_window(window)
+        with self.scheduler.slot(self.chainId):
+            return self._prove_window(window)
+
+    def _prove_window(self, window):
+        if not compute_witness(self.chainId, *window):
+            return self._fail('witness', window)
+        self._report('witness', window)
+        if not (generate_proof(self.chainId, *window) and export_proof(self.chainId, *window)):
+            return self._fail('proof', window)
+        self._report('proof', window)
+        with self._lock:
+            self.proved.append(window)
+
+    def _prevalidate(self, windows):
+        """ Validates headers of all windows at once, returns windows worth proving """
+        if windows == []:
+            return windows
+        begining = windows[0][0] - 1
+        end = windows[-1][1]
+        try:
+            buffer = getHeadersBuffer(int(self.chainId), begining, end)
+            report = validate_headers(self.chainId, buffer, begining, get_header_getter(self.chainId))
+        except Exception as err:
+            logging.error("Error '{0}' occurred.".format(err))
+            self.failed.extend({'start': window[0], 'end': window[1], 'stage': 'fetch'} for window in windows)
+            return []
+
+        # machine readable report next to window artifacts
+        with open(get_artifact_path('validation', self.chainId, begining + 1, end), 'w') as file:
+            file.write(json.dumps(report))
+        invalid = invalid_windows(report, windows)
+        if invalid != []:
+            logging.error('Rejected ' + str(len(invalid)) + ' windows with invalid headers: ' +
+                          json.dumps(report['errors']))
+        self.failed.extend({'start': window[0], 'end': window[1], 'stage': 'validation'} for window in invalid)
+        return [window for window in windows if window not in invalid]
+
+    def run(self, start, end):
+        """ Proves all windows in range, windows with existing proofs are skipped """
+        if not is_compiled(self.batchSize):
+            logging.error('No compiled circuit for batches of ' + str(self.batchSize) + ' headers')
+            self.failed = [{'start': window[0], 'end': window[1], 'stage': 'compile'}
+                           for window in get_windows(start, end, self.batchSize)]
+            return {'proved': [], 'skipped': [], 'failed': self.failed}
+        windows = []
+        for window in get_windows(start, end, self.batchSize):
+            if is_proved(self.chainId, *window):
+                self.skipped.append(window)
+            else:
+                windows.append(window)
+        windows = self._prevalidate(windows)
+        self.total = len(windows)
+        logging.info('Proving ' + str(self.total) + ' windows with ' + str(self.workers) +
+                     ' workers, skipping ' + str(len(self.skipped)) + ' already proved')
+
+        with ThreadPoolExecutor(self.workers) as provePool:
+            with ThreadPoolExecutor(FETCH_WORKERS) as fetchPool:
+                fetchFutures = [fetchPool.submit(self._fetch, window, provePool) for window in windows]
+            for future in fetchFutures + self._proveFutures:
+                # surface unexpected exceptions from workers
+                if future.exception() is not None:
+                    logging.error("Error '{0}' occurred.".format(future.exception()))
+
+        return {
+            'proved': sorted(self.proved),
+            'skipped': self.skipped,
+            'failed': sorted(self.failed, key=lambda fail: fail['start']),
+        }
+
+
+def run_proof_pipeline(chainId, start, end, workers=None, batchSize=DEFAULT_BATCH_SIZE):
+    """ Generates proofs for all windows between start and end in parallel """
+    return ProofPipeline(chainId, workers, batchSize).run(start, end)
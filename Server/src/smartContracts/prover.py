@@ -0,0 +1,104 @@
+''' Prover backends '''
+
+import subprocess, os, logging, threading, tempfile
+
+from src.utils.metrics import Histogram, BYTE_BUCKETS
+
+proverPeakMemory = Histogram('zk_prover_peak_rss_bytes', 'Peak resident memory of zokrates process', BYTE_BUCKETS)
+
+_toolchainReady = False
+_toolchainLock = threading.Lock()
+_provers = {}
+_proversLock = threading.Lock()
+
+
+def zokrates_available(working_directory):
+    """ Returns true if zokrates binary runs """
+    try:
+        return subprocess.run(['zokrates', '--version'], cwd=working_directory, capture_output=True).returncode == 0
+    except OSError:
+        return False
+
+
+def ensure_zokrates(working_directory):
+    """ Install and init zokrates if missing, checked once per process """
+    global _toolchainReady
+    with _toolchainLock:
+        if _toolchainReady:
+            return
+        zokratesBin = os.environ['HOME'] + '/.zokrates/bin'
+        if zokratesBin not in os.environ['PATH'].split(':'):
+            os.environ['PATH'] = os.environ['PATH'] + ':' + zokratesBin
+        os.environ['ZOKRATES_HOME'] = os.environ['HOME'] + '/.zokrates/stdlib'
+        _toolchainReady = zokrates_available(working_directory)
+        if not _toolchainReady:
+            # get zokrates
+            subprocess.run('curl -LSfs get.zokrat.es | sh', shell=True, cwd=working_directory)
+            _toolchainReady = zokrates_available(working_directory)
+
+
+class ZokratesProver:
+    """ Prover backed by zokrates cli
+
+    Witness arguments are streamed through stdin, so window size is not bound
+    by command line length, and no shell is started for any step.
+    """
+
+    def __init__(self, working_directory, program='out', provingKey='proving.key'):
+        self.working_directory = working_directory
+        self.program = program
+        self.provingKey = provingKey
+
+    def _run(self, args, input=None):
+        ensure_zokrates(self.working_directory)
+        with tempfile.TemporaryFile() as errors:
+            process = subprocess.Popen(['zokrates'] + args, stdin=subprocess.PIPE if input is not None else subprocess.DEVNULL,
+                                       stdout=subprocess.DEVNULL, stderr=errors, cwd=self.working_directory)
+            brokenPipe = False
+            try:
+                if input is not None:
+                    with process.stdin:
+                        process.stdin.write(input.encode())
+            except BrokenPipeError:
+                # zokrates exited before reading whole input
+                brokenPipe = True
+            finally:
+                # reaped here instead of by popen to get resource usage of this process only
+                _, status, usage = os.wait4(process.pid, 0)
+            process.returncode = os.waitstatus_to_exitcode(status)
+            # kilobytes on linux
+            proverPeakMemory.observe(usage.ru_maxrss * 1024, step=args[0])
+            if process.returncode != 0 or brokenPipe:
+                errors.seek(0)
+                logging.error('zokrates ' + args[0] + ' failed: ' + errors.read().decode(errors='replace').strip()[-1000:])
+                return False
+        return True
+
+    def compute_witness(self, input, witnessPath):
+        """ Computes witness for space separated arguments """
+        return self._run(['compute-witness', '-i', self.program, '-o', witnessPath, '--stdin'], input)
+
+    def generate_proof(self, witnessPath, proofPath):
+        """ Generates proof from witness """
+        return self._run(['generate-proof', '-i', self.program, '-p', self.provingKey,
+                          '-w', witnessPath, '-j', proofPath])
+
+    def verify(self, proofPath, verificationKey='verification.key'):
+        """ Returns true if zokrates accepts proof with verification key """
+        ensure_zokrates(self.working_directory)
+        result = subprocess.run(['zokrates', 'verify', '-j', proofPath, '-v', verificationKey],
+                                capture_output=True, cwd=self.working_directory)
+        # rejected proof exits with zero as well
+        if result.returncode != 0 or b'PASSED' not in result.stdout:
+            logging.error('zokrates verify rejected ' + proofPath)
+            return False
+        return True
+
+
+def get_prover(working_directory, program='out', provingKey='proving.key'):
+    """ Returns shared prover for circuit """
+    key = (working_directory, program, provingKey)
+    with _proversLock:
+        if key not in _provers:
+            _provers[key] = ZokratesProver(working_directory, program, provingKey)
+        return _provers[key]
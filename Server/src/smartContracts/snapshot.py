@@ -0,0 +1,224 @@
+''' Snapshots of relay state: header store, proof index, cursors and contract info '''
+
+import os, io, json, time, shutil, tarfile, logging
+from hashlib import sha256
+
+from src.bitcoin import header_store
+from src.bitcoin.checkpoints import get_checkpoints_path, load_checkpoints
+from src.smartContracts import artifact_store
+
+SNAPSHOT_VERSION = 1
+# loose state files of smartContracts directory shared by all chains
+STATE_FILES = ['smartContractInfo', 'gasModel']
+# followed by chain id
+CURSOR_PREFIX = 'followerCursor'
+
+
+def get_source_directory():
+    """ Returns directory all snapshot paths are relative to """
+    return os.getcwd() + '/Server/src'
+
+
+def relative(path):
+    return os.path.relpath(path, get_source_directory())
+
+
+def header_paths(chainId):
+    """ Returns header and index file of chain """
+    directory = header_store.get_store_directory() + '/' + str(int(chainId))
+    return [directory + '.headers', directory + '.index']
+
+
+def get_cursor_path(chainId):
+    return get_source_directory() + '/smartContracts/' + CURSOR_PREFIX + str(int(chainId))
+
+
+def read_headers(chainId):
+    store = header_store.get_header_store(chainId)
+    headers, index = store.records()
+    return {relative(store.headersPath): headers, relative(store.indexPath): index}
+
+
+def encode_entries(entries):
+    return ''.join(json.dumps(entry) + '\n' for entry in entries).encode()
+
+
+def read_proofs(chains):
+    """ Returns compacted proof index of chains and proofs it references """
+    store = artifact_store.get_artifact_store()
+    entries = [entry for entry in store.entries() if entry['chainId'] in chains]
+    files = {relative(store.indexPath): encode_entries(entries)}
+    for key in set(entry['object'] for entry in entries):
+        with open(store.object_path(key), 'rb') as file:
+            files[relative(store.object_path(key))] = file.read()
+    return files
+
+
+def state_paths(chains):
+    """ Returns shared state files and cursors of chains present locally """
+    directory = get_source_directory() + '/smartContracts'
+    paths = [directory + '/' + name for name in STATE_FILES] + [get_cursor_path(chainId) for chainId in chains]
+    return [path for path in paths if os.path.exists(path)]
+
+
+def read_checkpoints(chains):
+    """ Returns checkpoints file with checkpoints of chains only """
+    checkpoints = load_checkpoints()
+    checkpoints = {chainId: checkpoint for chainId, checkpoint in checkpoints.items() if int(chainId) in chains}
+    if not checkpoints:
+        return {}
+    return {relative(get_checkpoints_path()): json.dumps(checkpoints).encode()}
+
+
+def read_state(chains):
+    files = {}
+    for path in state_paths(chains):
+        with open(path, 'rb') as file:
+            files[relative(path)] = file.read()
+    files.update(read_checkpoints(chains))
+    return files
+
+
+def stored_chains():
+    directory = header_store.get_store_directory()
+    if not os.path.isdir(directory):
+        return []
+    return sorted(int(name[:-len('.headers')]) for name in os.listdir(directory) if name.endswith('.headers'))
+
+
+def export_snapshot(path, chains=None):
+    """ Writes gzipped tar of relay state of chains with manifest of file hashes, returns manifest """
+    chains = stored_chains() if chains is None else sorted(set(int(chainId) for chainId in chains))
+    files = {}
+    for chainId in chains:
+        files.update(read_headers(chainId))
+    files.update(read_proofs(chains))
+    files.update(read_state(chains))
+    manifest = {
+        'version': SNAPSHOT_VERSION,
+        'created': time.time(),
+        'chains': chains,
+        'files': {name: sha256(data).hexdigest() for name, data in files.items()},
+    }
+
+    # snapshot appears under its name only when complete
+    temporary = path + '.tmp'
+    with tarfile.open(temporary, 'w:gz') as archive:
+        for name, data in [('manifest.json', json.dumps(manifest).encode())] + sorted(files.items()):
+            info = tarfile.TarInfo(name)
+            info.size = len(data)
+            info.mtime = int(manifest['created'])
+            archive.addfile(info, io.BytesIO(data))
+    os.replace(temporary, path)
+    logging.info('Exported ' + str(len(files)) + ' files to ' + path)
+    return manifest
+
+
+def read_snapshot(path):
+    """ Returns manifest and files of snapshot, raises ValueError if it is damaged """
+    files = {}
+    with tarfile.open(path, 'r:gz') as archive:
+        for member in archive.getmembers():
+            if not member.isfile() or member.name.startswith('/') or '..' in member.name.split('/'):
+                raise ValueError('Unexpected snapshot member ' + member.name)
+            files[member.name] = archive.extractfile(member).read()
+    manifest = json.loads(files.pop('manifest.json'))
+    if manifest['version'] != SNAPSHOT_VERSION:
+        raise ValueError('Unsupported snapshot version ' + str(manifest['version']))
+    if set(files) != set(manifest['files']):
+        raise ValueError('Snapshot files do not match manifest')
+    for name, data in files.items():
+        if sha256(data).hexdigest() != manifest['files'][name]:
+            raise ValueError('Snapshot file ' + name + ' is damaged')
+    return manifest, files
+
+
+def snapshot_chains(manifest):
+    """ Returns chains of snapshot, taken from header files of snapshots without chain list """
+    if 'chains' in manifest:
+        return [int(chainId) for chainId in manifest['chains']]
+    headers = relative(header_store.get_store_directory()) + '/'
+    return sorted(int(name[len(headers):-len('.headers')]) for name in manifest['files']
+                  if name.startswith(headers) and name.endswith('.headers'))
+
+
+def merge_files(chains, files):
+    """ Returns snapshot files with proof index and checkpoints of other local chains kept """
+    files = dict(files)
+    store = artifact_store.get_artifact_store()
+    index = relative(store.indexPath)
+    imported = [json.loads(line) for line in files.get(index, b'').decode().splitlines() if line]
+    files[index] = encode_entries([entry for entry in store.entries() if entry['chainId'] not in chains] +
+                                  [entry for entry in imported if entry['chainId'] in chains])
+
+    checkpointsName = relative(get_checkpoints_path())
+    checkpoints = {chainId: checkpoint for chainId, checkpoint in load_checkpoints().items()
+                   if int(chainId) not in chains}
+    if checkpointsName in files:
+        checkpoints.update(json.loads(files[checkpointsName]))
+    if checkpoints:
+        files[checkpointsName] = json.dumps(checkpoints).encode()
+    return files
+
+
+def replaced_paths(chains, files):
+    """ Returns paths replaced by snapshot, only files of its chains and shared state are touched """
+    # local files of snapshot chains missing in snapshot are removed too
+    paths = set(files) | set(relative(path) for path in state_paths(chains))
+    for chainId in chains:
+        paths.update(relative(path) for path in header_paths(chainId))
+    return sorted(paths)
+
+
+def import_snapshot(path):
+    """ Replaces local relay state of snapshot chains with snapshot
+
+    Snapshot is verified and unpacked next to current state first, then
+    current files are moved aside and staged ones renamed into place, any
+    failure moves the old state back. Headers, proofs, cursors and checkpoints
+    of other chains are kept. Relays, followers and servers using the state
+    have to be stopped, only stores of this process are reloaded.
+    """
+    manifest, files = read_snapshot(path)
+    chains = snapshot_chains(manifest)
+    files = merge_files(chains, files)
+    source = get_source_directory()
+    staging = source + '/.snapshot-import'
+    backup = source + '/.snapshot-backup'
+    shutil.rmtree(staging, ignore_errors=True)
+    shutil.rmtree(backup, ignore_errors=True)
+    for name, data in files.items():
+        os.makedirs(os.path.dirname(staging + '/' + name), exist_ok=True)
+        with open(staging + '/' + name, 'wb') as file:
+            file.write(data)
+
+    moved = []
+    try:
+        for name in replaced_paths(chains, files):
+            target = source + '/' + name
+            if os.path.exists(target):
+                os.makedirs(os.path.dirname(backup + '/' + name), exist_ok=True)
+                os.replace(target, backup + '/' + name)
+            moved.append(name)
+            if os.path.exists(staging + '/' + name):
+                os.makedirs(os.path.dirname(target), exist_ok=True)
+                os.replace(staging + '/' + name, target)
+    except Exception:
+        for name in reversed(moved):
+            target = source + '/' + name
+            if os.path.isdir(target):
+                shutil.rmtree(target)
+            elif os.path.exists(target):
+                os.remove(target)
+            if os.path.exists(backup + '/' + name):
+                os.replace(backup + '/' + name, target)
+        raise
+    finally:
+        shutil.rmtree(staging, ignore_errors=True)
+    shutil.rmtree(backup, ignore_errors=True)
+
+    # stores opened before import hold old state
+    header_store.reset_header_stores()
+    artifact_store.reset_artifact_store()
+    logging.info('Imported ' + str(len(files)) + ' files from ' + path)
+    return manifest
@@ -0,0 +1,248 @@
+''' Gas aware submission of proof batches '''
+
+import os, json, logging, threading, time
+from hashlib import sha256
+
+from src.utils.metrics import Histogram, GAS_BUCKETS, span
+from src.smartContracts.calldata import submit_calldata, calldata_gas, HEAD_GAS
+
+# maximal gas of single submitBatches transaction
+GAS_CAP = 8000000
+# gas limit is prediction increased by margin
+GAS_MARGIN = 1.2
+GAS_PRICE_MULTIPLIER = 2
+RECEIPT_POLL_INTERVAL = 2
+RECEIPT_TIMEOUT = 600
+
+gasPerHeader = Histogram('zk_gas_per_header', 'Gas used by submitBatches per relayed header', GAS_BUCKETS)
+confirmationSeconds = Histogram('zk_confirmation_seconds', 'Time from sending transaction to its receipt')
+_gasModelLock = threading.Lock()
+# contract address -> hash of its runtime code
+_codeHashes = {}
+
+
+def get_gas_model_path():
+    return os.getcwd() + '/Server/src/smartContracts/gasModel'
+
+
+def get_code_hash(w3, contractAddress):
+    """ Returns sha256 of deployed code, gas models are shared by deployments of the same code """
+    if contractAddress not in _codeHashes:
+        _codeHashes[contractAddress] = sha256(bytes(w3.eth.get_code(contractAddress))).hexdigest()
+    return _codeHashes[contractAddress]
+
+
+def load_gas_model(codeHash, batchSize):
+    """ Returns cached gas model of contract code or None """
+    try:
+        with open(get_gas_model_path(), 'r') as file:
+            return json.load(file).get(codeHash + ':' + str(batchSize))
+    except (OSError, ValueError):
+        return None
+
+
+def save_gas_model(codeHash, batchSize, model):
+    """ Caches gas model of contract code """
+    # followers of several chains share the file
+    with _gasModelLock:
+        try:
+            with open(get_gas_model_path(), 'r') as file:
+                models = json.load(file)
+        except (OSError, ValueError):
+            models = {}
+        models[codeHash + ':' + str(batchSize)] = model
+        with open(get_gas_model_path(), 'w') as file:
+            file.write(json.dumps(models))
+
+
+def calibrate_gas_model(w3, contractAddress, account, chainId, start, encodedProofs, batchSize):
+    """ Estimates fixed and per proof execution gas of submitBatches from chunks at chain head
+
+    Calldata gas is known exactly from encoded bytes, so it is taken out of
+    estimates and added back per transaction when planning.
+    """
+    def estimate(count):
+        data = submit_calldata(chainId, start, int(start) + count * batchSize, encodedProofs[:count])
+        return w3.eth.estimate_gas({'from': account.address, 'to': contractAddress, 'data': data}) - calldata_gas(data)
+
+    single = estimate(1)
+    if len(encodedProofs) < 2:
+        return {'base': 0, 'perProof': single}
+    double = estimate(2)
+    if len(encodedProofs) < 3:
+        perProof = max(double - single, 1)
+        return {'base': max(single - perProof, 0), 'perProof': perProof}
+    # single proof skips folded check, slope of batch path is measured from two and three proofs
+    perProof = max(estimate(3) - double, 1)
+    return {'base': max(double - 2 * perProof, single - perProof, 0), 'perProof': perProof}
+
+
+def predict_gas(model, count, data):
+    """ Returns execution gas of count proofs and gas of their calldata """
+    return model['base'] + model['perProof'] * count + calldata_gas(data)
+
+
+def plan_submissions(chainId, start, encodedProofs, batchSize, model, gasCap=GAS_CAP):
+    """ Packs consecutive proofs into fewest transactions under gas cap, offline
+
+    Returns chunks with signed-ready calldata and gas limit.
+    """
+    budget = gasCap / GAS_MARGIN
+    groups = [[]]
+    gas = model['base'] + HEAD_GAS
+    for encoded in encodedProofs:
+        cost = model['perProof'] + calldata_gas(bytes.fromhex(encoded))
+        if groups[-1] and gas + cost > budget:
+            groups.append([])
+            gas = model['base'] + HEAD_GAS
+        if gas + cost > budget:
+            raise ValueError('Single proof does not fit under gas cap of ' + str(gasCap))
+        groups[-1].append(encoded)
+        gas += cost
+
+    chunks = []
+    chunkStart = int(start)
+    for group in groups:
+        if not group:
+            continue
+        chunkEnd = chunkStart + len(group) * batchSize
+        data = submit_calldata(chainId, chunkStart, chunkEnd, group)
+        chunks.append({
+            'start': chunkStart,
+            'end': chunkEnd,
+            'proofs': len(group),
+            'data': data,
+            'gas': min(int(predict_gas(model, len(group), data) * GAS_MARGIN), gasCap),
+        })
+        chunkStart = chunkEnd
+    return chunks
+
+
+class Submitter:
+    """ Signs and sends transactions of one account with locally managed nonces """
+
+    def __init__(self, w3, account):
+        self.w3 = w3
+        self.account = account
+        self._lock = threading.Lock()
+        self._nonce = None
+        self._chainId = None
+        # transaction hash -> send time
+        self._sent = {}
+
+    def next_nonce(self):
+        """ Returns consecutive nonces starting at pending transaction count """
+        with self._lock:
+            if self._nonce is None:
+                self._nonce = self.w3.eth.getTransactionCount(self.account.address, 'pending')
+            nonce = self._nonce
+            self._nonce += 1
+            return nonce
+
+    def reset_nonce(self):
+        """ Drops local nonce after failed send so it is read from node again """
+        with self._lock:
+            self._nonce = None
+
+    def chain_id(self):
+        """ Returns ethereum chain id, read from node once """
+        with self._lock:
+            if self._chainId is None:
+                self._chainId = self.w3.eth.chain_id
+            return self._chainId
+
+    def send(self, function, gas, gasPrice):
+        """ Builds, signs and sends contract call, returns transaction hash """
+        return self.send_transaction(function.buildTransaction({
+            'from': self.account.address,
+            'nonce': self.next_nonce(),
+            'gas': gas,
+            'gasPrice': gasPrice,
+        }))
+
+    def send_data(self, to, data, gas, gasPrice):
+        """ Signs and sends precomputed calldata, returns transaction hash """
+        return self.send_transaction({
+            'to': to,
+            'data': data,
+            'value': 0,
+            'nonce': self.next_nonce(),
+            'gas': gas,
+            'gasPrice': gasPrice,
+            'chainId': self.chain_id(),
+        })
+
+    def send_transaction(self, transaction):
+        signed = self.account.signTransaction(transaction)
+        try:
+            txHash = self.w3.eth.send_raw_transaction(signed.rawTransaction)
+        except Exception:
+            self.reset_nonce()
+            raise
+        self._sent[txHash] = time.time()
+        return txHash
+
+    def wait_for_receipts(self, txHashes, timeout=RECEIPT_TIMEOUT):
+        """ Waits for all transactions at once, returns receipts in order """
+        receipts = {}
+        deadline = time.time() + timeout
+        while len(receipts) < len(txHashes):
+            for txHash in txHashes:
+                if txHash in receipts:
+                    continue
+                try:
+                    receipt = self.w3.eth.get_transaction_receipt(txHash)
+                except Exception:
+                    receipt = None
+                if receipt is not None:
+                    receipts[txHash] = receipt
+                    confirmationSeconds.observe(time.time() - self._sent.pop(txHash, time.time()))
+            if len(receipts) < len(txHashes):
+                if time.time() > deadline:
+                    raise TimeoutError(str(len(txHashes) - len(receipts)) + ' transactions not mined')
+                time.sleep(RECEIPT_POLL_INTERVAL)
+        return [receipts[txHash] for txHash in txHashes]
+
+
+def submit_proofs(submitter, contract, chainId, start, encodedProofs, batchSize, gasCap=GAS_CAP):
+    """ Submits ABI encoded proofs in gas capped transactions and waits for all of them
+
+    Returns list of submitted ranges with their receipts.
+    """
+    with span('submit', chainId, start, int(start) + len(encodedProofs) * batchSize) as trace:
+        results = send_proofs(submitter, contract, chainId, start, encodedProofs, batchSize, gasCap)
+        trace['ok'] = all(result['receipt']['status'] == 1 for result in results)
+    return results
+
+
+def send_proofs(submitter, contract, chainId, start, encodedProofs, batchSize, gasCap=GAS_CAP):
+    """ Sends planned transactions and collects receipts """
+    address = contract.address
+    codeHash = get_code_hash(submitter.w3, address)
+    model = load_gas_model(codeHash, batchSize)
+    if model is None:
+        model = calibrate_gas_model(submitter.w3, address, submitter.account, chainId, start, encodedProofs, batchSize)
+        save_gas_model(codeHash, batchSize, model)
+    logging.info('Gas model: ' + json.dumps(model))
+
+    chunks = plan_submissions(chainId, start, encodedProofs, batchSize, model, gasCap)
+    gasPrice = submitter.w3.eth.generate_gas_price() * GAS_PRICE_MULTIPLIER
+    logging.info('GasPrice: ' + str(gasPrice))
+    logging.info('Submitting ' + str(len(encodedProofs)) + ' proofs in ' + str(len(chunks)) + ' transactions')
+
+    txHashes = []
+    for chunk in chunks:
+        txHashes.append(submitter.send_data(address, chunk['data'], chunk['gas'], gasPrice))
+        logging.info('Transaction sent for: ' + str(chunk['start']) + ' to: ' + str(chunk['end']))
+
+    receipts = submitter.wait_for_receipts(txHashes)
+    results = []
+    for chunk, receipt in zip(chunks, receipts):
+        logging.info('Batches ' + str(chunk['start']) + ' to: ' + str(chunk['end']) + ' status: ' +
+                     str(receipt['status']) + ' gas used: ' + str(receipt['gasUsed']))
+        # ran out of gas, model is recalibrated on next submission
+        if receipt['status'] == 0 and receipt['gasUsed'] >= chunk['gas']:
+            save_gas_model(codeHash, batchSize, None)
+        gasPerHeader.observe(receipt['gasUsed'] / (chunk['end'] - chunk['start']))
+        results.append({'start': chunk['start'], 'end': chunk['end'], 'receipt': receipt})
+    return results
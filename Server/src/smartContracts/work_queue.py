@@ -0,0 +1,366 @@
+''' Proving work shared by coordinator and workers on several machines '''
+
+import os, hmac, json, logging, socket, sqlite3, tempfile, threading, time
+from hashlib import sha256
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import requests
+
+from src.bitcoin.bitcoin import get_zk_input
+from src.smartContracts.artifact_store import get_artifact_store, circuit_hash
+from src.smartContracts.circuits import DEFAULT_BATCH_SIZE, get_circuit_directory
+from src.smartContracts.proof_pipeline import get_windows, get_worker_count
+from src.smartContracts.prover import get_prover
+from src.smartContracts.zokrates_handler import create_proof_for_chain, is_proved
+
+# lease of window is lost when worker does not heartbeat for this long
+LEASE_SECONDS = 180
+HEARTBEAT_INTERVAL = 60
+# windows failing this many times are not handed out again
+MAX_ATTEMPTS = 3
+POLL_INTERVAL = 10
+REQUEST_TIMEOUT = 60
+COORDINATOR_PORT = 8765
+# other interfaces only with shared token, workers send it in TOKEN_HEADER
+COORDINATOR_HOST = '127.0.0.1'
+HOST_ENV = 'ZK_QUEUE_HOST'
+TOKEN_ENV = 'ZK_QUEUE_TOKEN'
+TOKEN_HEADER = 'X-Queue-Token'
+LOCAL_HOSTS = ['127.0.0.1', 'localhost', '::1']
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS windows (
+    chain_id INTEGER NOT NULL,
+    start_height INTEGER NOT NULL,
+    end_height INTEGER NOT NULL,
+    state TEXT NOT NULL,
+    worker TEXT,
+    lease_until REAL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (chain_id, start_height, end_height)
+);
+CREATE INDEX IF NOT EXISTS windows_state ON windows (state, chain_id, start_height);
+'''
+
+
+def get_queue_database_path():
+    return os.getcwd() + '/Server/src/smartContracts/queue.db'
+
+
+def to_window(row):
+    return {'chainId': row['chain_id'], 'start': row['start_height'], 'end': row['end_height']}
+
+
+class WorkQueue:
+    """ Durable queue of windows: pending -> leased -> done, expired leases return to pending """
+
+    def __init__(self, path=None):
+        self.database = sqlite3.connect(path or get_queue_database_path(), check_same_thread=False,
+                                        isolation_level=None)
+        self.database.row_factory = sqlite3.Row
+        self.database.execute('PRAGMA journal_mode=WAL')
+        self.database.executescript(SCHEMA)
+        self._lock = threading.Lock()
+
+    def _transaction(self, function):
+        with self._lock:
+            self.database.execute('BEGIN IMMEDIATE')
+            try:
+                result = function(self.database)
+            except Exception:
+                self.database.execute('ROLLBACK')
+                raise
+            self.database.execute('COMMIT')
+            return result
+
+    def enqueue(self, windows):
+        """ Queues (chainId, start, end) windows, finished ones are queued again, leased keep their lease """
+        self._transaction(lambda database: database.executemany(
+            "INSERT INTO windows (chain_id, start_height, end_height, state) VALUES (?, ?, ?, 'pending') "
+            "ON CONFLICT DO UPDATE SET state = 'pending', attempts = 0 WHERE state IN ('done', 'failed')",
+            [(int(chainId), int(start), int(end)) for chainId, start, end in windows]))
+
+    def claim(self, worker, count=1):
+        """ Leases up to count pending windows to worker """
+        def claim(database):
+            now = time.time()
+            expired = database.execute("UPDATE windows SET state = 'pending', worker = NULL "
+                                       "WHERE state = 'leased' AND lease_until < ?", (now,)).rowcount
+            if expired:
+                logging.warning('Reassigning ' + str(expired) + ' windows with expired lease')
+            rows = database.execute("SELECT * FROM windows WHERE state = 'pending' "
+                                    "ORDER BY chain_id, start_height LIMIT ?", (int(count),)).fetchall()
+            database.executemany("UPDATE windows SET state = 'leased', worker = ?, lease_until = ?, "
+                                 "attempts = attempts + 1 WHERE chain_id = ? AND start_height = ? AND end_height = ?",
+                                 [(worker, now + LEASE_SECONDS, row['chain_id'], row['start_height'], row['end_height'])
+                                  for row in rows])
+            return [to_window(row) for row in rows]
+        return self._transaction(claim)
+
+    def heartbeat(self, worker, windows):
+        """ Extends leases of windows still held by worker, returns them """
+        def heartbeat(database):
+            held = []
+            for window in windows:
+                if database.execute("UPDATE windows SET lease_until = ? WHERE chain_id = ? AND start_height = ? "
+                                    "AND end_height = ? AND state = 'leased' AND worker = ?",
+                                    (time.time() + LEASE_SECONDS, int(window['chainId']), int(window['start']),
+                                     int(window['end']), worker)).rowcount:
+                    held.append(window)
+            return held
+        return self._transaction(heartbeat)
+
+    def holds(self, worker, window):
+        """ Returns true if worker holds unexpired lease of window """
+        with self._lock:
+            row = self.database.execute("SELECT * FROM windows WHERE chain_id = ? AND start_height = ? "
+                                        "AND end_height = ? AND state = 'leased' AND worker = ?",
+                                        (int(window['chainId']), int(window['start']), int(window['end']),
+                                         worker)).fetchone()
+        return row is not None and row['lease_until'] >= time.time()
+
+    def finish(self, worker, window, ok):
+        """ Marks leased window done, failed one is retried until MAX_ATTEMPTS """
+        def finish(database):
+            key = (int(window['chainId']), int(window['start']), int(window['end']))
+            row = database.execute('SELECT * FROM windows WHERE chain_id = ? AND start_height = ? AND end_height = ?',
+                                   key).fetchone()
+            # lease expired and window went to someone else
+            if row is None or row['state'] != 'leased' or row['worker'] != worker:
+                return False
+            state = 'done' if ok else ('failed' if row['attempts'] >= MAX_ATTEMPTS else 'pending')
+            database.execute('UPDATE windows SET state = ?, worker = NULL, lease_until = NULL '
+                             'WHERE chain_id = ? AND start_height = ? AND end_height = ?', (state,) + key)
+            return True
+        return self._transaction(finish)
+
+    def status(self):
+        """ Returns number of windows in every state """
+        with self._lock:
+            counts = {row['state']: row['count'] for row in
+                      self.database.execute('SELECT state, COUNT(*) AS count FROM windows GROUP BY state')}
+        return {state: counts.get(state, 0) for state in ['pending', 'leased', 'done', 'failed']}
+
+    def failed(self):
+        with self._lock:
+            return [to_window(row) for row in
+                    self.database.execute("SELECT * FROM windows WHERE state = 'failed' "
+                                          "ORDER BY chain_id, start_height")]
+
+
+class Coordinator:
+    """ Hands out window leases over http and stores proofs uploaded by workers """
+
+    def __init__(self, queue=None, token=None):
+        self.queue = queue or WorkQueue()
+        self.token = token or os.environ.get(TOKEN_ENV)
+
+    def enqueue_range(self, chainId, start, end, batchSize=DEFAULT_BATCH_SIZE):
+        """ Queues windows of range not proved yet, returns their number """
+        windows = [window for window in get_windows(start, end, batchSize) if not is_proved(chainId, *window)]
+        self.queue.enqueue([(chainId,) + window for window in windows])
+        return len(windows)
+
+    def expected_input(self, chainId, start, end):
+        """ Returns hash of coordinator's own zokrates input of window and public inputs its proof must have """
+        input = get_zk_input(chainId, start, end)
+        if not isinstance(input, str):
+            raise ValueError('Failed to create input for: ' + str(start) + ' to: ' + str(end))
+        input = input.strip('\"')
+        values = [int(value) for value in input.split()]
+        # first header, last header hash and parent hash are public, circuit returns true
+        return sha256(input.encode()).hexdigest(), values[:5] + values[-2:] + [1]
+
+    def store(self, upload):
+        """ Adds uploaded proof to artifact store if it proves coordinator's headers with its circuit """
+        window = upload['window']
+        chainId, start, end = window['chainId'], int(window['start']), int(window['end'])
+        if not self.queue.holds(upload['worker'], window):
+            raise ValueError('Window is not leased to ' + str(upload['worker']))
+        directory = get_circuit_directory(end - start)
+        circuit = circuit_hash(directory)
+        if circuit is None or upload['circuit'] != circuit:
+            raise ValueError('Proof made by different circuit')
+        headers, inputs = self.expected_input(chainId, start, end)
+        if upload['headers'] != headers:
+            raise ValueError('Proof made from different headers')
+        if [int(value, 16) for value in upload['proof']['inputs']] != inputs:
+            raise ValueError('Public inputs of proof do not match headers')
+        # artifact store takes ownership of proof file
+        descriptor, path = tempfile.mkstemp(dir=get_artifact_store().directory, suffix='.upload')
+        with os.fdopen(descriptor, 'w') as file:
+            file.write(json.dumps(upload['proof']))
+        if not get_prover(directory).verify(path):
+            os.remove(path)
+            raise ValueError('Proof does not verify')
+        get_artifact_store().add(chainId, start, end, circuit, headers, path)
+
+    def handle(self, path, body):
+        """ Returns reply of api call """
+        if path == '/claim':
+            windows = self.queue.claim(body['worker'], body.get('count', 1))
+            status = self.queue.status()
+            return {'windows': windows, 'drained': status['pending'] == 0 and status['leased'] == 0}
+        if path == '/heartbeat':
+            return {'windows': self.queue.heartbeat(body['worker'], body['windows'])}
+        if path == '/complete':
+            self.store(body)
+            return {'accepted': self.queue.finish(body['worker'], body['window'], True)}
+        if path == '/fail':
+            return {'accepted': self.queue.finish(body['worker'], body['window'], False)}
+        if path == '/status':
+            return self.queue.status()
+        return None
+
+    def serve(self, port=COORDINATOR_PORT, host=None):
+        host = host or os.environ.get(HOST_ENV, COORDINATOR_HOST)
+        if host not in LOCAL_HOSTS and not self.token:
+            raise ValueError('Serving on ' + host + ' needs shared token in ' + TOKEN_ENV)
+        coordinator = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def reply(self, code, data):
+                data = json.dumps(data).encode()
+                self.send_response(code)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def do_GET(self):
+                self.do_POST()
+
+            def do_POST(self):
+                token = self.headers.get(TOKEN_HEADER) or ''
+                if coordinator.token and not hmac.compare_digest(token.encode(), coordinator.token.encode()):
+                    self.reply(403, {'error': 'Invalid token'})
+                    return
+                try:
+                    length = int(self.headers.get('Content-Length') or 0)
+                    body = json.loads(self.rfile.read(length)) if length else {}
+                    result = coordinator.handle(self.path, body)
+                    self.reply(404 if result is None else 200, result or {'error': 'Unknown call'})
+                except Exception as err:
+                    logging.error("Error '{0}' occurred.".format(err))
+                    self.reply(400, {'error': str(err)})
+
+        server = ThreadingHTTPServer((host, int(port)), Handler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        logging.info('Coordinating provers on ' + host + ':' + str(port))
+        return server
+
+    def run(self, port=COORDINATOR_PORT):
+        """ Serves leases until every queued window is done or failed """
+        server = self.serve(port)
+        try:
+            while True:
+                status = self.queue.status()
+                logging.info('Windows ' + json.dumps(status))
+                if status['pending'] == 0 and status['leased'] == 0:
+                    # idle workers learn queue is drained on their next claim
+                    time.sleep(POLL_INTERVAL)
+                    return dict(status, failed=self.queue.failed())
+                time.sleep(POLL_INTERVAL)
+        finally:
+            server.shutdown()
+
+
+class ProofWorker:
+    """ Claims windows from coordinator, proves them locally and uploads proofs """
+
+    def __init__(self, url, workers=None, name=None, token=None):
+        self.url = url.rstrip('/')
+        self.token = token or os.environ.get(TOKEN_ENV)
+        self.workers = workers or get_worker_count()
+        self.name = name or socket.gethostname() + ':' + str(os.getpid())
+        self.session = requests.Session()
+        self._lock = threading.Lock()
+        self._held = []
+        self._stopped = threading.Event()
+
+    def call(self, path, body=None):
+        headers = {'Content-Type': 'application/json'}
+        if self.token:
+            headers[TOKEN_HEADER] = self.token
+        response = self.session.post(self.url + path, data=json.dumps(body or {}), timeout=REQUEST_TIMEOUT,
+                                     headers=headers)
+        response.raise_for_status()
+        return response.json()
+
+    def _heartbeat(self):
+        while not self._stopped.wait(HEARTBEAT_INTERVAL):
+            with self._lock:
+                held = list(self._held)
+            if not held:
+                continue
+            try:
+                kept = self.call('/heartbeat', {'worker': self.name, 'windows': held})['windows']
+                if len(kept) < len(held):
+                    logging.warning('Lost lease of ' + str(len(held) - len(kept)) + ' windows')
+            except Exception as err:
+                logging.error("Error '{0}' occurred.".format(err))
+
+    def prove(self, window):
+        """ Proves window and uploads its proof, returns True on success """
+        chainId, start, end = window['chainId'], window['start'], window['end']
+        if not create_proof_for_chain(chainId, start, end):
+            return False
+        entry = get_artifact_store().lookup(chainId, start, end)
+        # dropped meanwhile, e.g. by reorg
+        if entry is None:
+            logging.error('No stored proof for: ' + str(start) + ' to: ' + str(end))
+            return False
+        with open(get_artifact_store().object_path(entry['object']), 'r') as file:
+            proof = json.load(file)
+        return self.call('/complete', {'worker': self.name, 'window': window, 'circuit': entry['circuit'],
+                                       'headers': entry['headers'], 'proof': proof})['accepted']
+
+    def _work(self):
+        """ Claims and proves windows one by one until queue is drained """
+        reached = time.time()
+        while True:
+            try:
+                reply = self.call('/claim', {'worker': self.name, 'count': 1})
+                reached = time.time()
+            except Exception as err:
+                logging.error("Error '{0}' occurred.".format(err))
+                # coordinator finished or is gone, its leases would be lost anyway
+                if time.time() - reached > LEASE_SECONDS:
+                    return
+                time.sleep(POLL_INTERVAL)
+                continue
+            windows = reply['windows']
+            if not windows:
+                if reply['drained']:
+                    return
+                # other workers still hold leases that may expire
+                time.sleep(POLL_INTERVAL)
+                continue
+            window = windows[0]
+            with self._lock:
+                self._held.append(window)
+            try:
+                ok = self.prove(window)
+                if not ok:
+                    self.call('/fail', {'worker': self.name, 'window': window})
+                logging.info('Window ' + str(window['start']) + ' to ' + str(window['end']) +
+                             (' uploaded' if ok else ' failed'))
+            except Exception as err:
+                # lease expires and window is handed out again
+                logging.error("Error '{0}' occurred.".format(err))
+            finally:
+                with self._lock:
+                    self._held.remove(window)
+
+    def run(self):
+        logging.info('Worker ' + self.name + ' proving with ' + str(self.workers) + ' provers')
+        threading.Thread(target=self._heartbeat, daemon=True).start()
+        try:
+            with ThreadPoolExecutor(self.workers) as pool:
+                for future in [pool.submit(self._work) for _ in range(self.workers)]:
+                    future.result()
+        finally:
+            self._stopped.set()
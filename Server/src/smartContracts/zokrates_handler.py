@@ -1,35 +1,50 @@
 ''' Zokrates handling '''
 
-import subprocess, os, logging, json
+import subprocess, os, logging, json, re, shutil
 from src.bitcoin.bitcoin import get_zk_input
+from src.smartContracts.artifact_store import get_artifact_store, circuit_hash, file_hash
+from src.smartContracts.prover import ensure_zokrates, get_prover
+from src.smartContracts.circuits import DEFAULT_BATCH_SIZE, get_circuit_directory, get_circuit_source, is_compiled
 from src.utils import *
 
+windowsProved = Counter('zk_windows_total', 'Windows with stored proof by origin')
+
 
 def init_zokrates(working_directory):
     """ Install and init zokrates if missing """
-    os.environ['PATH'] = os.environ['PATH']+':'+os.environ['HOME']+'/.zokrates/bin'
-    os.environ['ZOKRATES_HOME'] = os.environ['HOME']+'/.zokrates/stdlib'
-    if(subprocess.run('zokrates --version', shell=True, cwd=working_directory, capture_output=True).returncode != 0):
-        # get zokrates
-        subprocess.run('curl -LSfs get.zokrat.es | sh', shell=True, cwd=working_directory)
-        
-def compile_validator():
-    """ Compile validator """
-    working_directory =  os.getcwd() + '/Server/src/smartContracts/zokrates'
+    ensure_zokrates(working_directory)
+
+def compile_validator(batchSize=DEFAULT_BATCH_SIZE):
+    """ Compile validator for batches of batchSize headers """
+    working_directory = get_circuit_directory(batchSize)
     try:
+        os.makedirs(working_directory, exist_ok=True)
         init_zokrates(working_directory)
 
         # compile contract
-        subprocess.run('zokrates compile -i btcValidation.zok', shell=True, cwd=working_directory)
+        result = subprocess.run('zokrates compile -i ' + get_circuit_source(batchSize), shell=True,
+                                cwd=working_directory, capture_output=True, text=True)
+        logging.info(result.stdout)
+        if result.returncode != 0:
+            logging.error(result.stderr)
+            return False
+        constraints = re.search(r'Number of constraints: (\d+)', result.stdout)
+        with open(working_directory + '/info.json', 'w') as file:
+            file.write(json.dumps({
+                'batchSize': int(batchSize),
+                'constraints': int(constraints.group(1)) if constraints else None,
+            }))
         logging.info('Compilation finished')
         # setup zksanrks (!warning this produces toxic waste!)
-        subprocess.run('zokrates setup', shell=True, cwd=working_directory)
+        if subprocess.run('zokrates setup', shell=True, cwd=working_directory).returncode != 0:
+            return discard_keys(working_directory, 'Setup failed')
         logging.info('Setup finished')
         # # create smart contract 
-        subprocess.run('zokrates export-verifier', shell=True, cwd=working_directory)
+        if subprocess.run('zokrates export-verifier', shell=True, cwd=working_directory).returncode != 0:
+            return discard_keys(working_directory, 'Verifier export failed')
         logging.info('Verifier exported')
         # # update contract
-        subprocess.run('cp verifier.sol ../contracts/verifier.sol', shell=True, cwd=working_directory)
+        update_verifier(batchSize)
         logging.info('Updated verifier')
 
         return True
@@ -37,54 +52,122 @@ def compile_validator():
         logging.error("Error '{0}' occurred.".format(err))
         return False
 
-def compute_proof(chainId, start, end):
-    """ compute proof """
-    working_directory =  os.getcwd() + '/Server/src/smartContracts/zokrates'
+def discard_keys(working_directory, message):
+    """ Removes keys of failed setup so circuit is not taken for compiled, returns False """
+    logging.error(message)
+    for name in ['proving.key', 'verification.key', 'verifier.sol']:
+        if os.path.exists(working_directory + '/' + name):
+            os.remove(working_directory + '/' + name)
+    return False
+
+def update_verifier(batchSize=DEFAULT_BATCH_SIZE):
+    """ Use verifier of batch size circuit in contracts """
+    shutil.copyfile(get_circuit_directory(batchSize) + '/verifier.sol',
+                    os.getcwd() + '/Server/src/smartContracts/contracts/verifier.sol')
+
+def get_working_directory():
+    """ Returns zokrates working directory """
+    return os.getcwd() + '/Server/src/smartContracts/zokrates'
+
+def get_artifact_path(kind, chainId, start, end):
+    """ Returns path of window artifact (zokrates, witenss, proof) """
+    # separators keep e.g. chain 1 23-55 and chain 12 3-55 apart
+    return get_working_directory() + '/' + kind + str(chainId) + '-' + str(start) + '-' + str(end)
+
+def create_input(chainId, start, end):
+    """ fetch headers and write zokrates input for window """
+    with span('input', chainId, start, end) as trace:
+        input = get_zk_input(chainId, start, end)
+        trace['ok'] = isinstance(input, str)
+    if not isinstance(input, str):
+        logging.error('Failed to create input for: ' + str(start) + ' to: ' + str(end))
+        return False
+    # output file is called by its cahin and boundaries
+    with open(get_artifact_path('zokrates', chainId, start, end), 'w') as file:
+        file.write(input.strip('\"'))
+    logging.info('Input generated')
+    return True
+
+def compute_witness(chainId, start, end):
+    """ compute witness from window input """
     try:
-        init_zokrates(working_directory)
-        logging.info('Zokratres initiated')
-        start = str(start)
-        end = str(end)
-        inputPath = working_directory + '/zokrates'+chainId+start+end
-        witenessPath = working_directory + '/witenss' +chainId+start+end
-        proofPath = working_directory + '/proof' +chainId+start+end
-        with open(inputPath, 'r') as file:
+        with open(get_artifact_path('zokrates', chainId, start, end), 'r') as file:
             data = file.read().rstrip()
-            subprocess.run('zokrates compute-witness -a ' + data + ' -o ' + witenessPath, shell=True, cwd=working_directory)
-            logging.info('Witness created')
-            subprocess.run('zokrates generate-proof -j '+ proofPath + ' -w ' + witenessPath , shell=True, cwd=working_directory)
-            logging.info('Proof created')
+        with span('witness', chainId, start, end) as trace:
+            trace['ok'] = get_prover(get_circuit_directory(int(end) - int(start))).compute_witness(
+                data, get_artifact_path('witenss', chainId, start, end))
+        if not trace['ok']:
+            logging.error('Witness computation failed for: ' + str(start) + ' to: ' + str(end))
+            return False
+        logging.info('Witness created')
         return True
     except Exception as err:
         logging.error("Error '{0}' occurred.".format(err))
         return False
 
+def generate_proof(chainId, start, end):
+    """ generate proof from window witness """
+    try:
+        with span('proof', chainId, start, end) as trace:
+            trace['ok'] = get_prover(get_circuit_directory(int(end) - int(start))).generate_proof(
+                get_artifact_path('witenss', chainId, start, end), get_artifact_path('proof', chainId, start, end))
+        if not trace['ok']:
+            logging.error('Proof generation failed for: ' + str(start) + ' to: ' + str(end))
+            return False
+        logging.info('Proof created')
+        return True
+    except Exception as err:
+        logging.error("Error '{0}' occurred.".format(err))
+        return False
+
+def compute_proof(chainId, start, end):
+    """ compute proof """
+    return compute_witness(chainId, start, end) and generate_proof(chainId, start, end)
+
+def reuse_proof(chainId, start, end):
+    """ Links window to proof of identical input if there is one """
+    circuit = circuit_hash(get_circuit_directory(int(end) - int(start)))
+    if circuit is None:
+        return False
+    inputPath = get_artifact_path('zokrates', chainId, start, end)
+    if get_artifact_store().reuse(chainId, start, end, circuit, file_hash(inputPath)) is None:
+        return False
+    os.remove(inputPath)
+    windowsProved.inc(result='reused')
+    logging.info('Reused proof for: ' + str(start) + ' to: ' + str(end))
+    return True
+
+def export_proof(chainId, start, end):
+    """ Move proof to artifact store and dispose of window files """
+    inputPath = get_artifact_path('zokrates', chainId, start, end)
+    get_artifact_store().add(chainId, start, end, circuit_hash(get_circuit_directory(int(end) - int(start))), file_hash(inputPath),
+        get_artifact_path('proof', chainId, start, end), get_artifact_path('witenss', chainId, start, end))
+    os.remove(inputPath)
+    windowsProved.inc(result='proved')
+    return True
+
+def is_proved(chainId, start, end):
+    """ Returns true if window has proof made by current circuit """
+    circuit = circuit_hash(get_circuit_directory(int(end) - int(start)))
+    return circuit is not None and get_artifact_store().lookup(chainId, start, end, circuit) is not None
+
 def create_proof_for_chain(chainId, start, end):
     """ compute proof """
-    start = str(start)
-    end = str(end)
+    with span('window', chainId, start, end) as trace:
+        trace['ok'] = prove_window(chainId, str(start), str(end))
+    return trace['ok']
 
-    if( int(end) != int(start) + 32):
-        logging.info('Gap between start and end needs to be 32')
+def prove_window(chainId, start, end):
+    """ compute proof of single window """
+    if not is_compiled(int(end) - int(start)):
+        logging.info('No compiled circuit for batches of ' + str(int(end) - int(start)) + ' headers')
         return False
-    working_directory =  os.getcwd() + '/Server/src/smartContracts/zokrates'
 
-    input = get_zk_input(chainId, start, end).strip('\"')
-    # output file is called by its cahin and boundaries
-    with open(os.getcwd()+'/Server/src/smartContracts/zokrates/zokrates'+chainId+start+end, 'w') as file:
-        file.write(input)
-    logging.info('Input generated')
-    # write proof to solidity input file
+    if not create_input(chainId, start, end):
+        return False
+    if reuse_proof(chainId, start, end):
+        return True
+    # store proof in solidity acceptable format
     if(compute_proof(chainId, start, end)):
-        # transfer proof to solidity acceptable format
-        with open(working_directory + '/proof'+chainId+start+end, 'r') as input:
-            with open(working_directory + '/solidity'+chainId+start+end, 'w') as file:
-                data = json.load(input)
-                result = {'start': int(start), 'end':int(end)}
-                result['proof'] = {}
-                result['proof']['a'] = castStrListToHex(data["proof"]["a"])
-                result['proof']['b'] = castNestedStrListToHex(data["proof"]["b"])
-                result['proof']['c'] = castStrListToHex(data["proof"]["c"])
-                result['proof']['inputs'] = castStrListToHex(data["inputs"])
-                file.write(json.dumps(result))
-                return True
\ No newline at end of file
+        return export_proof(chainId, start, end)
+    return False
@@ -1 +1,4 @@
 from src.utils.utils import *
+from src.utils.cache import *
+from src.utils.metrics import *
+from src.utils.rate_limit import *
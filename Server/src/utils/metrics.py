@@ -0,0 +1,213 @@
+""" Process metrics in prometheus text format and per window trace spans """
+
+import os, json, logging, threading, time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# seconds, from single rpc call to minutes long proofs
+TIME_BUCKETS = (0.01, 0.05, 0.1, 0.5, 1, 5, 10, 30, 60, 300, 900, 3600)
+SIZE_BUCKETS = (1, 2, 5, 10, 50, 100, 500, 1000)
+BYTE_BUCKETS = tuple(2**power for power in range(24, 37, 2))
+GAS_BUCKETS = (1000, 2000, 5000, 10000, 20000, 50000, 100000, 500000)
+
+# seconds between dumps of process metrics into shared directory
+DUMP_INTERVAL = 5
+
+_registry = []
+_registryLock = threading.Lock()
+# directory where processes of one server dump metrics merged on scrape
+_dumpDirectory = None
+traceLogger = logging.getLogger('trace')
+
+
+def label_key(labels):
+    return tuple(sorted(labels.items()))
+
+
+def format_labels(key, extra=()):
+    pairs = list(key) + list(extra)
+    if not pairs:
+        return ''
+    return '{' + ','.join(name + '="' + str(value).replace('"', '\\"') + '"' for name, value in pairs) + '}'
+
+
+class Counter:
+    """ Monotonic counter per label set """
+    kind = 'counter'
+
+    def __init__(self, name, help):
+        self.name = name
+        self.help = help
+        self._values = {}
+        self._lock = threading.Lock()
+        register(self)
+
+    def inc(self, amount=1, **labels):
+        key = label_key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def samples(self):
+        with self._lock:
+            return [(self.name, key, (), value) for key, value in self._values.items()]
+
+
+class Histogram:
+    """ Cumulative bucket histogram per label set """
+    kind = 'histogram'
+
+    def __init__(self, name, help, buckets=TIME_BUCKETS):
+        self.name = name
+        self.help = help
+        self.buckets = tuple(buckets)
+        self._values = {}
+        self._lock = threading.Lock()
+        register(self)
+
+    def observe(self, value, **labels):
+        key = label_key(labels)
+        with self._lock:
+            counts, total = self._values.get(key, ([0] * (len(self.buckets) + 1), 0))
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+            counts[-1] += 1
+            self._values[key] = (counts, total + value)
+
+    @contextmanager
+    def time(self, **labels):
+        begin = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - begin, **labels)
+
+    def samples(self):
+        samples = []
+        with self._lock:
+            for key, (counts, total) in self._values.items():
+                for bound, count in zip(self.buckets, counts):
+                    samples.append((self.name + '_bucket', key, (('le', bound),), count))
+                samples.append((self.name + '_bucket', key, (('le', '+Inf'),), counts[-1]))
+                samples.append((self.name + '_count', key, (), counts[-1]))
+                samples.append((self.name + '_sum', key, (), total))
+        return samples
+
+
+def register(metric):
+    with _registryLock:
+        _registry.append(metric)
+
+
+def dump_metrics():
+    """ Atomically writes samples of this process to dump directory """
+    with _registryLock:
+        metrics = list(_registry)
+    samples = {metric.name: metric.samples() for metric in metrics}
+    path = _dumpDirectory + '/' + str(os.getpid()) + '.json'
+    with open(path + '.tmp', 'w') as file:
+        file.write(json.dumps(samples))
+    os.replace(path + '.tmp', path)
+
+
+def merged_samples():
+    """ Returns metric name -> samples summed over dumps of all processes """
+    merged = {}
+    for name in os.listdir(_dumpDirectory):
+        if not name.endswith('.json'):
+            continue
+        try:
+            with open(_dumpDirectory + '/' + name, 'r') as file:
+                dump = json.load(file)
+        except (OSError, ValueError):
+            continue
+        for metricName, samples in dump.items():
+            values = merged.setdefault(metricName, {})
+            for sample, key, extra, value in samples:
+                # counters and histograms only, so samples add up
+                sampleKey = (sample, tuple(map(tuple, key)), tuple(map(tuple, extra)))
+                values[sampleKey] = values.get(sampleKey, 0) + value
+    return {metricName: [key + (value,) for key, value in values.items()] for metricName, values in merged.items()}
+
+
+def start_metrics_dump(directory):
+    """ Dumps metrics of this process periodically, scrape of any process then covers all of them
+
+    Used by gunicorn workers, each of them has its own registry. Dumps of
+    exited workers are kept so counters do not go backwards.
+    """
+    global _dumpDirectory
+    _dumpDirectory = directory
+
+    def dump():
+        while True:
+            try:
+                dump_metrics()
+            except OSError as err:
+                logging.error("Error '{0}' occurred.".format(err))
+            time.sleep(DUMP_INTERVAL)
+
+    threading.Thread(target=dump, daemon=True).start()
+
+
+def render_metrics():
+    """ Returns all metrics of process, or of all dumping processes, in prometheus text format """
+    lines = []
+    with _registryLock:
+        metrics = list(_registry)
+    merged = None
+    if _dumpDirectory is not None:
+        dump_metrics()
+        merged = merged_samples()
+    for metric in metrics:
+        lines.append('# HELP ' + metric.name + ' ' + metric.help)
+        lines.append('# TYPE ' + metric.name + ' ' + metric.kind)
+        samples = metric.samples() if merged is None else merged.get(metric.name, [])
+        for name, key, extra, value in samples:
+            lines.append(name + format_labels(key, extra) + ' ' + str(value))
+    return '\n'.join(lines) + '\n'
+
+
+def start_metrics_server(port):
+    """ Serves /metrics of long running process on port """
+    class Handler(BaseHTTPRequestHandler):
+        def log_message(self, *args):
+            pass
+
+        def do_GET(self):
+            data = render_metrics().encode()
+            self.send_response(200 if self.path == '/metrics' else 404)
+            self.send_header('Content-Type', 'text/plain; version=0.0.4')
+            self.send_header('Content-Length', str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+    server = ThreadingHTTPServer(('0.0.0.0', int(port)), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    logging.info('Serving metrics on port ' + str(port))
+    return server
+
+
+stageSeconds = Histogram('zk_stage_seconds', 'Duration of window stages')
+stageFailures = Counter('zk_stage_failures_total', 'Failed window stages')
+
+
+@contextmanager
+def span(stage, chainId, start, end):
+    """ Times stage of window range, all stages of window share its trace id
+
+    Yields attributes of span, setting `ok` to False marks stage as failed.
+    """
+    attributes = {'trace': str(chainId) + ':' + str(start) + ':' + str(end), 'span': stage, 'ok': True}
+    begin = time.perf_counter()
+    try:
+        yield attributes
+    except Exception:
+        attributes['ok'] = False
+        raise
+    finally:
+        attributes['seconds'] = round(time.perf_counter() - begin, 6)
+        stageSeconds.observe(attributes['seconds'], stage=stage)
+        if not attributes['ok']:
+            stageFailures.inc(stage=stage)
+        traceLogger.debug(json.dumps(attributes))
@@ -0,0 +1,76 @@
+""" Request rate limiting and fair sharing of scarce slots """
+
+import threading, time
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+
+
+class TokenBucket:
+    """ Thread safe token bucket refilled at rate tokens per second up to burst """
+    def __init__(self, rate, burst):
+        self.rate = float(rate)
+        self.burst = float(burst)
+        self._tokens = float(burst)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self, tokens=1):
+        """ Blocks until tokens are available, requests larger than burst go into debt """
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                needed = min(tokens, self.burst)
+                if self._tokens >= needed:
+                    self._tokens -= tokens
+                    return
+                wait = (needed - self._tokens) / self.rate
+            time.sleep(wait)
+
+
+class RateLimiter:
+    """ Token bucket with cap on concurrent requests """
+    def __init__(self, rate, burst, concurrency):
+        self.bucket = TokenBucket(rate, burst)
+        self._slots = threading.BoundedSemaphore(concurrency)
+
+    @contextmanager
+    def limit(self, tokens=1):
+        with self._slots:
+            self.bucket.acquire(tokens)
+            yield
+
+
+class FairScheduler:
+    """ Shares slots between owners round robin, owner waiting longest for its turn goes first """
+    def __init__(self, slots):
+        self.free = int(slots)
+        # owner -> queue of waiting events
+        self._waiting = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _grant(self):
+        while self.free and self._waiting:
+            owner, waiters = next(iter(self._waiting.items()))
+            waiters.popleft().set()
+            self.free -= 1
+            # owner goes to back of the line
+            del self._waiting[owner]
+            if waiters:
+                self._waiting[owner] = waiters
+
+    @contextmanager
+    def slot(self, owner):
+        """ Holds one slot on behalf of owner """
+        event = threading.Event()
+        with self._lock:
+            self._waiting.setdefault(owner, deque()).append(event)
+            self._grant()
+        event.wait()
+        try:
+            yield
+        finally:
+            with self._lock:
+                self.free += 1
+                self._grant()
@@ -0,0 +1,53 @@
+''' Header store shared by several processes '''
+
+import os
+import multiprocessing
+
+from benchmarks.stub_rpc import synthetic_chain
+from src.bitcoin.header_store import HeaderStore, HEADER_SIZE
+
+CHAIN_LENGTH = 120
+
+
+def put_range(directory, begining, end, step):
+    """ Stores headers of range in chunks from other process """
+    chain = synthetic_chain(CHAIN_LENGTH)
+    store = HeaderStore(0, directory)
+    for height in range(begining, end, step):
+        store.put(zip(range(height, min(height + step, end)), chain[height:min(height + step, end)]))
+
+
+def run_processes(*arguments):
+    context = multiprocessing.get_context('spawn')
+    processes = [context.Process(target=put_range, args=argument) for argument in arguments]
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join()
+        assert process.exitcode == 0
+
+
+def test_interleaved_processes(tmp_path):
+    directory = str(tmp_path)
+    chain = synthetic_chain(CHAIN_LENGTH)
+    store = HeaderStore(0, directory)
+    store.put(zip(range(0, 10), chain[0:10]))
+    run_processes((directory, 20, 30, 10))
+    store.put(zip(range(10, 20), chain[10:20]))
+
+    assert store.get(10, 20) == chain[10:20]
+    assert store.get(0, 30) == chain[:30]
+    assert HeaderStore(0, directory).get(0, 30) == chain[:30]
+
+
+def test_concurrent_appends(tmp_path):
+    directory = str(tmp_path)
+    chain = synthetic_chain(CHAIN_LENGTH)
+    run_processes((directory, 0, CHAIN_LENGTH, 3), (directory, 0, CHAIN_LENGTH, 7),
+                  (directory, 40, CHAIN_LENGTH, 5))
+
+    store = HeaderStore(0, directory)
+    assert store.get(0, CHAIN_LENGTH) == chain
+    # every header is stored once
+    assert len(store) == CHAIN_LENGTH
+    assert os.path.getsize(store.headersPath) == CHAIN_LENGTH * HEADER_SIZE
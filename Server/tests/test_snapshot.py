@@ -0,0 +1,61 @@
+''' Snapshot of some chains next to others '''
+
+import json
+import os
+
+import pytest
+
+from benchmarks.stub_rpc import synthetic_chain
+from src.bitcoin import header_store
+from src.bitcoin.checkpoints import load_checkpoints, save_checkpoint
+from src.smartContracts import artifact_store
+from src.smartContracts.snapshot import export_snapshot, get_cursor_path, import_snapshot, read_snapshot
+
+PROOF = {'proof': {'a': ['0x1', '0x2'], 'b': [['0x3', '0x4'], ['0x5', '0x6']], 'c': ['0x7', '0x8']},
+         'inputs': ['0x' + str(value) for value in range(8)]}
+
+
+@pytest.fixture
+def relay(tmp_path, monkeypatch):
+    """ Relay state of chains 0 and 2 in temporary working directory """
+    monkeypatch.chdir(tmp_path)
+    os.makedirs('Server/src/smartContracts/zokrates')
+    header_store.reset_header_stores()
+    artifact_store.reset_artifact_store()
+    chains = {0: synthetic_chain(30), 2: synthetic_chain(20, branch=2)}
+    for chainId, chain in chains.items():
+        header_store.get_header_store(chainId).put(enumerate(chain))
+        proofPath = str(tmp_path) + '/proof' + str(chainId)
+        with open(proofPath, 'w') as file:
+            json.dump(PROOF, file)
+        artifact_store.get_artifact_store().add(chainId, 1, 17, 'circuit', 'headers' + str(chainId), proofPath)
+        with open(get_cursor_path(chainId), 'w') as file:
+            json.dump({'start': 1, 'proved': 17, 'submitted': 1}, file)
+        save_checkpoint(chainId, {'height': 0, 'hash': header_store.header_hash(chain[0]), 'work': 1})
+    yield chains
+    header_store.reset_header_stores()
+    artifact_store.reset_artifact_store()
+
+
+def test_snapshot_of_one_chain(relay, tmp_path):
+    path = str(tmp_path) + '/snapshot.tar.gz'
+    manifest = export_snapshot(path, [0])
+    assert manifest['chains'] == [0]
+    _, files = read_snapshot(path)
+    assert not any(name.endswith(('2.headers', '2.index', 'followerCursor2')) for name in files)
+    index = [json.loads(line) for line in files['smartContracts/zokrates/proofs/index.jsonl'].decode().splitlines()]
+    assert [entry['chainId'] for entry in index] == [0]
+
+    # chain 0 moves on after export
+    header_store.get_header_store(0).put(enumerate(synthetic_chain(40)))
+    artifact_store.get_artifact_store().remove(0, 1, 17)
+    os.remove(get_cursor_path(0))
+
+    import_snapshot(path)
+    assert header_store.get_header_store(0).get(0, 30) == relay[0]
+    assert header_store.get_header_store(0).tip()[0] == 29
+    assert header_store.get_header_store(2).get(0, 20) == relay[2]
+    store = artifact_store.get_artifact_store()
+    assert store.lookup(0, 1, 17) is not None and store.lookup(2, 1, 17) is not None
+    assert os.path.exists(get_cursor_path(0)) and os.path.exists(get_cursor_path(2))
+    assert sorted(load_checkpoints()) == ['0', '2']
@@ -1,4 +1,5 @@
-from src.app import app
+from src.app import app, start_block_watcher
 
 if __name__ == "__main__":
+    start_block_watcher()
     app.run(use_reloader=True, debug=True)
\ No newline at end of file